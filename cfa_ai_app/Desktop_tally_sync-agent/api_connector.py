@@ -2,13 +2,40 @@ import requests
 import os
 import sys
 import json
+import gzip
+import uuid
+import hashlib
 import datetime
-from typing import Optional, Dict, Any, Union
+from typing import Optional, Dict, Any
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from tkinter import messagebox
 import urllib.parse
+import json_codec
+from debug_capture import debug_capture
+from voucher_model import Voucher
+
+
+# Transactions per compressed upload batch
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", "500"))
+UPLOAD_TIMEOUT = (10, 120)
+# Uploads started but not yet fully acknowledged, content digest -> upload id, kept next to
+# sync_history.json so an interrupted upload of the same data resumes under its old id
+PENDING_UPLOADS_FILE = "pending_uploads.json"
+TRANSACTION_REQUIRED_FIELDS = ["party_name", "voucher_no", "voucher_type", "date", "amount", "ledger_entries"]
+
+
+class BackendError(Exception):
+    """
+    A sync upload failed. title and message are meant for the user; the sync service
+    passes them to the GUI through its events queue rather than showing a dialog itself.
+    """
+
+    def __init__(self, title: str, message: str):
+        super().__init__(message)
+        self.title = title
+        self.message = message
 
 
 class APIConnector:
@@ -116,34 +143,31 @@ class APIConnector:
         
         return headers
     
-    def _prepare_payload(self, data_type: str, data: Any, is_json: bool = False) -> Union[str, Dict[str, Any]]:
-        """Prepare request payload based on data type."""
-        if is_json:
-            if isinstance(data, str):
-                # Validate JSON string
-                try:
-                    json.loads(data)
-                    return data
-                except json.JSONDecodeError as e:
-                    self.log(f"❌ Invalid JSON data: {e}")
-                    raise ValueError(f"Invalid JSON data: {e}")
-            else:
-                # Convert to JSON string
-                try:
-                    return json.dumps(data, ensure_ascii=False)
-                except (TypeError, ValueError) as e:
-                    self.log(f"❌ Failed to serialize data to JSON: {e}")
-                    raise ValueError(f"Failed to serialize data to JSON: {e}")
-        else:
-            return {
+    def _prepare_payload(self, data_type: str, data: Any, is_json: bool = False) -> bytes:
+        """Encode the request body exactly once, as compact JSON."""
+        if is_json and isinstance(data, (str, bytes)):
+            # Already serialized by the caller; sent as is
+            return data.encode('utf-8') if isinstance(data, str) else data
+        if not is_json:
+            data = {
                 "type": data_type,
                 "data": data,
                 "timestamp": datetime.datetime.now().isoformat(),
                 "client_version": "1.0"
             }
+        try:
+            return json_codec.dumps(data)
+        except (TypeError, ValueError) as e:
+            self.log(f"❌ Failed to serialize data to JSON: {e}")
+            raise ValueError(f"Failed to serialize data to JSON: {e}")
     
+    def _fail(self, title: str, message: str, log_message: Optional[str] = None):
+        """Log an upload failure and raise it as a BackendError."""
+        self.log(f"❌ {log_message or message}")
+        raise BackendError(title, message)
+
     def _handle_response(self, response: requests.Response, data_type: str) -> bool:
-        """Handle API response with detailed error reporting."""
+        """Return True for a successful API response; raise BackendError with the details otherwise."""
         try:
             # Log response details
             self.log(f"Backend response: status={response.status_code}, "
@@ -165,50 +189,36 @@ class APIConnector:
             
             elif response.status_code == 401:
                 error_msg = "Authentication failed. Please check your API key."
-                self.log(f"❌ Authentication error: {error_msg}")
-                messagebox.showerror("Authentication Error", error_msg)
-                return False
+                self._fail("Authentication Error", error_msg, f"Authentication error: {error_msg}")
             
             elif response.status_code == 403:
                 error_msg = "Access denied. You don't have permission to perform this action."
-                self.log(f"❌ Authorization error: {error_msg}")
-                messagebox.showerror("Authorization Error", error_msg)
-                return False
+                self._fail("Authorization Error", error_msg, f"Authorization error: {error_msg}")
             
             elif response.status_code == 413:
                 error_msg = "Data payload too large. Please try with smaller date ranges."
-                self.log(f"❌ Payload too large: {error_msg}")
-                messagebox.showerror("Data Size Error", error_msg)
-                return False
+                self._fail("Data Size Error", error_msg, f"Payload too large: {error_msg}")
             
             elif response.status_code == 429:
                 error_msg = "Rate limit exceeded. Please wait before retrying."
-                self.log(f"❌ Rate limit error: {error_msg}")
-                messagebox.showerror("Rate Limit Error", error_msg)
-                return False
+                self._fail("Rate Limit Error", error_msg, f"Rate limit error: {error_msg}")
             
             elif 400 <= response.status_code < 500:
                 error_msg = f"Client error [{response.status_code}]: {response.text}"
-                self.log(f"❌ Client error: {error_msg}")
-                messagebox.showerror("Client Error", error_msg)
-                return False
+                self._fail("Client Error", error_msg, f"Client error: {error_msg}")
             
             elif 500 <= response.status_code < 600:
                 error_msg = f"Server error [{response.status_code}]: {response.text}"
-                self.log(f"❌ Server error: {error_msg}")
-                messagebox.showerror("Server Error", error_msg)
-                return False
+                self._fail("Server Error", error_msg, f"Server error: {error_msg}")
             
             else:
                 error_msg = f"Unexpected response [{response.status_code}]: {response.text}"
-                self.log(f"❌ Unexpected response: {error_msg}")
-                messagebox.showerror("Unexpected Error", error_msg)
-                return False
+                self._fail("Unexpected Error", error_msg, f"Unexpected response: {error_msg}")
         
+        except BackendError:
+            raise
         except Exception as e:
-            self.log(f"❌ Error handling response: {e}")
-            messagebox.showerror("Response Error", f"Error processing server response: {e}")
-            return False
+            self._fail("Response Error", f"Error processing server response: {e}")
     
     def test_backend_connection(self, api_key: str) -> bool:
         """Test connection to backend with health check endpoint."""
@@ -266,89 +276,43 @@ class APIConnector:
             is_json: Whether data is already a JSON string
             
         Returns:
-            bool: True if successful, False otherwise
+            bool: True if successful
+
+        Raises:
+            BackendError: with a title and message for the user, if the upload failed
         """
         # Validate inputs
         if not self.backend_url:
-            messagebox.showerror("Configuration Error", "Backend URL not configured.")
-            self.log("❌ Backend URL not configured")
-            return False
+            self._fail("Configuration Error", "Backend URL not configured.")
         
         if not self._validate_api_key(api_key):
-            messagebox.showerror("Authentication Error", "Invalid API key.")
-            return False
+            self._fail("Authentication Error", "Invalid API key.")
         
         if not data_type:
-            self.log("❌ Data type not specified")
-            messagebox.showerror("Data Error", "Data type not specified.")
-            return False
+            self._fail("Data Error", "Data type not specified.")
         
-        # --- Enhanced payload validation and logging ---
+        # --- Payload validation ---
         if data_type in ["transactions", "vouchers"]:
-            # If data is a JSON string, try to parse it
-            tx_data = None
-            if is_json:
+            # Callers normally pass the list itself; a pre-serialized string is parsed once to validate it
+            tx_data = data
+            if is_json and isinstance(data, (str, bytes)):
                 try:
-                    tx_data = json.loads(data) if isinstance(data, str) else data
-                except Exception as e:
-                    self.log(f"❌ Failed to parse JSON transaction data: {e}")
-                    messagebox.showerror("Data Error", f"Failed to parse transaction JSON: {e}")
-                    return False
-            else:
-                tx_data = data
+                    tx_data = json_codec.loads(data)
+                except ValueError as e:
+                    self._fail("Data Error", f"Failed to parse transaction JSON: {e}")
             # --- Do NOT require or attach company_name for backend ---
             # Validate non-empty list
             if not isinstance(tx_data, list) or not tx_data:
-                self.log(f"❌ Transaction payload is empty or not a list: {tx_data}")
-                messagebox.showerror("Data Error", "Transaction data must be a non-empty list.")
-                return False
+                self._fail("Data Error", "Transaction data must be a non-empty list.")
             # Validate required fields in each transaction
-            required_fields = ["party_name", "voucher_no", "voucher_type", "date", "amount", "ledger_entries"]
-            for idx, tx in enumerate(tx_data):
-                if not isinstance(tx, dict):
-                    self.log(f"❌ Transaction at index {idx} is not a dict: {tx}")
-                    messagebox.showerror("Data Error", f"Transaction at index {idx} is not a dict.")
-                    return False
-                missing = [f for f in required_fields if f not in tx]
-                if missing:
-                    self.log(f"❌ Transaction at index {idx} missing fields: {missing}")
-                    messagebox.showerror("Data Error", f"Transaction at index {idx} missing fields: {missing}")
-                    return False
-            # Pretty-print payload for logging
-            try:
-                pretty_payload = json.dumps(tx_data, indent=2, ensure_ascii=False)
-                payload_path = os.path.join(os.path.dirname(__file__), 'last_transaction_payload.json')
-                with open(payload_path, 'w', encoding='utf-8') as f:
-                    f.write(pretty_payload)
-                # --- Save a copy in file_backend directory ---
-                backend_dir = os.path.join(os.path.dirname(__file__), 'file_backend')
-                os.makedirs(backend_dir, exist_ok=True)
-                backend_file = os.path.join(backend_dir, f'{data_type}_payload_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
-                with open(backend_file, 'w', encoding='utf-8') as f:
-                    f.write(pretty_payload)
-                self.log(f"Outgoing transaction payload saved to: {payload_path}", suppress_terminal=True)
-                self.log(f"Copy also saved to: {backend_file}", suppress_terminal=True)
-            except Exception as e:
-                self.log(f"Failed to save outgoing transaction payload: {e}")
-        else:
-            # Log other data types
-            try:
-                pretty_payload = json.dumps(data, indent=2, ensure_ascii=False) if not is_json else str(data)
-                self.log(f"Outgoing {data_type} payload:\n{pretty_payload}")
-                # --- Save a copy in file_backend directory ---
-                backend_dir = os.path.join(os.path.dirname(__file__), 'file_backend')
-                os.makedirs(backend_dir, exist_ok=True)
-                ext = 'json' if not is_json else 'txt'
-                backend_file = os.path.join(backend_dir, f'{data_type}_payload_{datetime.datetime.now().strftime("%Y%m%d_%H%M%S")}.{ext}')
-                with open(backend_file, 'w', encoding='utf-8') as f:
-                    f.write(pretty_payload)
-                self.log(f"Copy also saved to: {backend_file}", suppress_terminal=True)
-            except Exception as e:
-                self.log(f"Outgoing {data_type} payload: {data} (pretty-print failed: {e})")
+            self._validate_transactions(tx_data)
         
         try:
             headers = self._prepare_headers(api_key, is_json=True)
             payload = self._prepare_payload(data_type, data, is_json=is_json)
+            self.log(f"Outgoing {data_type} payload: {len(payload)} bytes ({json_codec.BACKEND})")
+            # Keep a copy for debugging when captures are enabled
+            debug_capture.capture(f"{data_type}_payload", payload, ext="json")
             
             # Determine URL based on data type
             if data_type in ["transactions", "vouchers"]:
@@ -356,9 +320,7 @@ class APIConnector:
             elif data_type == "masters":
                 url = f"{self.backend_url}/api/sync/masters/"
             else:
-                self.log(f"❌ Unknown data type: {data_type}")
-                messagebox.showerror("Data Error", f"Unknown data type: {data_type}")
-                return False
+                self._fail("Data Error", f"Unknown data type: {data_type}")
             
             self.log(f"Sending {data_type} data to backend: {url}")
             
@@ -366,26 +328,142 @@ class APIConnector:
                 url,
                 headers=headers,
                 data=payload,
-                timeout=10
+                timeout=UPLOAD_TIMEOUT
             )
             
             return self._handle_response(response, data_type)
         
+        except BackendError:
+            raise
+        
         except requests.exceptions.Timeout:
-            self.log("❌ Request timed out")
-            messagebox.showerror("Request Error", "The request to the backend timed out.")
-            return False
+            self._fail("Request Error", "The request to the backend timed out.")
         
         except requests.exceptions.ConnectionError:
-            self.log("❌ Request failed: Connection error")
-            messagebox.showerror("Request Error", "Cannot connect to backend server.")
-            return False
+            self._fail("Request Error", "Cannot connect to backend server.")
         
         except Exception as e:
-            self.log(f"❌ Request failed: {e}")
-            messagebox.showerror("Request Error", f"Request failed: {e}")
-            return False
+            self._fail("Request Error", f"Request failed: {e}")
     
+    def _validate_transactions(self, tx_data: list) -> None:
+        """Check every transaction is a Voucher record or a dict carrying the fields the backend requires."""
+        for idx, tx in enumerate(tx_data):
+            if isinstance(tx, Voucher):
+                continue
+            if not isinstance(tx, dict):
+                self._fail("Data Error", f"Transaction at index {idx} is not a dict.",
+                           f"Transaction at index {idx} is not a dict: {tx}")
+            missing = [f for f in TRANSACTION_REQUIRED_FIELDS if f not in tx]
+            if missing:
+                self._fail("Data Error", f"Transaction at index {idx} missing fields: {missing}")
+
+    def _acked_batches(self, api_key: str, upload_id: str) -> set:
+        """Ask the backend which batches of an upload it has already applied."""
+        try:
+            response = self.session.get(
+                f"{self.backend_url}/api/transactions/uploads/{upload_id}/",
+                headers=self._prepare_headers(api_key),
+                timeout=10
+            )
+            if response.status_code == 200:
+                return set(response.json().get('acked', []))
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.log(f"⚠️ Could not read upload status, sending all batches: {e}")
+        return set()
+
+    def _load_pending_uploads(self) -> Dict[str, str]:
+        try:
+            with open(PENDING_UPLOADS_FILE, 'r') as f:
+                pending = json.load(f)
+            return pending if isinstance(pending, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _save_pending_uploads(self, pending: Dict[str, str]) -> None:
+        try:
+            with open(PENDING_UPLOADS_FILE, 'w') as f:
+                json.dump(pending, f, indent=2)
+        except OSError as e:
+            self.log(f"⚠️ Could not save pending uploads: {e}")
+
+    def _upload_id_for(self, digest: str) -> str:
+        """A fresh upload id, or the id of an unfinished upload of the same content."""
+        pending = self._load_pending_uploads()
+        if digest not in pending:
+            pending[digest] = uuid.uuid4().hex
+            self._save_pending_uploads(pending)
+        return pending[digest]
+
+    def _finish_upload(self, digest: str) -> None:
+        pending = self._load_pending_uploads()
+        if pending.pop(digest, None) is not None:
+            self._save_pending_uploads(pending)
+
+    def send_transactions_in_batches(self, api_key: str, transactions: list, batch_size: int = UPLOAD_BATCH_SIZE,
+                                     mode: str = "upsert") -> bool:
+        """
+        Upload transactions as gzip-compressed, numbered batches.
+
+        Every upload gets a new random id, so identical data uploaded twice is applied twice.
+        Only while an upload is unfinished is its id remembered under the content digest:
+        re-running an interrupted sync with the same data resumes after the last batch the
+        backend acknowledged. Each batch carries an Idempotency-Key, and the backend never
+        applies the same batch twice.
+
+        Returns:
+            bool: True once every batch is acknowledged
+
+        Raises:
+            BackendError: with a title and message for the user, if a batch was not accepted
+        """
+        if not self.backend_url:
+            self._fail("Configuration Error", "Backend URL not configured.")
+        if not self._validate_api_key(api_key):
+            self._fail("Authentication Error", "Invalid API key.")
+        if not isinstance(transactions, list) or not transactions:
+            self._fail("Data Error", "Transaction data must be a non-empty list.")
+        self._validate_transactions(transactions)
+
+        # Serialize and compress every batch once; the digest of the bodies finds an unfinished upload
+        digest = hashlib.sha256()
+        bodies = []
+        raw_bytes = 0
+        for start in range(0, len(transactions), batch_size):
+            body = json_codec.dumps(transactions[start:start + batch_size])
+            digest.update(body)
+            raw_bytes += len(body)
+            bodies.append(gzip.compress(body, compresslevel=6))
+        content_digest = digest.hexdigest()
+        upload_id = self._upload_id_for(content_digest)
+        total = len(bodies)
+        self.log(f"Uploading {len(transactions)} transactions as {total} batches "
+                 f"({raw_bytes} bytes raw, {sum(len(b) for b in bodies)} compressed), upload {upload_id}")
+
+        acked = self._acked_batches(api_key, upload_id)
+        if acked:
+            self.log(f"Resuming upload {upload_id}: {len(acked)} of {total} batches already acknowledged")
+        url = f"{self.backend_url}/api/transactions/?mode={urllib.parse.quote(mode)}"
+        for seq, body in enumerate(bodies):
+            if seq in acked:
+                continue
+            headers = self._prepare_headers(api_key, is_json=True)
+            headers.update({
+                'Content-Encoding': 'gzip',
+                'X-Upload-Id': upload_id,
+                'X-Batch-Seq': str(seq),
+                'X-Batch-Total': str(total),
+                'Idempotency-Key': f"{upload_id}:{seq}",
+            })
+            try:
+                response = self.session.post(url, headers=headers, data=body, timeout=UPLOAD_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                self._fail("Request Error", f"Upload interrupted at batch {seq + 1} of {total}: {e}",
+                           f"Batch {seq + 1}/{total} failed: {e}. Re-run the sync to resume.")
+            self._handle_response(response, f"batch {seq + 1}/{total}")
+        self._finish_upload(content_digest)
+        self.log(f"✅ Upload {upload_id} complete: {total} batches acknowledged")
+        return True
+
     def close(self) -> None:
         """Close the session and cleanup resources."""
         if hasattr(self, 'session'):
@@ -402,9 +480,13 @@ def log(msg: str) -> None:
     _api_connector.log(msg)
 
 def send_data_to_backend(api_key: str, data_type: str, data: Any, is_json: bool = False) -> bool:
-    """Legacy function for backward compatibility."""
+    """Legacy function for backward compatibility; raises BackendError on failure."""
     return _api_connector.send_data_to_backend(api_key, data_type, data, is_json)
 
+def send_transactions_in_batches(api_key: str, transactions: list, batch_size: int = UPLOAD_BATCH_SIZE) -> bool:
+    """Upload transactions as compressed, resumable batches; raises BackendError on failure."""
+    return _api_connector.send_transactions_in_batches(api_key, transactions, batch_size=batch_size)
+
 def test_backend_connection(api_key: str) -> bool:
     """Legacy function for backward compatibility."""
     return _api_connector.test_backend_connection(api_key)
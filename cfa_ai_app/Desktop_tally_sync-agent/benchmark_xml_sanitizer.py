@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the XML sanitizer
+Compares the single-pass xml_sanitizer against the old clean_xml_data regex chain on a
+saved Tally response (raw_tally_response.xml by default), whole-string and streamed.
+
+Usage: python benchmark_xml_sanitizer.py [path] [--scale N] [--repeat N] [--chunk BYTES]
+"""
+
+import os
+import re
+import sys
+import html
+import time
+import argparse
+import tracemalloc
+
+import xmltodict
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from xml_sanitizer import sanitize_xml, iter_sanitized
+
+
+def legacy_clean_xml_data(xml_str):
+    """The clean_xml_data regex chain that shipped before xml_sanitizer, kept for comparison."""
+    if not xml_str:
+        return ""
+    cleaned = re.sub(r'[^\x09\x0A\x0D\x20-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]', '', xml_str)
+    cleaned = html.unescape(cleaned)
+    cleaned = re.sub(r'&(?!amp;|lt;|gt;|apos;|quot;)', '&amp;', cleaned)
+    cleaned = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F]', '', cleaned)
+    if not cleaned.strip().startswith('<?xml'):
+        cleaned = '<?xml version="1.0" encoding="UTF-8"?>\n' + cleaned
+    return cleaned
+
+
+def strip_declaration(text):
+    """Strip the XML declaration so whole-string and streamed output can be compared."""
+    return text.split('?>', 1)[1].lstrip() if text.lstrip().startswith('<?xml') else text.lstrip()
+
+
+def streamed(raw_bytes, chunk_size):
+    chunks = (raw_bytes[i:i + chunk_size] for i in range(0, len(raw_bytes), chunk_size))
+    return ''.join(iter_sanitized(chunks, 'utf-8'))
+
+
+def measure(label, func, repeat, size):
+    """Run func `repeat` times; report best wall time, throughput and peak allocation."""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {best * 1000:9.1f} ms  {size / best / 1e6:8.1f} MB/s  peak {peak / 1e6:8.1f} MB")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', nargs='?', default='raw_tally_response.xml')
+    parser.add_argument('--scale', type=int, default=1, help='repeat the body N times to simulate a larger export')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per variant (best is reported)')
+    parser.add_argument('--chunk', type=int, default=64 * 1024, help='chunk size in bytes for the streamed run')
+    args = parser.parse_args()
+
+    with open(args.path, 'rb') as f:
+        raw_bytes = f.read()
+    if args.scale > 1:
+        # Repeat the vouchers inside a single envelope so the result is still one document
+        text = raw_bytes.decode('utf-8', errors='replace')
+        start = text.find('<VOUCHER')
+        end = text.rfind('</VOUCHER>') + len('</VOUCHER>')
+        if start != -1 and end > start:
+            text = text[:start] + text[start:end] * args.scale + text[end:]
+        raw_bytes = text.encode('utf-8')
+    text = raw_bytes.decode('utf-8', errors='replace')
+    print(f"Input: {args.path} x{args.scale} = {len(raw_bytes) / 1e6:.1f} MB, "
+          f"{text.count('&')} ampersands, best of {args.repeat}")
+    print("=" * 72)
+
+    legacy = measure("legacy clean_xml_data", lambda: legacy_clean_xml_data(text), args.repeat, len(raw_bytes))
+    single = measure("sanitize_xml", lambda: sanitize_xml(text), args.repeat, len(raw_bytes))
+    stream = measure(f"iter_sanitized ({args.chunk} B)", lambda: streamed(raw_bytes, args.chunk),
+                     args.repeat, len(raw_bytes))
+    print("=" * 72)
+    print(f"Speed-up: whole string {legacy / single:.2f}x, streamed {legacy / stream:.2f}x")
+
+    # The streamed and whole-string sanitizers must agree byte for byte
+    whole = sanitize_xml(text)
+    assert strip_declaration(whole) == strip_declaration(streamed(raw_bytes, args.chunk)), "streamed output differs"
+    assert strip_declaration(whole) == strip_declaration(streamed(raw_bytes, 7)), "streamed output differs at 7-byte chunks"
+
+    try:
+        parsed = xmltodict.parse(whole)
+        print("✅ sanitize_xml output parses")
+    except Exception as e:
+        print(f"❌ sanitize_xml output does not parse: {e}")
+        return 1
+    try:
+        legacy_parsed = xmltodict.parse(legacy_clean_xml_data(text))
+        same = legacy_parsed == parsed
+        print(f"{'✅' if same else '⚠️'} legacy output parses; parsed data {'identical' if same else 'differs'}")
+    except Exception as e:
+        print(f"⚠️ legacy output does not parse: {e}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+import os
+import json
+import datetime
+import threading
+
+# Learned chunk sizes live next to sync_history.json
+CHUNK_TUNING_FILE = "chunk_tuning.json"
+
+DEFAULT_CHUNK_DAYS = 30
+MIN_CHUNK_DAYS = 1
+MAX_CHUNK_DAYS = 92
+
+# A chunk is "slow" well before it gets near READ_TIMEOUT (120s) in tally_connector
+SLOW_CHUNK_SECONDS = float(os.getenv("TALLY_SLOW_CHUNK_SECONDS", "45"))
+# A chunk is "small" when it comes back quickly with little data; the window is then widened
+FAST_CHUNK_SECONDS = SLOW_CHUNK_SECONDS / 4
+SMALL_CHUNK_BYTES = 2 * 1024 * 1024
+SMALL_CHUNK_VOUCHERS = 500
+
+
+class ChunkTuner:
+    """
+    Tracks per-report chunk sizes for one company.
+
+    Every fetched window is reported through record(), which adjusts the report's size
+    for the rest of the run: a slow or failed window halves it, a full-size window that
+    comes back small and fast doubles it (never back up to a size that was too big).
+    chunk_days() gives the current size, so the next window cut already uses it.
+    save() persists the sizes reached so the next sync starts well tuned.
+    """
+
+    def __init__(self, company_name=None, path=CHUNK_TUNING_FILE):
+        self.company_key = (company_name or "default").strip() or "default"
+        self.path = path
+        self._lock = threading.Lock()
+        self._all = self._load()
+        self._reports = self._all.setdefault(self.company_key, {})
+        # Sizes adjusted during this run: report -> days
+        self._live = {}
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r') as f:
+                    data = json.load(f)
+                if isinstance(data, dict):
+                    return data
+            except Exception:
+                pass
+        return {}
+
+    def _current(self, report_name):
+        days = self._live.get(report_name)
+        if days is None:
+            entry = self._reports.get(report_name) or {}
+            days = entry.get("chunk_days", DEFAULT_CHUNK_DAYS)
+        return max(MIN_CHUNK_DAYS, min(MAX_CHUNK_DAYS, int(days)))
+
+    def chunk_days(self, report_name):
+        """Return the chunk size in days for the next window of a report."""
+        with self._lock:
+            return self._current(report_name)
+
+    def is_slow(self, elapsed):
+        return elapsed > SLOW_CHUNK_SECONDS
+
+    def record(self, report_name, days, elapsed, size_bytes, voucher_count, ok=True):
+        """Record the outcome of fetching a window of `days` days and adjust the report's size."""
+        with self._lock:
+            current = self._current(report_name)
+            entry = self._reports.setdefault(report_name, {"chunk_days": DEFAULT_CHUNK_DAYS})
+            if not ok or self.is_slow(elapsed):
+                current = min(current, max(MIN_CHUNK_DAYS, days // 2))
+                # Never widen back up to a window size that has already been too big
+                entry["too_big_days"] = min(days, entry.get("too_big_days", days))
+            elif (days >= current and elapsed < FAST_CHUNK_SECONDS and size_bytes < SMALL_CHUNK_BYTES
+                  and voucher_count < SMALL_CHUNK_VOUCHERS):
+                # A window cut short at the end of the range says nothing about the current size
+                current = min(current * 2, entry.get("too_big_days", MAX_CHUNK_DAYS + 1) - 1)
+            self._live[report_name] = max(MIN_CHUNK_DAYS, min(MAX_CHUNK_DAYS, current))
+            if ok and days:
+                entry["bytes_per_day"] = round(size_bytes / days)
+                entry["seconds_per_day"] = round(elapsed / days, 3)
+
+    def save(self):
+        """Write the sizes this run ended on to disk."""
+        with self._lock:
+            for report_name, days in self._live.items():
+                entry = self._reports.setdefault(report_name, {"chunk_days": DEFAULT_CHUNK_DAYS})
+                entry["chunk_days"] = days
+                entry["updated_at"] = datetime.datetime.now().isoformat()
+            try:
+                with open(self.path, 'w') as f:
+                    json.dump(self._all, f, indent=2)
+            except Exception as e:
+                print(f"[WARN] Failed to save chunk tuning: {e}")
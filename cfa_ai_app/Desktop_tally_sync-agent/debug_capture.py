@@ -0,0 +1,134 @@
+import os
+import gzip
+import time
+import queue
+import atexit
+import random
+import datetime
+import threading
+import json_codec
+
+# Opt-in: off (default), failures, sample (failures + a random share of requests) or all
+CAPTURE_MODE = os.getenv("TALLY_DEBUG_CAPTURE", "off").strip().lower()
+CAPTURE_DIR = os.getenv("TALLY_DEBUG_CAPTURE_DIR", "debug_captures")
+# The ring keeps at most this much compressed data and this many files; the oldest go first
+CAPTURE_MAX_BYTES = int(float(os.getenv("TALLY_DEBUG_CAPTURE_MAX_MB", "200")) * 1024 * 1024)
+CAPTURE_MAX_FILES = int(os.getenv("TALLY_DEBUG_CAPTURE_MAX_FILES", "50"))
+CAPTURE_SAMPLE_RATE = float(os.getenv("TALLY_DEBUG_CAPTURE_SAMPLE_RATE", "0.05"))
+# Captures waiting for the writer; when it falls behind new captures are dropped, never waited on
+CAPTURE_QUEUE_SIZE = 8
+CAPTURE_MODES = ("off", "failures", "sample", "all")
+
+
+class DebugCapture:
+    """
+    Size-bounded ring of gzip-compressed debug captures (raw Tally responses, JSON dumps).
+
+    capture() only decides whether to keep something and queues it; compression and disk
+    writes happen on a background writer thread, so the sync never waits on the disk.
+    Failures are kept in every mode except "off"; successful requests only in "sample"
+    (at sample_rate) and "all".
+    """
+
+    def __init__(self, mode=CAPTURE_MODE, directory=CAPTURE_DIR, max_bytes=CAPTURE_MAX_BYTES,
+                 max_files=CAPTURE_MAX_FILES, sample_rate=CAPTURE_SAMPLE_RATE):
+        self.mode = mode if mode in CAPTURE_MODES else "off"
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.sample_rate = sample_rate
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._writer = None
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def wants(self, failed=False):
+        """Whether a capture of this kind would be kept; lets callers skip buffering work."""
+        if self.mode == "off":
+            return False
+        if failed or self.mode == "all":
+            return True
+        return self.mode == "sample" and random.random() < self.sample_rate
+
+    def capture(self, name, payload, failed=False, force=False, ext="xml"):
+        """
+        Queue payload for writing as <name>: bytes or str are written as is with extension ext,
+        other objects as JSON. Returns True if it was queued. force skips the mode check
+        (the caller already asked wants()).
+        """
+        if not (force or self.wants(failed)):
+            return False
+        self._ensure_writer()
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        try:
+            self._queue.put_nowait((seq, name, payload, failed, ext))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout=10):
+        """Wait (up to timeout seconds) for queued captures to reach the disk."""
+        if self._writer is None:
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._run, name="debug-capture-writer", daemon=True)
+                self._writer.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._write(*item)
+                self._trim()
+            except Exception as e:
+                print(f"[WARN] Failed to write debug capture: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, seq, name, payload, failed, ext):
+        if isinstance(payload, str):
+            data = payload.encode('utf-8')
+        elif isinstance(payload, (bytes, bytearray)):
+            data = bytes(payload)
+        else:
+            data, ext = json_codec.dumps(payload), "json"
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        filename = f"{stamp}-{seq:05d}-{name}{'-failed' if failed else ''}.{ext}.gz"
+        path = os.path.join(self.directory, filename)
+        with gzip.open(path + ".tmp", 'wb', compresslevel=6) as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def _trim(self):
+        """Delete the oldest captures until the ring is within max_files and max_bytes."""
+        entries = []
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".gz"):
+                path = os.path.join(self.directory, filename)
+                entries.append((os.path.getmtime(path), path, os.path.getsize(path)))
+        entries.sort()
+        total = sum(size for _, _, size in entries)
+        while entries and (len(entries) > self.max_files or total > self.max_bytes):
+            _, path, size = entries.pop(0)
+            os.remove(path)
+            total -= size
+
+
+# Process-wide ring used by tally_connector
+debug_capture = DebugCapture()
+atexit.register(debug_capture.flush, 5)
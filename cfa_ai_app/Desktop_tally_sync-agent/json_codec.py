@@ -0,0 +1,60 @@
+import json
+import datetime
+from decimal import Decimal
+
+# Fastest available JSON library: orjson, then msgspec, then the standard library.
+# Every backend produces the same compact UTF-8 bytes (no whitespace, non-ASCII kept as is).
+try:
+    import orjson
+    BACKEND = "orjson"
+except ImportError:
+    orjson = None
+    try:
+        import msgspec
+        BACKEND = "msgspec"
+    except ImportError:
+        msgspec = None
+        BACKEND = "json"
+
+
+def _default(obj):
+    """Encode types the JSON libraries do not all support natively."""
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if hasattr(obj, 'to_payload'):
+        return obj.to_payload()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if BACKEND == "msgspec":
+    _encoder = msgspec.json.Encoder(enc_hook=_default)
+    _decoder = msgspec.json.Decoder()
+
+
+def dumps(obj, sort_keys=False):
+    """Serialize obj to compact UTF-8 JSON bytes."""
+    if BACKEND == "orjson":
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+    if BACKEND == "msgspec" and not sort_keys:
+        try:
+            return _encoder.encode(obj)
+        except msgspec.EncodeError as e:
+            raise TypeError(str(e)) from e
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':'),
+                      sort_keys=sort_keys).encode('utf-8')
+
+
+def loads(data):
+    """Parse JSON from bytes or str. Invalid input raises ValueError whatever the backend."""
+    if BACKEND == "orjson":
+        return orjson.loads(data)
+    if BACKEND == "msgspec":
+        try:
+            return _decoder.decode(data.encode('utf-8') if isinstance(data, str) else data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+    return json.loads(data)
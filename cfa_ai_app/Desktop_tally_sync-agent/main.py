@@ -2,18 +2,15 @@ import os
 import sys
 import tkinter as tk
 from tkinter import messagebox, ttk
-from tally_connector import (
-    test_tally_connection, get_company_name, fetch_complete_tally_data,
-    fetch_accounting_vouchers_only, fetch_ledger_opening_balances, fetch_all_registers
-)
-from api_connector import send_data_to_backend, test_backend_connection
+from tally_connector import test_tally_connection, get_company_name
+from api_connector import test_backend_connection
+from sync_service import SyncService, SYNC_INTERVAL_HOURS, SYNC_WINDOW, CHANGE_POLL_SECONDS, DEFAULT_START_DATE
 from dotenv import load_dotenv
 import cv2
 import datetime
 from PIL import Image, ImageTk
 import threading
-import json
-from dateutil import parser
+import queue
 
 # Dependency check for tenacity
 try:
@@ -49,7 +46,6 @@ os.environ['PATH'] += os.pathsep + base_path
 # Load environment
 load_dotenv()
 CONFIG_FILE = "config.env"
-SYNC_HISTORY_FILE = "sync_history.json"
 
 def load_config():
     config = {"API_KEY": "", "TALLY_URL": "http://localhost:9000", "BACKEND_URL": ""}
@@ -61,27 +57,11 @@ def load_config():
                     config[key] = value
     return config
 
-def load_sync_history():
-    """Load sync history from file"""
-    if os.path.exists(SYNC_HISTORY_FILE):
-        try:
-            with open(SYNC_HISTORY_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {"last_sync": None, "total_syncs": 0, "last_voucher_count": 0}
-    return {"last_sync": None, "total_syncs": 0, "last_voucher_count": 0}
-
-def save_sync_history(sync_data):
-    """Save sync history to file"""
-    try:
-        with open(SYNC_HISTORY_FILE, 'w') as f:
-            json.dump(sync_data, f, indent=2)
-    except Exception as e:
-        log(f"Failed to save sync history: {e}")
-
 config = load_config()
-sync_history = load_sync_history()
 api_key = config.get("API_KEY", "")
+# Headless sync runner; the GUI only sends it commands and renders its events
+sync_service = SyncService(api_key=api_key)
+sync_history = dict(sync_service.history)
 
 # Logging setup
 LOG_FILE = os.path.join(os.path.dirname(__file__), 'sync_log.txt')
@@ -188,17 +168,18 @@ tt_qr.grid(row=0, column=1, padx=8)
 sync_type_frame = tk.Frame(app, bg="#f8fff8")
 sync_type_frame.pack(pady=10)
 tk.Label(sync_type_frame, text="Sync Type:", font=("Segoe UI", 12), bg="#f8fff8").pack(side=tk.LEFT, padx=(0, 8))
-sync_type_var = tk.StringVar(value="vouchers_only")
+sync_type_var = tk.StringVar(value="incremental")
 sync_type_combo = ttk.Combobox(sync_type_frame, textvariable=sync_type_var, width=25, font=("Segoe UI", 10), state="readonly")
-sync_type_combo['values'] = ('vouchers_only', 'complete_data', 'opening_balances_only')
+sync_type_combo['values'] = ('incremental', 'vouchers_only', 'complete_data', 'opening_balances_only')
 sync_type_combo.pack(side=tk.LEFT)
 
 # Date Range Selection
 date_frame = tk.Frame(app, bg="#f8fff8")
 date_frame.pack(pady=10)
 tk.Label(date_frame, text="Date Range:", font=("Segoe UI", 12), bg="#f8fff8").pack(side=tk.LEFT, padx=(0, 8))
-from_date = tk.StringVar(value="20240401")
-to_date = tk.StringVar(value="20250630")
+from_date = tk.StringVar(value=DEFAULT_START_DATE)
+# Left empty, the sync runs up to the day it starts (SyncService fills it in)
+to_date = tk.StringVar(value="")
 tk.Label(date_frame, text="From:", font=("Segoe UI", 10), bg="#f8fff8").pack(side=tk.LEFT, padx=(0, 5))
 from_entry = ttk.Entry(date_frame, textvariable=from_date, width=10, font=("Segoe UI", 10))
 from_entry.pack(side=tk.LEFT, padx=(0, 10))
@@ -279,6 +260,10 @@ def save_config():
         file.write(f"API_KEY={api_key}\n")
         file.write(f"TALLY_URL={config.get('TALLY_URL', 'http://localhost:9000')}\n")
         file.write(f"BACKEND_URL={config.get('BACKEND_URL', '')}\n")
+        # Keep the sync settings (SYNC_START_DATE, SYNC_INTERVAL_HOURS, ...) set in the file
+        for key, value in config.items():
+            if key not in ("API_KEY", "TALLY_URL", "BACKEND_URL"):
+                file.write(f"{key}={value}\n")
 
 def update_api_key():
     global api_key
@@ -286,6 +271,7 @@ def update_api_key():
     if entered_key:
         api_key = entered_key
         save_config()
+        sync_service.set_api_key(api_key)
         messagebox.showinfo("Success", "API Key updated successfully!")
         log(f"API Key updated")
         update_log_display("API Key updated successfully")
@@ -324,6 +310,7 @@ def scan_qr():
                     api_entry.delete(0, tk.END)
                     api_entry.insert(0, api_key)
                     save_config()
+                    sync_service.set_api_key(api_key)
                     messagebox.showinfo("QR Scan", "API Key Scanned and Saved Successfully!")
                     log(f"API Key scanned from QR")
                     update_log_display("API Key scanned successfully")
@@ -389,147 +376,54 @@ def test_backend_connection_gui():
     finally:
         progress.stop()
 
-def normalize_date(date_str):
-    try:
-        return parser.parse(date_str).strftime('%Y%m%d')
-    except Exception:
-        return date_str
-
 def sync_data_threaded():
-    threading.Thread(target=sync_data, daemon=True).start()
-
-def sync_data():
-    global sync_history
-    log("Sync Data button clicked.")
-    update_log_display("Starting data sync...")
-    
+    """Ask the sync service for a sync with the selected type and date range."""
     if not api_key:
         messagebox.showerror("Error", "API Key not set. Please enter or scan API Key first.")
-        log("API Key not set. Sync aborted.")
         update_log_display("Sync aborted - API Key not set")
         return
+    log("Sync Data button clicked.")
+    sync_service.request_sync(sync_type_var.get(), from_date.get().strip(), to_date.get().strip())
 
-    # Disable sync button during operation
-    tt_sync.config(state='disabled')
-    
-    try:
-        status_label.config(text="Connecting to Tally...", fg="#2e7d32")
-        progress.start(10)
-        app.update_idletasks()
-        update_log_display("Connecting to Tally...")
-
-        if not test_tally_connection():
-            messagebox.showerror("Error", "Tally not connected. Please open Tally and load the company.")
-            status_label.config(text="Tally not connected.", fg="#d32f2f")
-            progress.stop()
-            log("Tally not connected. Sync aborted.")
-            update_log_display("Sync aborted - Tally not connected")
-            return
-
-        # Get company name for logging/display only (never sent to backend)
-        company_name = get_company_name()
-        if company_name:
-            update_log_display(f"Connected to Tally - Company: {company_name}")
-            company_label.config(text=company_name, fg="#388e3c")
-        else:
-            # If company name extraction fails, just log it, do not block sync
-            update_log_display("Connected to Tally - Company name not found")
-            company_label.config(text="Connected (Unknown Company)", fg="#388e3c")
-
-        status_label.config(text="Fetching data from Tally...", fg="#2e7d32")
-        app.update_idletasks()
-        log("Tally connected. Fetching data...")
-        update_log_display("Fetching data from Tally...")
-
-        # Get and normalize date range
-        start_date_raw = from_date.get().strip()
-        end_date_raw = to_date.get().strip()
-        start_date = normalize_date(start_date_raw)
-        end_date = normalize_date(end_date_raw)
-        
-        update_log_display(f"UI selected date range: {start_date_raw} to {end_date_raw}")
-        log(f"Normalized date range sent to Tally: {start_date} to {end_date}")
-        
-        if not start_date or not end_date:
-            start_date = "20240401"
-            end_date = "20250630"
-        
-        update_log_display(f"Date range: {start_date} to {end_date}")
-
-        # Get sync type
-        sync_type = sync_type_var.get()
-        update_log_display(f"Sync type: {sync_type}")
-        
-        # Fetch data based on sync type
-        if sync_type == "vouchers_only":
-            all_transactions = fetch_all_registers(start_date, end_date)
-            data_type = "vouchers"
-        elif sync_type == "complete_data":
-            all_transactions = fetch_complete_tally_data(start_date, end_date)
-            data_type = "complete"
-        elif sync_type == "opening_balances_only":
-            all_transactions = fetch_ledger_opening_balances()
-            data_type = "opening_balances"
-        else:
-            all_transactions = fetch_all_registers(start_date, end_date)
-            data_type = "vouchers"
-
-        if all_transactions:
-            # Count vouchers by type for log
-            voucher_counts = {}
-            if data_type == "opening_balances":
-                update_log_display(f"Fetched {len(all_transactions)} opening balances")
-            else:
-                for txn in all_transactions:
-                    if isinstance(txn, dict):
-                        vtype = txn.get('voucher_type', 'Unknown')
-                    else:
-                        vtype = 'Unknown'
-                    voucher_counts[vtype] = voucher_counts.get(vtype, 0) + 1
-                update_log_display(f"Fetched {len(all_transactions)} records: {voucher_counts}")
-
-            # Convert to JSON for backend
-            all_data_json = json.dumps(all_transactions, indent=2, ensure_ascii=False)
+STATUS_COLORS = {"info": "#2e7d32", "success": "#388e3c", "warning": "#fbc02d", "error": "#d32f2f"}
 
-            status_label.config(text="Sending data to backend...", fg="#2e7d32")
-            app.update_idletasks()
-            log("Data fetched from Tally as JSON. Sending to backend...")
-            update_log_display("Sending data to backend...")
-            
-            # Only send API_KEY (SPI token) and data to backend, never company name
-            success = send_data_to_backend(api_key, data_type, all_data_json, is_json=True)
-
-            if success:
-                # Update sync history
-                sync_history["last_sync"] = datetime.datetime.now().isoformat()
-                sync_history["total_syncs"] += 1
-                sync_history["last_voucher_count"] = len(all_transactions)
-                save_sync_history(sync_history)
+def process_sync_events():
+    """Render events from the sync service; runs on the Tk thread every 200 ms."""
+    global sync_history
+    try:
+        while True:
+            event = sync_service.events.get_nowait()
+            kind = event["type"]
+            if kind == "status":
+                status_label.config(text=event["text"], fg=STATUS_COLORS.get(event["level"], "#2e7d32"))
+            elif kind == "log":
+                update_log_display(event["message"])
+            elif kind == "company":
+                if event["name"]:
+                    company_label.config(text=event["name"], fg="#388e3c")
+                else:
+                    company_label.config(text="Connected (Unknown Company)", fg="#388e3c")
+            elif kind == "started":
+                tt_sync.config(state='disabled')
+                progress.start(10)
+            elif kind == "finished":
+                progress.stop()
+                tt_sync.config(state='normal')
+                sync_history = event["history"]
                 update_status_display()
-                
-                messagebox.showinfo("Success", f"Data synced successfully!\nSynced {len(all_transactions)} records")
-                status_label.config(text="Data synced successfully!", fg="#388e3c")
-                log("Data synced to backend successfully.")
-                update_log_display("Data synced successfully!")
-            else:
-                messagebox.showerror("Error", "Failed to send data to backend.")
-                status_label.config(text="Sync failed. Check logs.", fg="#fbc02d")
-                log("Failed to sync data to backend.")
-                update_log_display("Failed to send data to backend")
-        else:
-            messagebox.showerror("Error", "No data fetched from Tally.")
-            status_label.config(text="No data fetched.", fg="#d32f2f")
-            log("No data fetched from Tally.")
-            update_log_display("No data fetched from Tally")
-            
-    except Exception as e:
-        messagebox.showerror("Error", f"Sync failed: {str(e)}")
-        status_label.config(text="Sync failed with error.", fg="#d32f2f")
-        log(f"Sync failed with error: {str(e)}")
-        update_log_display(f"Sync failed: {str(e)}")
-    finally:
-        progress.stop()
-        tt_sync.config(state='normal')
+                # Scheduled runs report in the log only; manual runs also get a dialog
+                if event["source"] == "manual":
+                    if event["ok"]:
+                        messagebox.showinfo("Success", event["message"])
+                    else:
+                        messagebox.showerror("Error", event["message"])
+            elif kind == "skipped" and event["source"] == "manual":
+                messagebox.showinfo("Sync in progress", "A sync is already running. Please wait for it to finish.")
+            elif kind == "schedule" and event["next_run"]:
+                update_log_display(f"Next automatic sync at {event['next_run'].strftime('%Y-%m-%d %H:%M')}")
+    except queue.Empty:
+        pass
+    app.after(200, process_sync_events)
 
 # Initialize GUI
 update_log_display("CFA Tally Sync Agent started")
@@ -541,6 +435,14 @@ else:
 # Update status display on startup
 update_status_display()
 
+if SYNC_INTERVAL_HOURS > 0:
+    window = f" between {SYNC_WINDOW}" if SYNC_WINDOW else ""
+    update_log_display(f"Automatic incremental sync every {SYNC_INTERVAL_HOURS:g} hours{window}")
+if CHANGE_POLL_SECONDS > 0:
+    update_log_display(f"Watching Tally for voucher changes every {CHANGE_POLL_SECONDS:g} seconds")
+sync_service.start()
+process_sync_events()
+
 app.mainloop()
 
 
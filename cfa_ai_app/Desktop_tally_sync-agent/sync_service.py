@@ -0,0 +1,388 @@
+import os
+import json
+import queue
+import random
+import datetime
+import threading
+from dateutil import parser
+from tally_connector import (
+    log, test_tally_connection, get_company_name, fetch_complete_tally_data,
+    fetch_ledger_opening_balances, fetch_all_registers, fetch_all_registers_delta, fetch_alter_ids
+)
+from api_connector import BackendError, send_data_to_backend, send_transactions_in_batches
+from voucher_cache import VoucherCache
+
+SYNC_HISTORY_FILE = "sync_history.json"
+
+# Hours between scheduled syncs; 0 turns the schedule off (manual syncs only)
+SYNC_INTERVAL_HOURS = float(os.getenv("SYNC_INTERVAL_HOURS", "2"))
+# Local time window scheduled syncs may run in, "HH:MM-HH:MM" (may wrap midnight); empty means any time
+SYNC_WINDOW = os.getenv("SYNC_WINDOW", "").strip()
+# Scheduled runs are shifted by a random delay up to this many minutes so agents don't sync in lockstep
+SYNC_JITTER_MINUTES = float(os.getenv("SYNC_JITTER_MINUTES", "10"))
+# Seconds between polls of Tally's alteration counters; 0 turns change detection off
+CHANGE_POLL_SECONDS = float(os.getenv("TALLY_CHANGE_POLL_SECONDS", "30"))
+# Minimum gap between change-triggered syncs; doubled after each failed one, up to the maximum
+CHANGE_MIN_INTERVAL_SECONDS = 60
+CHANGE_MAX_BACKOFF_SECONDS = 30 * 60
+# First date fetched when there is no watermark yet (config.env, YYYYMMDD)
+DEFAULT_START_DATE = os.getenv("SYNC_START_DATE", "20240401").strip() or "20240401"
+
+
+def load_sync_history(path=SYNC_HISTORY_FILE):
+    """Load sync history from file"""
+    history = {"last_sync": None, "total_syncs": 0, "last_voucher_count": 0, "watermarks": {}}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                history.update(json.load(f))
+        except:
+            pass
+    return history
+
+
+def save_sync_history(sync_data, path=SYNC_HISTORY_FILE):
+    """Save sync history to file"""
+    try:
+        with open(path, 'w') as f:
+            json.dump(sync_data, f, indent=2)
+    except Exception as e:
+        log(f"Failed to save sync history: {e}")
+
+
+def normalize_date(date_str):
+    try:
+        return parser.parse(date_str).strftime('%Y%m%d')
+    except Exception:
+        return date_str
+
+
+def parse_window(window):
+    """Parse "HH:MM-HH:MM" into (start, end) times; None for an empty or invalid window."""
+    if not window:
+        return None
+    try:
+        start, end = (datetime.datetime.strptime(part.strip(), "%H:%M").time() for part in window.split("-", 1))
+    except ValueError:
+        log(f"⚠️ Ignoring invalid SYNC_WINDOW {window!r}, expected HH:MM-HH:MM")
+        return None
+    return start, end
+
+
+class SyncSchedule:
+    """When scheduled syncs run: every interval_hours, inside an optional window, with jitter."""
+
+    def __init__(self, interval_hours=SYNC_INTERVAL_HOURS, window=SYNC_WINDOW, jitter_minutes=SYNC_JITTER_MINUTES):
+        self.interval = datetime.timedelta(hours=interval_hours) if interval_hours > 0 else None
+        self.window = parse_window(window) if isinstance(window, str) else window
+        self.jitter_seconds = max(0.0, jitter_minutes * 60)
+
+    @property
+    def enabled(self):
+        return self.interval is not None
+
+    def in_window(self, when):
+        if not self.window:
+            return True
+        start, end = self.window
+        now = when.time()
+        if start <= end:
+            return start <= now < end
+        # Window wraps midnight, e.g. 22:00-06:00
+        return now >= start or now < end
+
+    def _jitter(self):
+        return datetime.timedelta(seconds=random.uniform(0, self.jitter_seconds))
+
+    def _into_window(self, when):
+        if self.in_window(when):
+            return when
+        opens = datetime.datetime.combine(when.date(), self.window[0])
+        if opens <= when:
+            opens += datetime.timedelta(days=1)
+        return opens + self._jitter()
+
+    def first_run(self, last_sync, now):
+        """First scheduled run after start-up: one interval after the last sync, but not in the past."""
+        if not self.enabled:
+            return None
+        due = max(now, last_sync + self.interval) if last_sync else now
+        return self._into_window(due + self._jitter())
+
+    def next_run(self, after):
+        if not self.enabled:
+            return None
+        return self._into_window(after + self.interval + self._jitter())
+
+
+class SyncService:
+    """
+    Headless sync runner shared by the GUI and the scheduler.
+
+    Callers talk to it only through thread-safe queues: request_sync(), set_api_key() and
+    stop() put commands on `commands`; progress, results and history updates come back as
+    dicts on `events` (a "type" key plus data), which the GUI drains from its own thread.
+    Syncs run one at a time on a worker thread; a trigger that arrives while one is in
+    progress is skipped rather than queued behind it.
+
+    Between syncs the service polls Tally's alteration counters every poll_seconds and
+    starts an incremental sync as soon as the voucher or master counter differs from the
+    one recorded by the last successful sync. The first answered poll for a company only
+    records a baseline; the schedule covers anything changed before it.
+    """
+
+    def __init__(self, api_key="", schedule=None, history_path=SYNC_HISTORY_FILE, poll_seconds=CHANGE_POLL_SECONDS):
+        self.api_key = api_key
+        self.schedule = schedule or SyncSchedule()
+        self.history_path = history_path
+        self.history = load_sync_history(history_path)
+        self.commands = queue.Queue()
+        self.events = queue.Queue()
+        self.next_run = None
+        self.poll_seconds = poll_seconds
+        self._change_backoff = CHANGE_MIN_INTERVAL_SECONDS
+        self._change_not_before = None
+        self._busy = threading.Lock()
+        self._thread = None
+
+    # --- API used by the GUI (any thread) ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="sync-service", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self.commands.put({"type": "stop"})
+
+    def request_sync(self, sync_type="incremental", start_date=None, end_date=None, source="manual"):
+        self.commands.put({"type": "sync", "sync_type": sync_type, "start_date": start_date,
+                           "end_date": end_date, "source": source})
+
+    def set_api_key(self, api_key):
+        self.commands.put({"type": "api_key", "api_key": api_key})
+
+    @property
+    def running(self):
+        return self._busy.locked()
+
+    # --- service thread ---
+
+    def _emit(self, kind, **data):
+        data["type"] = kind
+        self.events.put(data)
+
+    def _status(self, text, level="info"):
+        self._emit("status", text=text, level=level)
+
+    def _log(self, message):
+        log(message)
+        self._emit("log", message=message)
+
+    def _last_sync_time(self):
+        try:
+            return datetime.datetime.fromisoformat(self.history["last_sync"])
+        except (TypeError, ValueError):
+            return None
+
+    def _loop(self):
+        self.next_run = self.schedule.first_run(self._last_sync_time(), datetime.datetime.now())
+        if self.next_run:
+            self._emit("schedule", next_run=self.next_run)
+        next_poll = datetime.datetime.now() if self.poll_seconds > 0 else None
+        while True:
+            timeout = 60.0
+            for due in (self.next_run, next_poll):
+                if due:
+                    timeout = min(timeout, max(0.5, (due - datetime.datetime.now()).total_seconds()))
+            try:
+                command = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                command = None
+            if command:
+                if command["type"] == "stop":
+                    break
+                if command["type"] == "api_key":
+                    self.api_key = command["api_key"]
+                elif command["type"] == "sync":
+                    self._start_sync(command)
+            now = datetime.datetime.now()
+            if self.next_run and now >= self.next_run:
+                self._start_sync({"type": "sync", "sync_type": "incremental", "source": "schedule"})
+                self.next_run = self.schedule.next_run(now)
+                self._emit("schedule", next_run=self.next_run)
+            if next_poll and now >= next_poll:
+                self._poll_changes(now)
+                next_poll = datetime.datetime.now() + datetime.timedelta(seconds=self.poll_seconds)
+
+    def _poll_changes(self, now):
+        """Start an incremental sync if Tally's voucher or master counter moved since the last synced one."""
+        if self.running or not self.api_key:
+            return
+        if self._change_not_before and now < self._change_not_before:
+            return
+        current = fetch_alter_ids()
+        if current is None:
+            # Counters unavailable (Tally closed, or an old release): never a reason to sync
+            return
+        synced = self.history.get("alter_ids") or {}
+        if synced.get("company") != current["company"] or not {"voucher", "master"} <= synced.keys():
+            baseline = dict(current, **synced) if synced.get("company") == current["company"] else current
+            self._log(f"Watching Tally changes from AltVchId {baseline['voucher']}, AltMstId {baseline['master']}")
+            self.history["alter_ids"] = baseline
+            save_sync_history(self.history, self.history_path)
+            return
+        changed = [f"{name} {synced[key]} -> {current[key]}"
+                   for key, name in (("voucher", "AltVchId"), ("master", "AltMstId")) if current[key] != synced[key]]
+        if not changed:
+            return
+        self._log(f"Tally data changed ({', '.join(changed)}), starting incremental sync")
+        self._change_not_before = now + datetime.timedelta(seconds=self._change_backoff)
+        # The counters that triggered the sync stand in if the sync cannot read them itself
+        self._start_sync({"type": "sync", "sync_type": "incremental", "source": "change", "alter_ids": current})
+
+    def _start_sync(self, request):
+        if not self._busy.acquire(blocking=False):
+            self._log(f"Sync already in progress, skipping {request['source']} {request['sync_type']} sync")
+            self._emit("skipped", source=request["source"])
+            return
+        threading.Thread(target=self._sync_worker, args=(request,), name="sync-worker", daemon=True).start()
+
+    def _sync_worker(self, request):
+        self._emit("started", source=request["source"], sync_type=request["sync_type"])
+        try:
+            ok, message, count = self._sync(request)
+        except Exception as e:
+            ok, message, count = False, f"Sync failed: {str(e)}", 0
+            self._status("Sync failed with error.", "error")
+            self._log(f"Sync failed with error: {str(e)}")
+        finally:
+            self._busy.release()
+        if request["source"] == "change":
+            # Back off while change-triggered syncs keep failing, e.g. when the backend is down
+            self._change_backoff = (CHANGE_MIN_INTERVAL_SECONDS if ok
+                                    else min(self._change_backoff * 2, CHANGE_MAX_BACKOFF_SECONDS))
+        self._emit("finished", source=request["source"], ok=ok, message=message, count=count,
+                   history=dict(self.history))
+
+    def _record_success(self, count, new_watermarks, alter_ids=None):
+        self.history["last_sync"] = datetime.datetime.now().isoformat()
+        self.history["total_syncs"] += 1
+        self.history["last_voucher_count"] = count
+        if new_watermarks is not None:
+            self.history["watermarks"] = new_watermarks
+        if alter_ids is not None:
+            self.history["alter_ids"] = alter_ids
+        save_sync_history(self.history, self.history_path)
+
+    def _synced_voucher_alter_id(self, alter_ids):
+        """
+        The AltVchId last synced for this company if vouchers changed since, else None.
+        The delta only re-reads recent dates, so edits behind the overlap are fetched by ALTERID.
+        """
+        synced = self.history.get("alter_ids") or {}
+        if not alter_ids or synced.get("company") != alter_ids["company"] or synced.get("voucher") is None:
+            return None
+        if alter_ids["voucher"] == synced["voucher"]:
+            return None
+        return synced["voucher"]
+
+    def _sync(self, request):
+        """Run one sync. Returns (ok, message, record_count)."""
+        sync_type = request["sync_type"]
+        self._log(f"Starting {request['source']} {sync_type} sync...")
+        if not self.api_key:
+            self._log("API Key not set. Sync aborted.")
+            return False, "API Key not set. Please enter or scan API Key first.", 0
+
+        self._status("Connecting to Tally...")
+        if not test_tally_connection():
+            self._status("Tally not connected.", "error")
+            self._log("Tally not connected. Sync aborted.")
+            return False, "Tally not connected. Please open Tally and load the company.", 0
+
+        # Get company name for logging/display only (never sent to backend)
+        company_name = get_company_name()
+        self._emit("company", name=company_name)
+        self._log(f"Connected to Tally - Company: {company_name}" if company_name
+                  else "Connected to Tally - Company name not found")
+
+        self._status("Fetching data from Tally...")
+        start_date = normalize_date((request.get("start_date") or "").strip()) or DEFAULT_START_DATE
+        end_date = normalize_date((request.get("end_date") or "").strip()) or datetime.date.today().strftime("%Y%m%d")
+        self._log(f"Date range: {start_date} to {end_date}, sync type: {sync_type}")
+
+        voucher_cache = None
+        try:
+            new_watermarks = None
+            alter_ids = None
+            if sync_type in ("incremental", "vouchers_only"):
+                voucher_cache = VoucherCache(company_name)
+            if sync_type == "incremental":
+                # Read before fetching so changes made during the sync trigger the next one
+                alter_ids = fetch_alter_ids() or request.get("alter_ids")
+                all_transactions, new_watermarks = fetch_all_registers_delta(
+                    self.history.get("watermarks", {}), start_date, end_date,
+                    company_name=company_name, cache=voucher_cache,
+                    since_alter_id=self._synced_voucher_alter_id(alter_ids)
+                )
+                data_type = "vouchers"
+            elif sync_type == "complete_data":
+                all_transactions = fetch_complete_tally_data(start_date, end_date, company_name=company_name)
+                data_type = "complete"
+            elif sync_type == "opening_balances_only":
+                all_transactions = fetch_ledger_opening_balances()
+                data_type = "opening_balances"
+            else:
+                voucher_cache = voucher_cache or VoucherCache(company_name)
+                all_transactions = fetch_all_registers(start_date, end_date, company_name=company_name, cache=voucher_cache)
+                data_type = "vouchers"
+
+            # Nothing new since the last upload is a successful sync, not an error
+            if not all_transactions and (new_watermarks is not None or (voucher_cache and voucher_cache.unchanged)):
+                self._record_success(0, new_watermarks, alter_ids)
+                self._status("Already up to date.", "success")
+                self._log("No new or altered vouchers since last sync")
+                return True, "Already up to date.", 0
+
+            if not all_transactions:
+                self._status("No data fetched.", "error")
+                self._log("No data fetched from Tally.")
+                return False, "No data fetched from Tally.", 0
+
+            if data_type == "opening_balances":
+                self._log(f"Fetched {len(all_transactions)} opening balances")
+            elif data_type == "vouchers":
+                voucher_counts = {}
+                for txn in all_transactions:
+                    vtype = getattr(txn, 'voucher_type', None) or 'Unknown'
+                    voucher_counts[vtype] = voucher_counts.get(vtype, 0) + 1
+                self._log(f"Fetched {len(all_transactions)} records: {voucher_counts}")
+
+            self._status("Sending data to backend...")
+            self._log("Data fetched from Tally. Sending to backend...")
+            # Only send API_KEY (SPI token) and data to backend, never company name
+            try:
+                if data_type == "vouchers":
+                    # Compressed, resumable batches; re-sent vouchers are updated in place
+                    send_transactions_in_batches(self.api_key, all_transactions)
+                else:
+                    # Serialized once, compactly, by the API connector
+                    send_data_to_backend(self.api_key, data_type, all_transactions, is_json=True)
+            except BackendError as e:
+                # Reported through the "finished" event; the GUI decides whether to show a dialog
+                if voucher_cache:
+                    voucher_cache.discard()
+                self._status("Sync failed. Check logs.", "warning")
+                self._log(f"Failed to send data to backend: {e.title}: {e.message}")
+                return False, f"Failed to send data to backend.\n{e.title}: {e.message}", 0
+
+            self._record_success(len(all_transactions), new_watermarks, alter_ids)
+            if voucher_cache:
+                voucher_cache.commit()
+            self._status("Data synced successfully!", "success")
+            self._log("Data synced to backend successfully.")
+            return True, f"Data synced successfully!\nSynced {len(all_transactions)} records", len(all_transactions)
+        finally:
+            if voucher_cache:
+                voucher_cache.close()
@@ -7,16 +7,20 @@ import sys
 import datetime
 from tkinter import messagebox
 import re
-import html
 from xml.etree import ElementTree as ET
 import time
 import socket
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from xml_sanitizer import sanitize_xml, iter_sanitized
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
 urllib3.disable_warnings(InsecureRequestWarning)
 
 try:
-    from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+    from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, RetryError
 except ImportError:
     from tkinter import Tk, messagebox
     root = Tk()
@@ -32,6 +36,10 @@ import re
 import html
 from dateutil import parser, rrule
 from datetime import timedelta
+from chunk_tuner import ChunkTuner
+from debug_capture import debug_capture
+from voucher_model import Voucher, KEEP_RAW_FIELDS
+from voucher_cache import voucher_key
 
 def print_log(msg, level="INFO"):
     """Terminal log printing for CLI feedback"""
@@ -73,38 +81,283 @@ RETRY_DELAY = 2
 CONNECTION_TIMEOUT = 15
 READ_TIMEOUT = 120
 
-def check_tally_service():
-    """Check if Tally service is running on the specified port."""
-    try:
-        url_parts = TALLY_URL.replace('http://', '').replace('https://', '')
-        host_port = url_parts.split('/')[0]
-        host = host_port.split(':')[0]
-        port = int(host_port.split(':')[1]) if ':' in host_port else 9000
-        
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(5)
-        result = sock.connect_ex((host, port))
-        sock.close()
-        
-        if result == 0:
-            log(f"✅ Tally service is running on {host}:{port}")
+# Streaming parse configuration
+STREAM_CHUNK_SIZE = 64 * 1024
+# Bytes of a streamed response kept for a debug capture if it fails to parse
+STREAM_CAPTURE_TAIL_BYTES = 1024 * 1024
+STREAM_VOUCHERS = os.getenv("TALLY_STREAM_VOUCHERS", "0").strip().lower() in ("1", "true", "yes")
+
+# Upper bound on concurrent report requests so Tally's single HTTP server is not flooded
+MAX_PARALLEL_REQUESTS = max(1, int(os.getenv("TALLY_MAX_PARALLEL", "4")))
+
+# Days re-read before each register's watermark so back-dated entries are picked up
+DELTA_OVERLAP_DAYS = int(os.getenv("TALLY_DELTA_OVERLAP_DAYS", "7"))
+
+# Seconds a successful probe or answered request keeps Tally marked as reachable
+LIVENESS_TTL = float(os.getenv("TALLY_LIVENESS_TTL", "30"))
+
+# Tally report name -> voucher type, in the order registers are fetched and returned
+VOUCHER_REPORTS = [
+    ("Sales Vouchers", "Sales"),
+    ("Purchase Vouchers", "Purchase"),
+    ("Payment Vouchers", "Payment"),
+    ("Receipt Vouchers", "Receipt"),
+    ("Journal Vouchers", "Journal"),
+    ("Credit Note Vouchers", "Credit Note"),
+    ("Debit Note Vouchers", "Debit Note"),
+]
+
+class TallyResponseError(requests.exceptions.RequestException):
+    """Tally answered, but not with a complete response (HTTP error or XML cut off mid-stream)."""
+
+def _tally_host_port(url):
+    url_parts = url.replace('http://', '').replace('https://', '')
+    host_port = url_parts.split('/')[0]
+    host = host_port.split(':')[0]
+    port = int(host_port.split(':')[1]) if ':' in host_port else 9000
+    return host, port
+
+class TallyClient:
+    """
+    Long-lived HTTP client for one Tally server.
+
+    Owns a keep-alive connection pool sized for MAX_PARALLEL_REQUESTS concurrent report
+    requests, so chunked syncs reuse TCP connections instead of opening one per request.
+    Liveness is cached for liveness_ttl seconds and refreshed by every answered request,
+    so the socket probe only runs when Tally has not been heard from recently.
+    """
+
+    def __init__(self, url=None, pool_size=None, liveness_ttl=LIVENESS_TTL):
+        self.url = url or os.getenv("TALLY_URL", "http://localhost:9000")
+        self.liveness_ttl = liveness_ttl
+        self.session = requests.Session()
+        # pool_block makes extra threads wait for a pooled connection rather than open new ones
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size or MAX_PARALLEL_REQUESTS, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({
+            'Content-Type': 'application/xml',
+            'User-Agent': 'TallyConnector/1.0',
+            'Connection': 'keep-alive'
+        })
+        self._lock = threading.Lock()
+        self._alive_until = 0.0
+
+    def _set_alive(self, alive):
+        with self._lock:
+            self._alive_until = time.monotonic() + self.liveness_ttl if alive else 0.0
+
+    def is_alive(self, force=False):
+        """Check that Tally accepts connections, trusting a recent answer unless force is set."""
+        if not force and time.monotonic() < self._alive_until:
             return True
-        else:
+        try:
+            host, port = _tally_host_port(self.url)
+            with socket.create_connection((host, port), timeout=5):
+                pass
+        except OSError:
             log(f"❌ Tally service is not running on {host}:{port}")
+            self._set_alive(False)
             return False
-    except Exception as e:
-        log(f"❌ Error checking Tally service: {e}")
-        return False
+        except Exception as e:
+            log(f"❌ Error checking Tally service: {e}")
+            return False
+        log(f"✅ Tally service is running on {host}:{port}")
+        self._set_alive(True)
+        return True
+
+    def post(self, xml_request, stream=False):
+        """POST an XML request over the pooled session and return the raw response."""
+        try:
+            response = self.session.post(
+                self.url,
+                data=xml_request.encode('utf-8'),
+                timeout=(CONNECTION_TIMEOUT, READ_TIMEOUT),
+                stream=stream
+            )
+        except requests.exceptions.ConnectionError:
+            self._set_alive(False)
+            raise
+        self._set_alive(True)
+        return response
+
+    def request(self, xml_request, stats=None):
+        """
+        Send an XML request and return the parsed response, or recoverable vouchers on XML error.
+        If a stats dict is given, 'bytes' is set to the size of the raw response and 'recovered'
+        to True when the vouchers were salvaged from a response that did not parse.
+        """
+        try:
+            response = self.post(xml_request)
+            if stats is not None:
+                stats['bytes'] = len(response.content)
+            if response.status_code == 200:
+                # Clean and parse XML
+                cleaned_xml = clean_xml_data(response.text)
+                try:
+                    parsed = xmltodict.parse(cleaned_xml)
+                    debug_capture.capture("tally_response", response.content)
+                    return parsed
+                except Exception as e:
+                    log(f"❌ XML Parse error: {e}")
+                    # Kept for manual review (see recover_failed_chunk_vouchers) in every capture mode but "off"
+                    debug_capture.capture("failed_chunk", response.content, failed=True)
+                    log(f"Raw response: {response.text[:500]}...")
+                    # --- Enhanced recovery: extract <VOUCHER> blocks ---
+                    voucher_blocks = re.findall(r'<VOUCHER[\s\S]*?</VOUCHER>', response.text)
+                    recovered = 0
+                    skipped = 0
+                    vouchers = []
+                    for vb in voucher_blocks:
+                        try:
+                            # Wrap in root for parsing
+                            xml_fragment = f'<?xml version="1.0" encoding="UTF-8"?><ENVELOPE>{vb}</ENVELOPE>'
+                            d = xmltodict.parse(xml_fragment)
+                            # Extract voucher dict
+                            v = d.get('ENVELOPE', {}).get('VOUCHER')
+                            if v:
+                                vouchers.append(v)
+                                recovered += 1
+                            else:
+                                skipped += 1
+                        except Exception as ve:
+                            skipped += 1
+                    log(f"[RECOVERY] Extracted {recovered} vouchers from malformed XML, skipped {skipped}.")
+                    if stats is not None:
+                        stats['recovered'] = True
+                    # Return as if it was a normal response
+                    return {'ENVELOPE': {'VOUCHER': vouchers}}
+            else:
+                log(f"❌ HTTP error: {response.status_code}")
+                log(f"Response: {response.text[:200]}...")
+                debug_capture.capture(f"tally_http_{response.status_code}", response.content, failed=True)
+                return None
+        except Exception as e:
+            log(f"❌ Request error: {e}")
+            raise
+
+    def iter_vouchers(self, xml_request, stats=None):
+        """
+        Send an XML request and yield each top-level VOUCHER as a dict while the response
+        is still arriving. Only the voucher currently being parsed is held in memory.
+        If a stats dict is given it is filled with 'bytes' and 'vouchers' counts.
+        Raises TallyResponseError on an HTTP error or a response that stops parsing part way,
+        after the vouchers before the break were yielded, so callers never mistake a truncated
+        stream for a complete one.
+        """
+        if stats is not None:
+            stats.update({'bytes': 0, 'vouchers': 0})
+        response = self.post(xml_request, stream=True)
+        kept = []
+        try:
+            if response.status_code != 200:
+                log(f"❌ HTTP error: {response.status_code}")
+                raise TallyResponseError(f"Tally returned HTTP {response.status_code}")
+            pull_parser = ET.XMLPullParser(events=('start', 'end', 'start-ns'))
+            ns_prefixes = {}
+            stack = []
+            voucher_depth = 0
+
+            def drain():
+                nonlocal voucher_depth
+                for event, item in pull_parser.read_events():
+                    if event == 'start-ns':
+                        prefix, uri = item
+                        ns_prefixes[uri] = prefix
+                    elif event == 'start':
+                        stack.append(item)
+                        if item.tag == 'VOUCHER':
+                            voucher_depth += 1
+                    else:
+                        stack.pop()
+                        if item.tag != 'VOUCHER':
+                            continue
+                        voucher_depth -= 1
+                        if voucher_depth:
+                            continue
+                        yield element_to_dict(item, ns_prefixes)
+                        # Detach the finished voucher so the partial tree never grows
+                        if stack:
+                            stack[-1].remove(item)
+                        item.clear()
+
+            # Keep the whole body only when this request is sampled; otherwise, if captures are
+            # on, just the last STREAM_CAPTURE_TAIL_BYTES so a parse error can be inspected
+            sampled = debug_capture.wants()
+            kept_bytes = 0
+
+            def counted(chunks):
+                nonlocal kept_bytes
+                for raw in chunks:
+                    if stats is not None:
+                        stats['bytes'] += len(raw)
+                    if sampled or debug_capture.enabled:
+                        kept.append(raw)
+                        kept_bytes += len(raw)
+                        while not sampled and kept_bytes - len(kept[0]) >= STREAM_CAPTURE_TAIL_BYTES:
+                            kept_bytes -= len(kept.pop(0))
+                    yield raw
+
+            # Sanitize while the bytes arrive; each chunk is decoded and scanned exactly once
+            raw_chunks = counted(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+            for cleaned in iter_sanitized(raw_chunks, response.encoding):
+                pull_parser.feed(cleaned)
+                for voucher in drain():
+                    if stats is not None:
+                        stats['vouchers'] += 1
+                    yield voucher
+            pull_parser.close()
+            for voucher in drain():
+                if stats is not None:
+                    stats['vouchers'] += 1
+                yield voucher
+            if sampled:
+                debug_capture.capture("tally_stream", b"".join(kept), force=True)
+        except ET.ParseError as e:
+            log(f"❌ Streaming XML parse error: {e}")
+            if debug_capture.enabled:
+                debug_capture.capture("tally_stream_tail", b"".join(kept), failed=True)
+            raise TallyResponseError(f"Tally response stopped parsing: {e}") from e
+        finally:
+            response.close()
+
+    def export_report(self, report_name, static_variables=None, stats=None):
+        """Export a Tally report by name, with optional STATICVARIABLES, as a parsed dict."""
+        variables = "".join(f"<{k}>{v}</{k}>" for k, v in (static_variables or {}).items())
+        xml_request = f"""
+        <ENVELOPE>
+            <HEADER>
+                <TALLYREQUEST>Export Data</TALLYREQUEST>
+            </HEADER>
+            <BODY>
+                <EXPORTDATA>
+                    <REQUESTDESC>
+                        <REPORTNAME>{report_name}</REPORTNAME>
+                        <STATICVARIABLES>{variables}</STATICVARIABLES>
+                    </REQUESTDESC>
+                </EXPORTDATA>
+            </BODY>
+        </ENVELOPE>
+        """
+        return self.request(xml_request, stats=stats)
+
+    def close(self):
+        self.session.close()
+
+_default_client = None
+_default_client_lock = threading.Lock()
 
-def create_session():
-    """Create a requests session with appropriate settings."""
-    session = requests.Session()
-    session.headers.update({
-        'Content-Type': 'application/xml',
-        'User-Agent': 'TallyConnector/1.0',
-        'Connection': 'keep-alive'
-    })
-    return session
+def get_tally_client():
+    """Return the process-wide TallyClient, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = TallyClient()
+        return _default_client
+
+def check_tally_service():
+    """Check if Tally service is running (cached for LIVENESS_TTL seconds)."""
+    return get_tally_client().is_alive()
 
 def test_tally_connection():
     """Test if Tally is reachable using a simple company info request."""
@@ -132,12 +385,7 @@ def test_tally_connection():
     
     try:
         log(f"Testing connection to {TALLY_URL}")
-        session = create_session()
-        response = session.post(
-            TALLY_URL, 
-            data=test_request.encode('utf-8'),
-            timeout=(CONNECTION_TIMEOUT, READ_TIMEOUT)
-        )
+        response = get_tally_client().post(test_request)
         
         log(f"Test response: status={response.status_code}, length={len(response.text)}")
         
@@ -161,94 +409,55 @@ def test_tally_connection():
     except Exception as e:
         log(f"❌ Unexpected error: {e}")
         return False
-    finally:
-        try:
-            session.close()
-        except:
-            pass
 
 def clean_xml_data(xml_str):
-    """Clean and fix XML data for proper parsing."""
-    if not xml_str:
-        return ""
-    
-    # Remove invalid XML characters
-    cleaned = re.sub(r'[^\x09\x0A\x0D\x20-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]', '', xml_str)
-    
-    # Unescape HTML entities
-    cleaned = html.unescape(cleaned)
-    
-    # Fix ampersands that are not part of entities
-    cleaned = re.sub(r'&(?!amp;|lt;|gt;|apos;|quot;)', '&amp;', cleaned)
-    
-    # Remove control characters
-    cleaned = re.sub(r'[\x00-\x08\x0B\x0C\x0E-\x1F]', '', cleaned)
-    
-    # Ensure XML declaration exists
-    if not cleaned.strip().startswith('<?xml'):
-        cleaned = '<?xml version="1.0" encoding="UTF-8"?>\n' + cleaned
-    
-    return cleaned
+    """Clean and fix XML data for proper parsing (single pass, see xml_sanitizer)."""
+    return sanitize_xml(xml_str)
 
 @retry(
     stop=stop_after_attempt(MAX_RETRIES),
     wait=wait_exponential(multiplier=1, min=RETRY_DELAY, max=10),
     retry=retry_if_exception_type((requests.exceptions.ConnectionError, requests.exceptions.Timeout))
 )
-def send_tally_request(xml_request):
-    """Send XML request to Tally and return parsed response or recoverable vouchers on XML error."""
-    url = os.getenv("TALLY_URL", "http://localhost:9000")
-    headers = {'Content-Type': 'application/xml'}
-    try:
-        response = requests.post(
-            url,
-            data=xml_request.encode('utf-8'),
-            headers=headers,
-            timeout=(CONNECTION_TIMEOUT, READ_TIMEOUT)
-        )
-        if response.status_code == 200:
-            # Save raw response for debugging
-            with open("raw_tally_response.xml", "w", encoding="utf-8") as f:
-                f.write(response.text)
-            # Clean and parse XML
-            cleaned_xml = clean_xml_data(response.text)
-            try:
-                return xmltodict.parse(cleaned_xml)
-            except Exception as e:
-                log(f"❌ XML Parse error: {e}")
-                log(f"Raw response: {response.text[:500]}...")
-                # --- Enhanced recovery: extract <VOUCHER> blocks ---
-                voucher_blocks = re.findall(r'<VOUCHER[\s\S]*?</VOUCHER>', response.text)
-                recovered = 0
-                skipped = 0
-                vouchers = []
-                for vb in voucher_blocks:
-                    try:
-                        # Wrap in root for parsing
-                        xml_fragment = f'<?xml version="1.0" encoding="UTF-8"?><ENVELOPE>{vb}</ENVELOPE>'
-                        d = xmltodict.parse(xml_fragment)
-                        # Extract voucher dict
-                        v = d.get('ENVELOPE', {}).get('VOUCHER')
-                        if v:
-                            vouchers.append(v)
-                            recovered += 1
-                        else:
-                            skipped += 1
-                    except Exception as ve:
-                        skipped += 1
-                log(f"[RECOVERY] Extracted {recovered} vouchers from malformed XML, skipped {skipped}.")
-                # Save failed chunk for manual review
-                with open("failed_chunk_raw.xml", "w", encoding="utf-8") as f:
-                    f.write(response.text)
-                # Return as if it was a normal response
-                return {'ENVELOPE': {'VOUCHER': vouchers}}
+def send_tally_request(xml_request, stats=None):
+    """
+    Send XML request to Tally and return parsed response or recoverable vouchers on XML error.
+    If a stats dict is given, 'bytes' is set to the size of the raw response.
+    """
+    return get_tally_client().request(xml_request, stats=stats)
+
+def _local_tag(tag, ns_prefixes):
+    """Turn ElementTree's '{uri}NAME' back into the 'PREFIX:NAME' form xmltodict uses."""
+    if tag.startswith('{'):
+        uri, name = tag[1:].split('}', 1)
+        prefix = ns_prefixes.get(uri)
+        return f"{prefix}:{name}" if prefix else name
+    return tag
+
+def element_to_dict(elem, ns_prefixes=None):
+    """Convert an ElementTree element into the same dict shape xmltodict.parse produces."""
+    ns_prefixes = ns_prefixes or {}
+    node = {f"@{_local_tag(k, ns_prefixes)}": v for k, v in elem.attrib.items()}
+    for child in elem:
+        key = _local_tag(child.tag, ns_prefixes)
+        value = element_to_dict(child, ns_prefixes)
+        if key in node:
+            if isinstance(node[key], list):
+                node[key].append(value)
+            else:
+                node[key] = [node[key], value]
         else:
-            log(f"❌ HTTP error: {response.status_code}")
-            log(f"Response: {response.text[:200]}...")
-            return None
-    except Exception as e:
-        log(f"❌ Request error: {e}")
-        raise
+            node[key] = value
+    text = (elem.text or '').strip()
+    if text:
+        if not node:
+            return text
+        node['#text'] = text
+    return node or None
+
+def iter_tally_vouchers(xml_request, stats=None):
+    """Stream the VOUCHERs of a Tally response as dicts (see TallyClient.iter_vouchers)."""
+    yield from get_tally_client().iter_vouchers(xml_request, stats=stats)
 
 def get_company_name():
     """Get the currently open company name from Tally using Company Info or fallback to custom TDL."""
@@ -390,12 +599,9 @@ def fetch_all_vouchers_by_daybook(start_date, end_date):
     
     return all_vouchers
 
-def fetch_vouchers_by_type(report_name, start_date, end_date):
-    """
-    Fetch vouchers of a specific type using the correct Tally report name (e.g., 'Sales Vouchers').
-    Returns a list of voucher dicts.
-    """
-    xml_request = f"""
+def build_voucher_report_request(report_name, start_date, end_date):
+    """Build the Export Data envelope for a voucher register report over a date range."""
+    return f"""
     <ENVELOPE>
         <HEADER>
             <TALLYREQUEST>Export Data</TALLYREQUEST>
@@ -414,56 +620,246 @@ def fetch_vouchers_by_type(report_name, start_date, end_date):
         </BODY>
     </ENVELOPE>
     """
+
+def iter_vouchers_by_type(report_name, start_date, end_date, stats=None):
+    """
+    Stream vouchers of a specific report one dict at a time (flat memory use).
+    Raises TallyResponseError if the response fails or is cut off (see TallyClient.iter_vouchers).
+    """
+    xml_request = build_voucher_report_request(report_name, start_date, end_date)
+    log(f"Streaming vouchers from report '{report_name}' for {start_date} to {end_date}")
+    yield from iter_tally_vouchers(xml_request, stats=stats)
+
+def fetch_vouchers_by_type(report_name, start_date, end_date, stream=None, stats=None):
+    """
+    Fetch vouchers of a specific type using the correct Tally report name (e.g., 'Sales Vouchers').
+    Raises TallyResponseError if Tally does not answer the request with a report.
+    With stream=True (default from TALLY_STREAM_VOUCHERS) this returns iter_vouchers_by_type's
+    generator, so a consumer that handles one voucher at a time never holds the register;
+    otherwise it returns a list of voucher dicts.
+    If a stats dict is given it is filled with 'bytes' and 'vouchers' counts (once the
+    generator is exhausted, when streaming).
+    """
+    if stream is None:
+        stream = STREAM_VOUCHERS
+    if stream:
+        return iter_vouchers_by_type(report_name, start_date, end_date, stats=stats)
+    xml_request = build_voucher_report_request(report_name, start_date, end_date)
     log(f"Fetching vouchers from report '{report_name}' for {start_date} to {end_date}")
-    result = send_tally_request(xml_request)
-    if not result:
-        log(f"❌ No response from Tally for {report_name}")
-        return []
+    result = send_tally_request(xml_request, stats=stats)
+    if result is None:
+        # An HTTP error must not pass for an empty window: delta watermarks would skip it
+        raise TallyResponseError(f"No response from Tally for {report_name} {start_date}-{end_date}")
     vouchers = extract_vouchers_from_response(result)
+    if stats is not None:
+        stats['vouchers'] = len(vouchers)
     log(f"✅ Extracted {len(vouchers)} vouchers from {report_name}")
     return vouchers
 
-def fetch_vouchers_by_type_chunked(report_name, start_date, end_date, chunk_days=30):
+def split_date_range(start_date, end_date, chunk_days=30):
+    """Split an inclusive date range into [(chunk_start, chunk_end), ...] as YYYYMMDD strings."""
+    start = parser.parse(start_date)
+    end = parser.parse(end_date)
+    windows = []
+    while start <= end:
+        chunk_end = min(start + timedelta(days=chunk_days-1), end)
+        windows.append((start.strftime('%Y%m%d'), chunk_end.strftime('%Y%m%d')))
+        start = chunk_end + timedelta(days=1)
+    return windows
+
+def _note_recovered(report_name, chunk_start, chunk_end, stats, incomplete):
+    if stats.get('recovered'):
+        log(f"⚠️ {report_name} chunk {chunk_start}-{chunk_end} was only partly recovered")
+        if incomplete is not None:
+            incomplete.add(report_name)
+
+def _fetch_window(report_name, chunk_start, chunk_end, incomplete=None):
+    log(f"Fetching {report_name} chunk: {chunk_start} to {chunk_end}")
+    stats = {}
+    # A chunk is returned as a list, so a streamed one is collected here, one window at a time
+    vouchers = list(fetch_vouchers_by_type(report_name, chunk_start, chunk_end, stats=stats))
+    _note_recovered(report_name, chunk_start, chunk_end, stats, incomplete)
+    log(f"Chunk {chunk_start}-{chunk_end}: {len(vouchers)} vouchers")
+    return vouchers
+
+def _fetch_window_adaptive(report_name, chunk_start, chunk_end, tuner, incomplete=None):
+    """
+    Fetch one window and report its size and latency to the tuner, which resizes the
+    report's next windows. Returns None if the window failed and should be fetched again
+    in smaller pieces; a failure of a single-day window is raised. A window whose vouchers
+    were only partly recovered adds report_name to the incomplete set, if one is given.
+    """
+    start = parser.parse(chunk_start)
+    end = parser.parse(chunk_end)
+    days = (end - start).days + 1
+    stats = {}
+    log(f"Fetching {report_name} chunk: {chunk_start} to {chunk_end} ({days} days)")
+    started = time.monotonic()
+    try:
+        vouchers = list(fetch_vouchers_by_type(report_name, chunk_start, chunk_end, stats=stats))
+        ok = True
+    except (requests.exceptions.RequestException, RetryError) as e:
+        if days <= 1:
+            raise
+        log(f"⚠️ {report_name} chunk {chunk_start}-{chunk_end} failed ({e}), splitting window")
+        vouchers = None
+        ok = False
+    elapsed = time.monotonic() - started
+    tuner.record(report_name, days, elapsed, stats.get('bytes', 0), stats.get('vouchers', 0), ok=ok)
+    if ok and tuner.is_slow(elapsed):
+        log(f"⚠️ {report_name} chunk {chunk_start}-{chunk_end} took {elapsed:.1f}s, "
+            f"cutting the rest in {tuner.chunk_days(report_name)}-day chunks")
+    if ok:
+        _note_recovered(report_name, chunk_start, chunk_end, stats, incomplete)
+        log(f"Chunk {chunk_start}-{chunk_end}: {len(vouchers)} vouchers, {stats.get('bytes', 0)} bytes in {elapsed:.1f}s")
+    return vouchers
+
+def fetch_registers_adaptive(ranges, tuner, max_workers=None, incomplete=None):
+    """
+    Fetch {report_name: (start_date, end_date)} with at most max_workers requests in flight,
+    cutting each report's next window only when a worker is free, at the tuner's current size.
+    A slow window therefore shrinks the rest of its report's range within this run and fast
+    ones widen it. A failed window goes back to be cut again at the (halved) size.
+    Returns {report_name: [vouchers]}, each list in date order; see fetch_voucher_registers
+    for incomplete.
+    """
+    pending = {}
+    for name, (start_date, end_date) in ranges.items():
+        start, end = parser.parse(start_date), parser.parse(end_date)
+        pending[name] = deque([(start, end)] if start <= end else [])
+    fetched = {name: [] for name in ranges}
+    cond = threading.Condition()
+    state = {'in_flight': 0, 'error': None}
+
+    def cut_window():
+        for name, queue in pending.items():
+            if queue:
+                start, end = queue.popleft()
+                cut = min(end, start + timedelta(days=tuner.chunk_days(name) - 1))
+                if cut < end:
+                    queue.appendleft((cut + timedelta(days=1), end))
+                return name, start, cut
+        return None
+
+    def work():
+        while True:
+            with cond:
+                window = cut_window()
+                # Nothing left to cut, but a window in flight may fail and come back
+                while window is None and state['in_flight'] and state['error'] is None:
+                    cond.wait()
+                    window = cut_window()
+                if window is None or state['error'] is not None:
+                    if window is not None:
+                        pending[window[0]].appendleft(window[1:])
+                    cond.notify_all()
+                    return
+                state['in_flight'] += 1
+            name, start, end = window
+            try:
+                vouchers = _fetch_window_adaptive(name, start.strftime('%Y%m%d'), end.strftime('%Y%m%d'),
+                                                  tuner, incomplete)
+            except BaseException as e:
+                with cond:
+                    state['in_flight'] -= 1
+                    state['error'] = state['error'] or e
+                    cond.notify_all()
+                return
+            with cond:
+                state['in_flight'] -= 1
+                if vouchers is None:
+                    pending[name].appendleft((start, end))
+                else:
+                    fetched[name].append((start, vouchers))
+                cond.notify_all()
+
+    workers = max(1, max_workers or MAX_PARALLEL_REQUESTS)
+    if workers == 1:
+        work()
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tally-fetch") as pool:
+            for future in [pool.submit(work) for _ in range(workers)]:
+                future.result()
+    if state['error'] is not None:
+        raise state['error']
+    registers = {}
+    for name, chunks in fetched.items():
+        chunks.sort(key=lambda chunk: chunk[0])
+        registers[name] = [voucher for _, vouchers in chunks for voucher in vouchers]
+    return registers
+
+def fetch_voucher_windows(windows, max_workers=None, fetch_window=None):
+    """
+    Fetch a list of (report_name, start_date, end_date) windows with at most max_workers
+    requests in flight. Returns one voucher list per window, in the same order as windows.
+    """
+    fetch_window = fetch_window or _fetch_window
+    max_workers = max(1, min(max_workers or MAX_PARALLEL_REQUESTS, len(windows) or 1))
+    if max_workers == 1:
+        return [fetch_window(*window) for window in windows]
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tally-fetch")
+    try:
+        futures = [pool.submit(fetch_window, *window) for window in windows]
+        return [future.result() for future in futures]
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def fetch_vouchers_by_type_chunked(report_name, start_date, end_date, chunk_days=30, max_workers=None):
     """
     Fetch vouchers of a specific type in chunks to avoid Tally timeouts.
+    Chunks are fetched concurrently but returned in date order.
     Returns a list of voucher dicts.
     """
-    start = parser.parse(start_date)
-    end = parser.parse(end_date)
+    windows = [(report_name, s, e) for s, e in split_date_range(start_date, end_date, chunk_days)]
     all_vouchers = []
-    chunk_count = 0
-    while start <= end:
-        chunk_start = start
-        chunk_end = min(start + timedelta(days=chunk_days-1), end)
-        chunk_start_str = chunk_start.strftime('%Y%m%d')
-        chunk_end_str = chunk_end.strftime('%Y%m%d')
-        log(f"Fetching {report_name} chunk: {chunk_start_str} to {chunk_end_str}")
-        vouchers = fetch_vouchers_by_type(report_name, chunk_start_str, chunk_end_str)
+    for vouchers in fetch_voucher_windows(windows, max_workers=max_workers):
         all_vouchers.extend(vouchers)
-        log(f"Chunk {chunk_start_str}-{chunk_end_str}: {len(vouchers)} vouchers")
-        start = chunk_end + timedelta(days=1)
-        chunk_count += 1
     log(f"✅ Total {report_name} vouchers fetched in chunks: {len(all_vouchers)}")
     return all_vouchers
 
-def fetch_all_7_voucher_types(start_date, end_date, chunk_days=30):
+def fetch_voucher_registers(start_date, end_date, chunk_days=None, max_workers=None, reports=None,
+                            company_name=None, start_dates=None, incomplete=None):
+    """
+    Fetch every (report, chunk) window of the voucher registers through one bounded pool.
+    With chunk_days=None each report's chunk size starts from the company's learned tuning
+    (see chunk_tuner.ChunkTuner) and is adjusted window by window (fetch_registers_adaptive).
+    start_dates optionally overrides start_date per report name.
+    Returns {report_name: [vouchers]} in VOUCHER_REPORTS order, each list in date order.
+    A window that still fails after retries and splitting raises; if incomplete is a set, the
+    names of reports with a window that was only partly recovered from bad XML are added to it.
+    """
+    report_names = [name for name, _ in VOUCHER_REPORTS] if reports is None else list(reports)
+    start_dates = start_dates or {}
+    if chunk_days is None:
+        tuner = ChunkTuner(company_name)
+        ranges = {name: (start_dates.get(name, start_date), end_date) for name in report_names}
+        log(f"Fetching {len(ranges)} registers in adaptive chunks with up to "
+            f"{max_workers or MAX_PARALLEL_REQUESTS} parallel requests")
+        try:
+            return fetch_registers_adaptive(ranges, tuner, max_workers=max_workers, incomplete=incomplete)
+        finally:
+            tuner.save()
+    windows = []
+    for name in report_names:
+        windows.extend((name, s, e) for s, e in split_date_range(start_dates.get(name, start_date), end_date, chunk_days))
+    log(f"Fetching {len(windows)} register chunks with up to {max_workers or MAX_PARALLEL_REQUESTS} parallel requests")
+    results = fetch_voucher_windows(windows, max_workers=max_workers,
+                                    fetch_window=lambda name, s, e: _fetch_window(name, s, e, incomplete))
+    registers = {name: [] for name in report_names}
+    for (name, _, _), vouchers in zip(windows, results):
+        registers[name].extend(vouchers)
+    return registers
+
+def fetch_all_7_voucher_types(start_date, end_date, chunk_days=None, max_workers=None, company_name=None):
     """
     Fetch all 7 accounting voucher types using the correct report names, in chunks.
     Returns a list of all vouchers (dicts) for the date range.
     """
-    report_map = [
-        ("Sales Vouchers", "Sales"),
-        ("Purchase Vouchers", "Purchase"),
-        ("Payment Vouchers", "Payment"),
-        ("Receipt Vouchers", "Receipt"),
-        ("Journal Vouchers", "Journal"),
-        ("Credit Note Vouchers", "Credit Note"),
-        ("Debit Note Vouchers", "Debit Note"),
-    ]
+    registers = fetch_voucher_registers(start_date, end_date, chunk_days=chunk_days, max_workers=max_workers,
+                                        company_name=company_name)
     all_vouchers = []
     type_counts = {}
-    for report_name, vtype in report_map:
-        vouchers = fetch_vouchers_by_type_chunked(report_name, start_date, end_date, chunk_days=chunk_days)
+    for report_name, vouchers in registers.items():
         for voucher in vouchers:
             if isinstance(voucher, dict):
                 voucher_type = voucher.get('VOUCHERTYPENAME', '').strip()
@@ -473,12 +869,13 @@ def fetch_all_7_voucher_types(start_date, end_date, chunk_days=30):
     log(f"✅ Total vouchers extracted: {len(all_vouchers)} by type: {type_counts}")
     return all_vouchers
 
-def fetch_accounting_vouchers_only(start_date, end_date, chunk_days=30):
+def fetch_accounting_vouchers_only(start_date, end_date, chunk_days=None, max_workers=None, company_name=None):
     """
     Fetch only the 7 accounting voucher types using the correct report names, in chunks.
     Returns a list of voucher dicts.
     """
-    return fetch_all_7_voucher_types(start_date, end_date, chunk_days=chunk_days)
+    return fetch_all_7_voucher_types(start_date, end_date, chunk_days=chunk_days, max_workers=max_workers,
+                                     company_name=company_name)
 
 def fetch_ledger_opening_balances():
     """Fetch opening balances for all ledgers."""
@@ -557,23 +954,23 @@ def fetch_ledger_opening_balances():
     
     log(f"✅ Extracted {len(opening_balances)} ledger opening balances")
     
-    # Save to file for debugging
-    with open("opening_balances.json", "w", encoding="utf-8") as f:
-        json.dump(opening_balances, f, indent=2, ensure_ascii=False)
+    # Keep a copy for debugging when captures are enabled
+    debug_capture.capture("opening_balances", opening_balances)
     
     return opening_balances
 
-def fetch_complete_tally_data(start_date, end_date):
+def fetch_complete_tally_data(start_date, end_date, company_name=None):
     """Fetch complete Tally data: vouchers + opening balances."""
     log(f"🔍 Fetching complete Tally data from {start_date} to {end_date}")
     try:
+        company_name = company_name or get_company_name()
         # Fetch accounting vouchers (7 types)
-        accounting_vouchers = fetch_accounting_vouchers_only(start_date, end_date)
+        accounting_vouchers = fetch_accounting_vouchers_only(start_date, end_date, company_name=company_name)
         # Fetch opening balances
         opening_balances = fetch_ledger_opening_balances()
         # Prepare complete data structure (company_name only for local use, not for backend)
         complete_data = {
-            "company_name": get_company_name(),  # For local/logging only
+            "company_name": company_name,  # For local/logging only
             "date_range": {
                 "from_date": start_date,
                 "to_date": end_date
@@ -586,9 +983,8 @@ def fetch_complete_tally_data(start_date, end_date):
             "accounting_vouchers": accounting_vouchers,
             "opening_balances": opening_balances
         }
-        # Save complete data to file
-        with open("complete_tally_data.json", "w", encoding="utf-8") as f:
-            json.dump(complete_data, f, indent=2, ensure_ascii=False)
+        # Keep a copy for debugging when captures are enabled
+        debug_capture.capture("complete_tally_data", complete_data)
         log(f"✅ Complete data export finished:")
         log(f"   - Vouchers: {len(accounting_vouchers)}")
         log(f"   - Opening Balances: {len(opening_balances)}")
@@ -668,36 +1064,220 @@ def extract_ledger_entries_from_voucher(voucher):
         })
     return entries
 
-def fetch_all_registers(start_date, end_date):
-    """Enhanced function to fetch all 7 accounting voucher types, including all ledger entries."""
-    accounting_vouchers = fetch_accounting_vouchers_only(start_date, end_date)
-    transactions = []
-    required_fields = ["party_name", "voucher_no", "voucher_type", "date", "amount", "ledger_entries"]
-    for voucher in accounting_vouchers:
-        if isinstance(voucher, dict):
-            vtype = voucher.get('VOUCHERTYPENAME', '').strip()
-            voucher_number = voucher.get('VOUCHERNUMBER', '')
-            narration = voucher.get('NARRATION', '')
-            date = voucher.get('DATE', '')
-            # Extract all ledger entries (credit/debit splits)
-            ledger_entries = extract_ledger_entries_from_voucher(voucher)
-            # --- Ensure all required fields are present ---
-            txn = {
-                'voucher_type': vtype,
-                'voucher_no': voucher_number,
-                'date': date,
-                'amount': voucher.get('AMOUNT', ''),
-                'party_name': voucher.get('PARTYNAME', ''),
-                'ledger_entries': ledger_entries,
-                'narration': narration,
-                'voucher_all_fields': voucher
-            }
-            # Fill missing required fields with empty values
-            for field in required_fields:
-                if field not in txn:
-                    txn[field] = '' if field != 'ledger_entries' else []
-            transactions.append(txn)
-    return transactions
+def vouchers_to_transactions(vouchers, keep_raw=KEEP_RAW_FIELDS):
+    """
+    Parse raw voucher dicts into voucher_model.Voucher records, the transactions the backend
+    expects. The xmltodict dicts are only kept on the records when keep_raw is set.
+    """
+    return [Voucher.from_tally(voucher, keep_raw) for voucher in vouchers if isinstance(voucher, dict)]
+
+def _drop_unchanged(transactions, cache):
+    if cache is None:
+        return transactions
+    changed = cache.filter_changed(transactions)
+    log(f"Voucher cache: {len(changed)} of {len(transactions)} vouchers are new or modified")
+    return changed
+
+def fetch_all_registers(start_date, end_date, company_name=None, cache=None):
+    """
+    Enhanced function to fetch all 7 accounting voucher types, including all ledger entries.
+    If a voucher_cache.VoucherCache is given, vouchers unchanged since the last upload are dropped.
+    """
+    transactions = vouchers_to_transactions(
+        fetch_accounting_vouchers_only(start_date, end_date, company_name=company_name)
+    )
+    return _drop_unchanged(transactions, cache)
+
+def voucher_alter_id(voucher):
+    """Return a voucher's ALTERID (Tally's change counter) as an int, or 0 if absent."""
+    try:
+        return int(str(voucher.get('ALTERID') or '0').strip())
+    except (TypeError, ValueError):
+        return 0
+
+# Current company's alteration counters. Tally bumps AltVchId whenever any voucher is created,
+# altered or deleted (AltMstId likewise for masters), so this tiny request detects changes
+ALTER_ID_REQUEST = """
+<ENVELOPE>
+    <HEADER>
+        <VERSION>1</VERSION>
+        <TALLYREQUEST>Export</TALLYREQUEST>
+        <TYPE>Collection</TYPE>
+        <ID>CFACompanyAlterIds</ID>
+    </HEADER>
+    <BODY>
+        <DESC>
+            <STATICVARIABLES>
+                <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
+            </STATICVARIABLES>
+            <TDL>
+                <TDLMESSAGE>
+                    <COLLECTION NAME="CFACompanyAlterIds" ISMODIFY="No">
+                        <TYPE>Company</TYPE>
+                        <FETCH>Name, AltVchId, AltMstId</FETCH>
+                        <FILTER>CFAIsCurrentCompany</FILTER>
+                    </COLLECTION>
+                    <SYSTEM TYPE="Formulae" NAME="CFAIsCurrentCompany">$Name = ##SVCurrentCompany</SYSTEM>
+                </TDLMESSAGE>
+            </TDL>
+        </DESC>
+    </BODY>
+</ENVELOPE>
+"""
+
+def _find_company_node(obj):
+    if isinstance(obj, dict):
+        if 'ALTVCHID' in obj:
+            return obj
+        for value in obj.values():
+            found = _find_company_node(value)
+            if found is not None:
+                return found
+    elif isinstance(obj, list):
+        for item in obj:
+            found = _find_company_node(item)
+            if found is not None:
+                return found
+    return None
+
+def _node_text(value):
+    if isinstance(value, dict):
+        value = value.get('#text')
+    return str(value or '').strip()
+
+def fetch_alter_ids():
+    """
+    Read the current company's alteration counters, cheap enough to poll every few seconds.
+    Returns {'company', 'voucher', 'master'} or None if Tally did not answer.
+    """
+    # Bypasses request()'s logging and debug captures: a closed Tally would otherwise flood the log
+    try:
+        response = get_tally_client().post(ALTER_ID_REQUEST)
+        if response.status_code != 200:
+            return None
+        data = xmltodict.parse(clean_xml_data(response.text))
+    except Exception:
+        return None
+    company = _find_company_node(data)
+    if company is None:
+        return None
+    try:
+        return {
+            'company': _node_text(company.get('NAME')) or company.get('@NAME', ''),
+            'voucher': int(_node_text(company.get('ALTVCHID')) or 0),
+            'master': int(_node_text(company.get('ALTMSTID')) or 0),
+        }
+    except ValueError:
+        return None
+
+# Accounting vouchers whose ALTERID is above {since}, whatever their date: an edit to an old
+# voucher bumps its ALTERID but falls outside the date windows fetch_all_registers_delta re-reads
+ALTERED_VOUCHERS_REQUEST = """
+<ENVELOPE>
+    <HEADER>
+        <VERSION>1</VERSION>
+        <TALLYREQUEST>Export</TALLYREQUEST>
+        <TYPE>Collection</TYPE>
+        <ID>CFAAlteredVouchers</ID>
+    </HEADER>
+    <BODY>
+        <DESC>
+            <STATICVARIABLES>
+                <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
+            </STATICVARIABLES>
+            <TDL>
+                <TDLMESSAGE>
+                    <COLLECTION NAME="CFAAlteredVouchers" ISMODIFY="No">
+                        <TYPE>Voucher</TYPE>
+                        <FETCH>Date, GUID, AlterID, VoucherTypeName, VoucherNumber, PartyName, PartyLedgerName, Narration, Amount</FETCH>
+                        <FETCH>AllLedgerEntries.LedgerName, AllLedgerEntries.Amount, AllLedgerEntries.IsDeemedPositive</FETCH>
+                        <FILTER>CFAAlteredSince, CFAIsRegisterVoucher</FILTER>
+                    </COLLECTION>
+                    <SYSTEM TYPE="Formulae" NAME="CFAAlteredSince">$AlterID > {since}</SYSTEM>
+                    <SYSTEM TYPE="Formulae" NAME="CFAIsRegisterVoucher">$$IsSales:$VoucherTypeName OR $$IsPurchase:$VoucherTypeName OR $$IsPayment:$VoucherTypeName OR $$IsReceipt:$VoucherTypeName OR $$IsJournal:$VoucherTypeName OR $$IsCreditNote:$VoucherTypeName OR $$IsDebitNote:$VoucherTypeName</SYSTEM>
+                </TDLMESSAGE>
+            </TDL>
+        </DESC>
+    </BODY>
+</ENVELOPE>
+"""
+
+def fetch_altered_vouchers(since_alter_id):
+    """
+    Fetch every accounting voucher whose ALTERID is above since_alter_id, regardless of its date.
+    Returns raw voucher dicts. Raises TallyResponseError if the response fails or is cut off,
+    so the caller never records AltVchId as synced without these vouchers.
+    """
+    xml_request = ALTERED_VOUCHERS_REQUEST.replace('{since}', str(int(since_alter_id)))
+    log(f"Fetching vouchers altered after ALTERID {since_alter_id}")
+    vouchers = [voucher for voucher in iter_tally_vouchers(xml_request) if isinstance(voucher, dict)]
+    log(f"✅ {len(vouchers)} vouchers altered after ALTERID {since_alter_id}")
+    return vouchers
+
+def fetch_all_registers_delta(watermarks, default_start_date, end_date, overlap_days=DELTA_OVERLAP_DAYS,
+                              company_name=None, cache=None, since_alter_id=None):
+    """
+    Fetch only vouchers created or altered since the last sync.
+
+    watermarks maps report name -> {"last_date": "YYYYMMDD", "last_alter_id": int}. Each register
+    is re-read from overlap_days before its last_date (or default_start_date if it has no
+    watermark yet) and vouchers whose ALTERID is not above last_alter_id are dropped.
+    If a voucher_cache.VoucherCache is given, vouchers unchanged since the last upload are dropped.
+    Returns (transactions, new_watermarks); persist new_watermarks only after a successful upload.
+
+    A watermark only advances when every window of its register was fetched completely: a
+    window that fails raises (nothing advances), and a register with a window only partly
+    recovered from bad XML keeps its previous watermark, so it is re-read next time.
+
+    If since_alter_id (the company AltVchId last synced) is given, vouchers altered after it are
+    also fetched by ALTERID whatever their date (fetch_altered_vouchers), so edits to vouchers
+    older than the overlap are not missed.
+    """
+    watermarks = watermarks or {}
+    start_dates = {}
+    for report_name, _ in VOUCHER_REPORTS:
+        mark = watermarks.get(report_name) or {}
+        if mark.get('last_date'):
+            start = parser.parse(mark['last_date']) - timedelta(days=overlap_days)
+            start_dates[report_name] = max(start, parser.parse(default_start_date)).strftime('%Y%m%d')
+        log(f"{report_name}: delta from {start_dates.get(report_name, default_start_date)} "
+            f"(after ALTERID {mark.get('last_alter_id', 0)})")
+    incomplete = set()
+    registers = fetch_voucher_registers(default_start_date, end_date, company_name=company_name,
+                                        start_dates=start_dates, incomplete=incomplete)
+    changed = []
+    new_watermarks = {}
+    for report_name, vouchers in registers.items():
+        mark = watermarks.get(report_name) or {}
+        last_alter_id = int(mark.get('last_alter_id') or 0)
+        last_date = mark.get('last_date') or ''
+        kept = 0
+        for voucher in vouchers:
+            if not isinstance(voucher, dict):
+                continue
+            alter_id = voucher_alter_id(voucher)
+            # Without an ALTERID we cannot tell whether it changed, so resend it
+            if alter_id and alter_id <= last_alter_id:
+                continue
+            changed.append(voucher)
+            kept += 1
+        log(f"{report_name}: {kept} of {len(vouchers)} vouchers changed since last sync")
+        if report_name in incomplete:
+            log(f"⚠️ {report_name}: keeping the previous watermark, some vouchers could not be read")
+            new_watermarks[report_name] = dict(mark)
+            continue
+        for voucher in vouchers:
+            if isinstance(voucher, dict):
+                last_alter_id = max(last_alter_id, voucher_alter_id(voucher))
+                last_date = max(last_date, str(voucher.get('DATE') or '').strip())
+        new_watermarks[report_name] = {"last_date": last_date, "last_alter_id": last_alter_id}
+    if since_alter_id is not None:
+        seen = {voucher_key(voucher) for voucher in changed}
+        altered = [voucher for voucher in fetch_altered_vouchers(since_alter_id) if voucher_key(voucher) not in seen]
+        log(f"{len(altered)} vouchers altered outside the delta windows")
+        changed.extend(altered)
+    log(f"✅ Delta sync found {len(changed)} new or altered vouchers")
+    return _drop_unchanged(vouchers_to_transactions(changed), cache), new_watermarks
 
 # Recovery: also provide a function to convert recovered vouchers to transaction list
 
@@ -733,7 +1313,8 @@ def recover_failed_chunk_transactions(xml_path="failed_chunk_raw.xml"):
 def recover_failed_chunk_vouchers(xml_path="failed_chunk_raw.xml"):
     """
     Extract all <VOUCHER> blocks from a failed chunk XML file, parse each individually, and return as list of dicts.
-    Handles malformed XML by extracting blocks with regex.
+    Handles malformed XML by extracting blocks with regex. Failed chunks are kept by debug_capture as
+    gzipped "...-failed_chunk-failed.xml.gz" files; pass the path of one after unzipping it.
     """
     vouchers = []
     try:
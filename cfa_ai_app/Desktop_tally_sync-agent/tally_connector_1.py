@@ -5,12 +5,11 @@ import os
 from dotenv import load_dotenv
 import sys
 import datetime
-from tkinter import messagebox
-import re
-import html
-from xml.etree import ElementTree as ET
 import time
 import socket
+import threading
+from requests.adapters import HTTPAdapter
+from xml_sanitizer import sanitize_xml
 import urllib3
 from urllib3.exceptions import InsecureRequestWarning
 urllib3.disable_warnings(InsecureRequestWarning)
@@ -55,8 +54,21 @@ RETRY_DELAY = 2
 CONNECTION_TIMEOUT = 15
 READ_TIMEOUT = 120  # Increased timeout for large reports
 
-def check_tally_service():
-    """Check if Tally service is running on the specified port."""
+# Seconds a successful probe or answered request keeps Tally marked as reachable
+LIVENESS_TTL = float(os.getenv("TALLY_LIVENESS_TTL", "30"))
+
+_service_alive_until = 0.0
+_session = None
+_session_lock = threading.Lock()
+
+def _mark_service_alive(alive=True):
+    global _service_alive_until
+    _service_alive_until = time.monotonic() + LIVENESS_TTL if alive else 0.0
+
+def check_tally_service(force=False):
+    """Check if Tally service is running on the specified port (cached for LIVENESS_TTL seconds)."""
+    if not force and time.monotonic() < _service_alive_until:
+        return True
     try:
         url_parts = TALLY_URL.replace('http://', '').replace('https://', '')
         host_port = url_parts.split('/')[0]
@@ -70,23 +82,31 @@ def check_tally_service():
         
         if result == 0:
             log(f"✅ Tally service is running on {host}:{port}")
+            _mark_service_alive()
             return True
         else:
             log(f"❌ Tally service is not running on {host}:{port}")
+            _mark_service_alive(False)
             return False
     except Exception as e:
         log(f"❌ Error checking Tally service: {e}")
         return False
 
 def create_session():
-    """Create a requests session with appropriate settings."""
-    session = requests.Session()
-    session.headers.update({
-        'Content-Type': 'application/xml',
-        'User-Agent': 'EnhancedTallyConnector/1.0',
-        'Connection': 'keep-alive'
-    })
-    return session
+    """Return the shared keep-alive session, creating it on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4)
+            _session.mount('http://', adapter)
+            _session.mount('https://', adapter)
+            _session.headers.update({
+                'Content-Type': 'application/xml',
+                'User-Agent': 'EnhancedTallyConnector/1.0',
+                'Connection': 'keep-alive'
+            })
+        return _session
 
 def send_tally_request(xml_request, return_json=False, max_retries=MAX_RETRIES):
     """Send XML request to Tally with retry logic."""
@@ -113,6 +133,8 @@ def send_tally_request(xml_request, return_json=False, max_retries=MAX_RETRIES):
                 timeout=(CONNECTION_TIMEOUT, READ_TIMEOUT)
             )
             
+            # Any answer proves Tally is up, so the next request can skip the socket probe
+            _mark_service_alive()
             if response.status_code == 200 and response.text.strip():
                 # Check for Tally error patterns
                 error_patterns = [
@@ -148,6 +170,7 @@ def send_tally_request(xml_request, return_json=False, max_retries=MAX_RETRIES):
             continue
         except requests.exceptions.ConnectionError as e:
             log(f"❌ Connection error: {e}")
+            _mark_service_alive(False)
             last_error = f"Connection error: {e}"
             continue
         except Exception as e:
@@ -155,30 +178,12 @@ def send_tally_request(xml_request, return_json=False, max_retries=MAX_RETRIES):
             last_error = f"Unexpected error: {e}"
             continue
     
-    session.close()
     log(f"❌ All {max_retries} attempts failed. Last error: {last_error}")
     return None
 
 def clean_xml_data(xml_str):
-    """Clean and fix XML data from Tally."""
-    if not xml_str:
-        return ""
-    
-    # Remove invalid XML characters
-    cleaned = re.sub(r'[^\x09\x0A\x0D\x20-\uD7FF\uE000-\uFFFD\U00010000-\U0010FFFF]', '', xml_str)
-    
-    # Decode HTML entities
-    cleaned = html.unescape(cleaned)
-    
-    # Fix common Tally XML issues
-    cleaned = re.sub(r'&(?![a-zA-Z]+;)', '&amp;', cleaned)  # Fix unescaped ampersands
-    cleaned = re.sub(r'<([^>]*?)>', lambda m: m.group(0).replace('&', '&amp;') if '&' in m.group(1) and '&amp;' not in m.group(1) else m.group(0), cleaned)
-    
-    # Ensure proper XML declaration
-    if not cleaned.strip().startswith('<?xml'):
-        cleaned = '<?xml version="1.0" encoding="UTF-8"?>\n' + cleaned
-    
-    return cleaned
+    """Clean and fix XML data from Tally (single pass, see xml_sanitizer)."""
+    return sanitize_xml(xml_str)
 
 def get_company_name():
     """Get the current company name from Tally (robust, always returns human-readable name)."""
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import sync_service
+import tally_connector
+from tally_connector import TallyResponseError
+
+
+def voucher(guid, alter_id, date='20240410', vtype='Sales'):
+    return {'GUID': guid, 'ALTERID': str(alter_id), 'DATE': date, 'VOUCHERTYPENAME': vtype,
+            'VOUCHERNUMBER': guid, 'PARTYNAME': 'Party A', 'AMOUNT': '100'}
+
+
+class AlteredVoucherDeltaTests(unittest.TestCase):
+    def setUp(self):
+        registers = {name: [] for name, _ in tally_connector.VOUCHER_REPORTS}
+        registers['Sales Vouchers'] = [voucher('recent', 12, date='20250601')]
+        patcher = mock.patch.object(tally_connector, 'fetch_voucher_registers', return_value=registers)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.marks = {'Sales Vouchers': {'last_date': '20250601', 'last_alter_id': 10}}
+
+    def test_old_voucher_edited_behind_the_overlap_is_fetched_by_alter_id(self):
+        altered = [voucher('recent', 12, date='20250601'), voucher('old', 11, date='20240410')]
+        with mock.patch.object(tally_connector, 'iter_tally_vouchers', return_value=iter(altered)) as fetch:
+            transactions, _ = tally_connector.fetch_all_registers_delta(
+                self.marks, '20240401', '20250630', since_alter_id=10)
+        self.assertIn('$AlterID > 10', fetch.call_args[0][0])
+        self.assertEqual(sorted(txn.key for txn in transactions), ['old', 'recent'])
+
+    def test_no_alter_id_fetch_without_a_synced_counter(self):
+        with mock.patch.object(tally_connector, 'iter_tally_vouchers') as fetch:
+            transactions, _ = tally_connector.fetch_all_registers_delta(self.marks, '20240401', '20250630')
+        fetch.assert_not_called()
+        self.assertEqual([txn.key for txn in transactions], ['recent'])
+
+    def test_a_failed_alter_id_fetch_fails_the_delta(self):
+        def cut_off(xml_request, stats=None):
+            yield voucher('old', 11)
+            raise TallyResponseError("cut off")
+        with mock.patch.object(tally_connector, 'iter_tally_vouchers', side_effect=cut_off):
+            with self.assertRaises(TallyResponseError):
+                tally_connector.fetch_all_registers_delta(self.marks, '20240401', '20250630', since_alter_id=10)
+
+
+class ChangeSyncCounterTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.history_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        os.remove(self.history_path)
+        self.addCleanup(lambda: os.path.exists(self.history_path) and os.remove(self.history_path))
+        self.service = sync_service.SyncService(api_key='key', history_path=self.history_path)
+        self.service.history['alter_ids'] = {'company': 'Acme', 'voucher': 10, 'master': 5}
+        for name, value in (('test_tally_connection', True), ('get_company_name', 'Acme'),
+                            ('fetch_alter_ids', {'company': 'Acme', 'voucher': 14, 'master': 5})):
+            patcher = mock.patch.object(sync_service, name, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(sync_service, 'VoucherCache')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sync(self):
+        return self.service._sync({'sync_type': 'incremental', 'source': 'change'})
+
+    def test_counters_saved_after_the_altered_vouchers_are_uploaded(self):
+        with mock.patch.object(sync_service, 'fetch_all_registers_delta', return_value=(['txn'], {})) as delta, \
+                mock.patch.object(sync_service, 'send_transactions_in_batches') as send:
+            ok, _, _ = self.sync()
+        self.assertTrue(ok)
+        self.assertEqual(delta.call_args.kwargs['since_alter_id'], 10)
+        send.assert_called_once()
+        self.assertEqual(self.service.history['alter_ids']['voucher'], 14)
+
+    def test_counters_kept_when_the_altered_vouchers_cannot_be_fetched(self):
+        with mock.patch.object(sync_service, 'fetch_all_registers_delta', side_effect=TallyResponseError("cut off")):
+            with self.assertRaises(TallyResponseError):
+                self.sync()
+        self.assertEqual(self.service.history['alter_ids']['voucher'], 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from chunk_tuner import DEFAULT_CHUNK_DAYS, MIN_CHUNK_DAYS, SLOW_CHUNK_SECONDS, ChunkTuner
+
+REPORT = 'Sales Vouchers'
+
+
+class ChunkTunerTests(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        os.remove(self.path)
+        self.addCleanup(lambda: os.path.exists(self.path) and os.remove(self.path))
+        self.tuner = ChunkTuner('Acme', path=self.path)
+
+    def fast(self, days):
+        self.tuner.record(REPORT, days, elapsed=0.5, size_bytes=1000, voucher_count=10)
+
+    def test_a_slow_or_failed_window_halves_the_size(self):
+        self.tuner.record(REPORT, DEFAULT_CHUNK_DAYS, elapsed=SLOW_CHUNK_SECONDS + 1, size_bytes=0, voucher_count=0)
+        self.assertEqual(self.tuner.chunk_days(REPORT), DEFAULT_CHUNK_DAYS // 2)
+        self.tuner.record(REPORT, DEFAULT_CHUNK_DAYS // 2, elapsed=1, size_bytes=0, voucher_count=0, ok=False)
+        self.assertEqual(self.tuner.chunk_days(REPORT), DEFAULT_CHUNK_DAYS // 4)
+        for _ in range(10):
+            self.tuner.record(REPORT, 1, elapsed=1, size_bytes=0, voucher_count=0, ok=False)
+        self.assertEqual(self.tuner.chunk_days(REPORT), MIN_CHUNK_DAYS)
+
+    def test_a_small_fast_full_window_doubles_but_never_to_a_size_that_was_too_big(self):
+        self.fast(DEFAULT_CHUNK_DAYS)
+        self.assertEqual(self.tuner.chunk_days(REPORT), DEFAULT_CHUNK_DAYS * 2)
+        self.tuner.record(REPORT, DEFAULT_CHUNK_DAYS * 2, elapsed=1, size_bytes=0, voucher_count=0, ok=False)
+        self.assertEqual(self.tuner.chunk_days(REPORT), DEFAULT_CHUNK_DAYS)
+        self.fast(DEFAULT_CHUNK_DAYS)
+        self.assertEqual(self.tuner.chunk_days(REPORT), DEFAULT_CHUNK_DAYS * 2 - 1)
+
+    def test_a_window_cut_short_by_the_range_end_does_not_widen(self):
+        self.fast(5)
+        self.assertEqual(self.tuner.chunk_days(REPORT), DEFAULT_CHUNK_DAYS)
+
+    def test_sizes_are_saved_per_company(self):
+        self.fast(DEFAULT_CHUNK_DAYS)
+        self.tuner.save()
+        self.assertEqual(ChunkTuner('Acme', path=self.path).chunk_days(REPORT), DEFAULT_CHUNK_DAYS * 2)
+        self.assertEqual(ChunkTuner('Other', path=self.path).chunk_days(REPORT), DEFAULT_CHUNK_DAYS)
+
+
+if __name__ == '__main__':
+    unittest.main()
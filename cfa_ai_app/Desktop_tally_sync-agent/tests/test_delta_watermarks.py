@@ -0,0 +1,51 @@
+import unittest
+from unittest import mock
+
+import tally_connector
+from tally_connector import TallyResponseError, fetch_all_registers_delta
+
+
+def voucher(guid, alter_id, date):
+    return {'GUID': guid, 'ALTERID': str(alter_id), 'DATE': date, 'VOUCHERTYPENAME': 'Sales',
+            'VOUCHERNUMBER': guid, 'PARTYNAME': 'Party A', 'AMOUNT': '100'}
+
+
+class DeltaWatermarkTests(unittest.TestCase):
+    def fetch(self, registers, watermarks, incomplete=()):
+        incomplete_reports = set(incomplete)
+
+        def fetch_voucher_registers(start_date, end_date, start_dates=None, incomplete=None, **kwargs):
+            self.start_dates = start_dates
+            incomplete.update(incomplete_reports)
+            full = {name: [] for name, _ in tally_connector.VOUCHER_REPORTS}
+            full.update(registers)
+            return full
+
+        with mock.patch.object(tally_connector, 'fetch_voucher_registers', side_effect=fetch_voucher_registers):
+            return fetch_all_registers_delta(watermarks, '20240401', '20250630', overlap_days=7)
+
+    def test_only_vouchers_above_the_alter_id_are_sent_and_the_mark_advances(self):
+        marks = {'Sales Vouchers': {'last_date': '20250601', 'last_alter_id': 10}}
+        transactions, new_marks = self.fetch(
+            {'Sales Vouchers': [voucher('old', 9, '20250528'), voucher('new', 12, '20250610')]}, marks)
+        self.assertEqual(self.start_dates, {'Sales Vouchers': '20250525'})
+        self.assertEqual([txn.key for txn in transactions], ['new'])
+        self.assertEqual(new_marks['Sales Vouchers'], {'last_date': '20250610', 'last_alter_id': 12})
+        # A register without vouchers keeps an empty mark and is read from the default start
+        self.assertEqual(new_marks['Purchase Vouchers'], {'last_date': '', 'last_alter_id': 0})
+
+    def test_a_partly_recovered_register_keeps_its_previous_mark(self):
+        marks = {'Sales Vouchers': {'last_date': '20250601', 'last_alter_id': 10}}
+        transactions, new_marks = self.fetch(
+            {'Sales Vouchers': [voucher('new', 12, '20250610')]}, marks, incomplete={'Sales Vouchers'})
+        self.assertEqual([txn.key for txn in transactions], ['new'])
+        self.assertEqual(new_marks['Sales Vouchers'], marks['Sales Vouchers'])
+
+    def test_a_failed_window_advances_nothing(self):
+        with mock.patch.object(tally_connector, 'fetch_voucher_registers', side_effect=TallyResponseError('down')):
+            with self.assertRaises(TallyResponseError):
+                fetch_all_registers_delta({}, '20240401', '20250630')
+
+
+if __name__ == '__main__':
+    unittest.main()
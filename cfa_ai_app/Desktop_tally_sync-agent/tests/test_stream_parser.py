@@ -0,0 +1,60 @@
+import unittest
+from unittest import mock
+
+from tally_connector import TallyClient, TallyResponseError
+
+VOUCHERS = (b'<ENVELOPE><BODY><DATA><TALLYMESSAGE>'
+            b'<VOUCHER><VOUCHERNUMBER>1</VOUCHERNUMBER><ALLLEDGERENTRIES.LIST><LEDGERNAME>A &amp; B</LEDGERNAME>'
+            b'</ALLLEDGERENTRIES.LIST></VOUCHER>'
+            b'<VOUCHER><VOUCHERNUMBER>2</VOUCHERNUMBER></VOUCHER>'
+            b'</TALLYMESSAGE></DATA></BODY></ENVELOPE>')
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200, chunk=7):
+        self.status_code = status_code
+        self.encoding = 'utf-8'
+        self._chunks = [body[i:i + chunk] for i in range(0, len(body), chunk)]
+        self.closed = False
+
+    def iter_content(self, chunk_size=None):
+        yield from self._chunks
+
+    def close(self):
+        self.closed = True
+
+
+class IterVouchersTests(unittest.TestCase):
+    def setUp(self):
+        self.stats = {}
+
+    def stream(self, response):
+        client = TallyClient(url='http://tally.invalid:9000')
+        # The generator posts on its first next(), so the patch must outlive this call
+        client.post = mock.Mock(return_value=response)
+        return client.iter_vouchers('<ENVELOPE/>', stats=self.stats)
+
+    def test_vouchers_are_yielded_one_at_a_time_across_chunks(self):
+        response = FakeResponse(VOUCHERS)
+        vouchers = list(self.stream(response))
+        self.assertEqual([v['VOUCHERNUMBER'] for v in vouchers], ['1', '2'])
+        self.assertEqual(vouchers[0]['ALLLEDGERENTRIES.LIST']['LEDGERNAME'], 'A & B')
+        self.assertEqual(self.stats, {'bytes': len(VOUCHERS), 'vouchers': 2})
+        self.assertTrue(response.closed)
+
+    def test_a_truncated_response_raises_after_the_complete_vouchers(self):
+        response = FakeResponse(VOUCHERS[:VOUCHERS.index(b'<VOUCHER><VOUCHERNUMBER>2') + 20])
+        seen = []
+        with self.assertRaises(TallyResponseError):
+            for voucher in self.stream(response):
+                seen.append(voucher['VOUCHERNUMBER'])
+        self.assertEqual(seen, ['1'])
+        self.assertTrue(response.closed)
+
+    def test_an_http_error_raises(self):
+        with self.assertRaises(TallyResponseError):
+            list(self.stream(FakeResponse(b'', status_code=500)))
+
+
+if __name__ == '__main__':
+    unittest.main()
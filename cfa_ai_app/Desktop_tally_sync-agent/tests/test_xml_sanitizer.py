@@ -0,0 +1,33 @@
+import unittest
+
+from xml_sanitizer import XML_DECLARATION, XmlSanitizer, iter_sanitized, sanitize_text, sanitize_xml
+
+SAMPLE = ('<NAME>Sales & Marketing&nbsp;Ltd &amp; Co&#4;&#65;\x01&rsquo;s &bogus; &lt;1&gt;</NAME>')
+CLEANED = '<NAME>Sales &amp; Marketing Ltd &amp; Co&#65;’s &amp;bogus; &lt;1&gt;</NAME>'
+
+
+class XmlSanitizerTests(unittest.TestCase):
+    def test_sanitize_text(self):
+        self.assertEqual(sanitize_text(SAMPLE), CLEANED)
+        # Named entities that expand to markup characters stay escaped
+        self.assertEqual(sanitize_text('&lt;&LT;&amp;&AMP;'), '&lt;&lt;&amp;&amp;')
+
+    def test_feed_gives_the_same_result_at_any_chunk_boundary(self):
+        for size in range(1, len(SAMPLE) + 1):
+            sanitizer = XmlSanitizer()
+            pieces = [sanitizer.feed(SAMPLE[i:i + size]) for i in range(0, len(SAMPLE), size)]
+            self.assertEqual(''.join(pieces) + sanitizer.close(), CLEANED, size)
+
+    def test_iter_sanitized_decodes_characters_split_across_chunks(self):
+        raw = SAMPLE.replace('Sales', 'Sälés').encode('utf-8')
+        chunks = [raw[i:i + 3] for i in range(0, len(raw), 3)]
+        self.assertEqual(''.join(iter_sanitized(chunks)), CLEANED.replace('Sales', 'Sälés'))
+
+    def test_sanitize_xml_adds_a_declaration_once(self):
+        self.assertEqual(sanitize_xml('<A/>'), XML_DECLARATION + '<A/>')
+        self.assertEqual(sanitize_xml('<?xml version="1.0"?><A/>'), '<?xml version="1.0"?><A/>')
+        self.assertEqual(sanitize_xml(''), '')
+
+
+if __name__ == '__main__':
+    unittest.main()
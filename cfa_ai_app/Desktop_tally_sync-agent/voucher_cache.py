@@ -0,0 +1,106 @@
+import sqlite3
+import hashlib
+import datetime
+import json_codec
+
+# Local record of what has already been uploaded, kept next to sync_history.json
+VOUCHER_CACHE_FILE = "voucher_cache.sqlite3"
+
+
+def voucher_key(voucher):
+    """Stable identity for a voucher: Tally GUID, else voucher number + type + date."""
+    guid = str(voucher.get('GUID') or '').strip()
+    if guid:
+        return guid
+    return "|".join(str(voucher.get(field) or '').strip() for field in ('VOUCHERNUMBER', 'VOUCHERTYPENAME', 'DATE'))
+
+
+def voucher_hash(voucher):
+    """Hash of the voucher's canonical JSON form (sorted keys, no whitespace)."""
+    return hashlib.sha256(json_codec.dumps(voucher, sort_keys=True)).hexdigest()
+
+
+class VoucherCache:
+    """
+    SQLite cache of the content hash of every voucher uploaded for a company.
+
+    filter_changed() drops transactions whose voucher is unchanged since the last
+    successful upload and remembers the hashes of the rest; commit() records them
+    once the backend has accepted the upload.
+    """
+
+    def __init__(self, company_name=None, path=VOUCHER_CACHE_FILE):
+        self.company_key = (company_name or "default").strip() or "default"
+        self.path = path
+        self._pending = {}
+        # Number of vouchers the last filter_changed() call found unchanged
+        self.unchanged = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vouchers ("
+            " company TEXT NOT NULL,"
+            " voucher_key TEXT NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " synced_at TEXT NOT NULL,"
+            " PRIMARY KEY (company, voucher_key))"
+        )
+        self._conn.commit()
+
+    def _known_hashes(self, keys):
+        known = {}
+        keys = list(keys)
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            batch = keys[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self._conn.execute(
+                f"SELECT voucher_key, content_hash FROM vouchers WHERE company = ? AND voucher_key IN ({placeholders})",
+                [self.company_key] + batch
+            )
+            known.update(rows.fetchall())
+        return known
+
+    def filter_changed(self, transactions):
+        """Return only the transactions whose voucher is new or modified since the last commit()."""
+        hashed = []
+        for txn in transactions:
+            if hasattr(txn, 'to_payload'):
+                # voucher_model.Voucher: hash exactly what would be uploaded
+                hashed.append((txn, txn.key, voucher_hash(txn.to_payload())))
+                continue
+            voucher = txn.get('voucher_all_fields') or txn
+            hashed.append((txn, voucher_key(voucher), voucher_hash(voucher)))
+        known = self._known_hashes({key for _, key, _ in hashed})
+        changed = []
+        for txn, key, digest in hashed:
+            if known.get(key) == digest:
+                continue
+            changed.append(txn)
+            self._pending[key] = digest
+        self.unchanged = len(hashed) - len(changed)
+        return changed
+
+    def commit(self):
+        """Record the pending hashes as synced. Call only after a successful upload."""
+        if not self._pending:
+            return
+        now = datetime.datetime.now().isoformat()
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO vouchers (company, voucher_key, content_hash, synced_at) VALUES (?, ?, ?, ?)",
+            [(self.company_key, key, digest, now) for key, digest in self._pending.items()]
+        )
+        self._conn.commit()
+        self._pending = {}
+
+    def discard(self):
+        """Forget pending hashes, e.g. after a failed upload."""
+        self._pending = {}
+
+    def clear(self):
+        """Drop every cached hash for this company so the next sync re-uploads everything."""
+        self._conn.execute("DELETE FROM vouchers WHERE company = ?", (self.company_key,))
+        self._conn.commit()
+        self._pending = {}
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,162 @@
+import os
+import sys
+import datetime
+from decimal import Decimal, InvalidOperation
+
+# Keep the full xmltodict voucher and ledger dicts on every record and send them to the
+# backend (as voucher_all_fields / all_fields). Off by default: they multiply memory and
+# payload size several times over and the backend only reads the typed fields.
+KEEP_RAW_FIELDS = os.getenv("TALLY_KEEP_RAW_FIELDS", "0").strip().lower() in ("1", "true", "yes")
+
+ZERO = Decimal(0)
+
+
+def _text(value):
+    """Text of an xmltodict value, which may be a plain string or {'@attr': ..., '#text': ...}."""
+    if isinstance(value, dict):
+        value = value.get('#text')
+    return str(value or '').strip()
+
+
+def parse_tally_date(value):
+    """Tally's YYYYMMDD date as a datetime.date, or None if blank or malformed."""
+    text = _text(value)
+    if len(text) != 8 or not text.isdigit():
+        return None
+    try:
+        return datetime.date(int(text[:4]), int(text[4:6]), int(text[6:]))
+    except ValueError:
+        return None
+
+
+def parse_tally_amount(value):
+    """Tally amount text ("-1,234.50") as a Decimal, or None if blank or malformed."""
+    text = _text(value).replace(',', '')
+    if not text:
+        return None
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        return None
+
+
+def _ledger_lists(voucher):
+    # Tally can use ALLLEDGERENTRIES.LIST or LEDGERENTRIES.LIST
+    for key in ("ALLLEDGERENTRIES.LIST", "LEDGERENTRIES.LIST"):
+        value = voucher.get(key)
+        if isinstance(value, list):
+            yield from value
+        elif isinstance(value, dict):
+            yield value
+
+
+class LedgerLine:
+    """One debit/credit split of a voucher. Tally amounts are positive for debits, negative for credits."""
+
+    __slots__ = ('ledger_name', 'amount', 'raw')
+
+    def __init__(self, ledger_name, amount, raw=None):
+        self.ledger_name = ledger_name
+        self.amount = amount
+        self.raw = raw
+
+    @property
+    def is_debit(self):
+        return self.amount > 0
+
+    @property
+    def is_credit(self):
+        return self.amount < 0
+
+    @classmethod
+    def from_tally(cls, entry, keep_raw=False):
+        # Ledger names repeat across thousands of vouchers; interning stores each once
+        return cls(sys.intern(_text(entry.get('LEDGERNAME'))),
+                   parse_tally_amount(entry.get('AMOUNT')) or ZERO,
+                   entry if keep_raw else None)
+
+    def to_payload(self):
+        payload = {
+            'ledger_name': self.ledger_name,
+            'amount': str(self.amount),
+            'is_debit': self.is_debit,
+            'is_credit': self.is_credit,
+        }
+        if self.raw is not None:
+            payload['all_fields'] = self.raw
+        return payload
+
+
+class Voucher:
+    """
+    A Tally voucher parsed once from its xmltodict form into typed fields.
+
+    The raw dict is only kept with keep_raw=True; otherwise a record holds just what the
+    backend stores. to_payload() gives the compact dict sent to /api/transactions/, and
+    json_codec serializes records directly through it.
+    """
+
+    __slots__ = ('guid', 'voucher_type', 'voucher_no', 'date', 'amount', 'party_name',
+                 'narration', 'alter_id', 'ledger_entries', 'raw')
+
+    def __init__(self, guid, voucher_type, voucher_no, date, amount, party_name, narration,
+                 alter_id=0, ledger_entries=(), raw=None):
+        self.guid = guid
+        self.voucher_type = voucher_type
+        self.voucher_no = voucher_no
+        self.date = date
+        self.amount = amount
+        self.party_name = party_name
+        self.narration = narration
+        self.alter_id = alter_id
+        self.ledger_entries = ledger_entries
+        self.raw = raw
+
+    @classmethod
+    def from_tally(cls, voucher, keep_raw=KEEP_RAW_FIELDS):
+        """Build a record from one xmltodict <VOUCHER> dict."""
+        try:
+            alter_id = int(_text(voucher.get('ALTERID')) or 0)
+        except ValueError:
+            alter_id = 0
+        return cls(
+            guid=_text(voucher.get('GUID')),
+            voucher_type=sys.intern(_text(voucher.get('VOUCHERTYPENAME'))),
+            voucher_no=_text(voucher.get('VOUCHERNUMBER')),
+            date=parse_tally_date(voucher.get('DATE')),
+            amount=parse_tally_amount(voucher.get('AMOUNT')),
+            party_name=sys.intern(_text(voucher.get('PARTYNAME'))),
+            narration=_text(voucher.get('NARRATION')),
+            alter_id=alter_id,
+            ledger_entries=tuple(LedgerLine.from_tally(entry, keep_raw)
+                                 for entry in _ledger_lists(voucher) if isinstance(entry, dict)),
+            raw=voucher if keep_raw else None,
+        )
+
+    @property
+    def key(self):
+        """Stable identity: Tally GUID, else voucher number + type + date (as voucher_cache.voucher_key)."""
+        if self.guid:
+            return self.guid
+        date = self.date.strftime('%Y%m%d') if self.date else ''
+        return f"{self.voucher_no}|{self.voucher_type}|{date}"
+
+    def to_payload(self):
+        payload = {
+            'voucher_type': self.voucher_type,
+            'voucher_no': self.voucher_no,
+            'date': self.date.strftime('%Y%m%d') if self.date else '',
+            # Blank makes the backend sum the ledger entries, as it did for a missing AMOUNT
+            'amount': '' if self.amount is None else str(self.amount),
+            'party_name': self.party_name,
+            'ledger_entries': [line.to_payload() for line in self.ledger_entries],
+            'narration': self.narration,
+            'guid': self.guid,
+        }
+        if self.raw is not None:
+            payload['voucher_all_fields'] = self.raw
+        return payload
+
+    def __repr__(self):
+        return (f"Voucher({self.voucher_type!r}, {self.voucher_no!r}, {self.date}, "
+                f"{self.amount}, {self.party_name!r}, {len(self.ledger_entries)} lines)")
@@ -0,0 +1,113 @@
+import re
+import codecs
+from html.entities import html5
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+# Longest '&...;' sequence worth holding back at a chunk boundary (html5 names are at most 32 chars)
+MAX_ENTITY_LENGTH = 40
+
+# Characters XML 1.0 does not allow (C0 controls other than tab/LF/CR, surrogates,
+# U+FFFE/U+FFFF). str.translate drops them in one C-level pass; a regex character class
+# over these Unicode ranges is several times slower.
+_INVALID_CHAR_TABLE = dict.fromkeys(
+    [c for c in range(0x20) if c not in (0x9, 0xA, 0xD)] + list(range(0xD800, 0xE000)) + [0xFFFE, 0xFFFF]
+)
+
+# Every '&' except the five predefined XML entities, with the reference that follows it, if any.
+# The literal '&' prefix lets the regex engine skip straight from one ampersand to the next.
+_AMPERSAND_RE = re.compile(
+    r'&(?!(?:amp|lt|gt|apos|quot);)'
+    r'(?:#(?:[0-9]{1,8}|[xX][0-9a-fA-F]{1,8});|[A-Za-z][A-Za-z0-9]{0,31};)?'
+)
+
+# Characters that must stay escaped when a named entity expands to them
+_XML_ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;'}
+
+
+def _is_xml_char(code):
+    return (code in (0x9, 0xA, 0xD) or 0x20 <= code <= 0xD7FF
+            or 0xE000 <= code <= 0xFFFD or 0x10000 <= code <= 0x10FFFF)
+
+
+def _replace(match):
+    text = match.group(0)
+    if len(text) == 1:
+        # Stray ampersand, e.g. "Sales & Marketing"
+        return '&amp;'
+    if text[1] == '#':
+        # Tally writes control characters as references such as &#4; which XML parsers reject
+        code = int(text[3:-1], 16) if text[2] in 'xX' else int(text[2:-1])
+        return text if _is_xml_char(code) else ''
+    expanded = html5.get(text[1:])
+    if expanded is None:
+        # Unknown name: keep the text literally
+        return '&amp;' + text[1:]
+    return ''.join(_XML_ESCAPES.get(ch, ch) for ch in expanded)
+
+
+def sanitize_text(text):
+    """Sanitize a complete piece of XML text."""
+    text = text.translate(_INVALID_CHAR_TABLE)
+    if '&' not in text:
+        return text
+    return _AMPERSAND_RE.sub(_replace, text)
+
+
+class XmlSanitizer:
+    """
+    Incremental XML sanitizer for Tally responses.
+
+    feed() takes decoded text chunks in order and returns the sanitized text that is safe
+    to hand to a parser; a trailing partial '&...' reference is held back until the next
+    chunk completes it. close() flushes whatever is left. Invalid XML characters are
+    dropped, references to them removed, stray ampersands escaped and HTML named entities
+    (&nbsp;, &rsquo;, ...) expanded, while the five XML entities and valid numeric
+    references are passed through untouched.
+    """
+
+    def __init__(self):
+        self._carry = ''
+
+    def feed(self, text):
+        if self._carry:
+            text = self._carry + text
+            self._carry = ''
+        amp = text.rfind('&', max(0, len(text) - MAX_ENTITY_LENGTH))
+        if amp != -1 and ';' not in text[amp:]:
+            text, self._carry = text[:amp], text[amp:]
+        return sanitize_text(text)
+
+    def close(self):
+        text, self._carry = self._carry, ''
+        return sanitize_text(text)
+
+
+def iter_sanitized(chunks, encoding='utf-8'):
+    """
+    Decode and sanitize an iterable of byte chunks (e.g. response.iter_content()),
+    yielding sanitized text chunks ready for an incremental XML parser.
+    """
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    sanitizer = XmlSanitizer()
+    for raw in chunks:
+        if raw:
+            cleaned = sanitizer.feed(decoder.decode(raw))
+            if cleaned:
+                yield cleaned
+    tail = sanitizer.feed(decoder.decode(b'', final=True)) + sanitizer.close()
+    if tail:
+        yield tail
+
+
+def sanitize_xml(xml_str):
+    """
+    Sanitize a whole Tally response for xmltodict/ElementTree and make sure it starts
+    with an XML declaration. Drop-in replacement for the old clean_xml_data regex chain.
+    """
+    if not xml_str:
+        return ""
+    cleaned = sanitize_text(xml_str)
+    if not cleaned.lstrip().startswith('<?xml'):
+        cleaned = XML_DECLARATION + cleaned
+    return cleaned
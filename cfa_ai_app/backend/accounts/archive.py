@@ -0,0 +1,53 @@
+import hashlib
+import zlib
+
+from . import json_codec
+from .models import RawPayloadArchive
+
+# zlib level for archived payloads; they are written once and rarely read, but ingest waits on it
+ARCHIVE_COMPRESSION_LEVEL = 6
+
+
+def encode_payload(payload):
+    """Canonical JSON of a payload and its sha256 hex digest."""
+    data = json_codec.dumps(payload, sort_keys=True)
+    return hashlib.sha256(data).hexdigest(), data
+
+
+def archive_payloads(payloads):
+    """
+    Store raw payloads (dicts) in RawPayloadArchive and return their content hashes in order.
+    Empty payloads are not stored and get ''. Identical payloads, within the call or already
+    archived, are stored once.
+    """
+    hashes = []
+    pending = {}
+    for payload in payloads:
+        if not payload:
+            hashes.append('')
+            continue
+        content_hash, data = encode_payload(payload)
+        hashes.append(content_hash)
+        pending.setdefault(content_hash, data)
+    if pending:
+        existing = set(RawPayloadArchive.objects.filter(content_hash__in=pending).values_list('content_hash', flat=True))
+        RawPayloadArchive.objects.bulk_create(
+            [RawPayloadArchive(content_hash=h, data=zlib.compress(data, ARCHIVE_COMPRESSION_LEVEL), size=len(data))
+             for h, data in pending.items() if h not in existing],
+            ignore_conflicts=True,
+        )
+    return hashes
+
+
+def load_payloads(hashes):
+    """Map content hashes to their archived payloads; unknown or blank hashes are left out."""
+    hashes = {h for h in hashes if h}
+    return {
+        row.content_hash: json_codec.loads(zlib.decompress(bytes(row.data)))
+        for row in RawPayloadArchive.objects.filter(content_hash__in=hashes)
+    }
+
+
+def load_payload(content_hash):
+    """The archived payload for one content hash, or None."""
+    return load_payloads([content_hash]).get(content_hash)
@@ -0,0 +1,227 @@
+import logging
+from datetime import date
+from decimal import Decimal
+
+from django.db import models
+from django.db import transaction as db_transaction
+
+from .fifo import (CENT, INVOICE_REGISTERS, RECEIVABLE_REGISTERS, SETTLEMENT_REGISTERS, FifoQueue, OpenAmount,
+                   with_party_amount)
+from .models import Client, ClientBalance, LedgerOpeningBalance, TallyTransaction
+
+logger = logging.getLogger("cfa.transactions")
+
+ZERO = Decimal('0')
+
+# Upper age in days of each aging bucket, oldest last; the last bucket is open-ended
+AGING_BUCKETS = (
+    ('aging_0_30', 30),
+    ('aging_31_60', 60),
+    ('aging_61_90', 90),
+    ('aging_90_plus', None),
+)
+
+
+def settle_receivables(movements, open_items=(), unapplied=ZERO):
+    """
+    Replay movements onto a fifo.FifoQueue of open debits: credits settle the oldest items first.
+
+    movements are (date, register_type, amount) in date order; open_items are [date, remaining]
+    pairs already on the queue. Credit left over once the queue is empty is applied to later
+    debits. Returns the remaining open items and the unapplied credit.
+    """
+    queue = FifoQueue((OpenAmount(when, remaining) for when, remaining in open_items), unapplied)
+    for when, register_type, amount in movements:
+        if register_type in INVOICE_REGISTERS:
+            queue.invoice(OpenAmount(when, abs(amount)))
+        else:
+            queue.settle(abs(amount))
+    return [[item.date, item.remaining] for item in queue.items], queue.unapplied
+
+
+def bucket_open_items(open_items, as_of):
+    """Sum [date, remaining] open items into the aging buckets as of a day: {bucket field: Decimal}."""
+    buckets = {field: ZERO for field, _ in AGING_BUCKETS}
+    for when, remaining in open_items:
+        age = (as_of - when).days
+        for field, limit in AGING_BUCKETS:
+            if limit is None or age <= limit:
+                buckets[field] += remaining
+                break
+    return buckets
+
+
+def _opening_items(opening):
+    # A positive opening balance is the oldest open item, a negative one an unapplied credit
+    if opening > 0:
+        return [[date.min, opening]], ZERO
+    return [], -opening
+
+
+def age_receivables(opening, movements, as_of):
+    """
+    Settle credits against the oldest open debits first (FIFO) and bucket what is left by age.
+
+    movements are (date, register_type, amount) in date order; a positive opening balance is
+    the oldest open item. Returns {bucket field: Decimal}.
+    """
+    open_items, unapplied = _opening_items(opening)
+    open_items, _ = settle_receivables(movements, open_items, unapplied)
+    return bucket_open_items(open_items, as_of)
+
+
+def _dump_items(open_items):
+    return [[when.isoformat(), str(remaining)] for when, remaining in open_items]
+
+
+def _load_items(stored):
+    return [[date.fromisoformat(when), Decimal(remaining)] for when, remaining in stored]
+
+
+def _rebuild(client_ids, as_of):
+    """
+    Full recompute: three grouped queries plus one date-ordered scan of the receivable movements.
+
+    Every transaction of the clients is first marked balance_applied and only marked rows are
+    read, so a row committed meanwhile is left for the next _append rather than counted twice.
+    """
+    TallyTransaction.objects.filter(client_id__in=client_ids, balance_applied=False).update(balance_applied=True)
+    applied = TallyTransaction.objects.filter(client_id__in=client_ids, balance_applied=True)
+    totals = {
+        row['client_id']: row
+        for row in applied.order_by()
+        .values('client_id')
+        .annotate(count=models.Count('id'), total=models.Sum('amount'),
+                  last_date=models.Max('date'), last_id=models.Max('id'))
+    }
+    openings = dict(
+        LedgerOpeningBalance.objects.filter(client_id__in=client_ids).order_by()
+        .values('client_id').annotate(total=models.Sum('opening_balance'))
+        .values_list('client_id', 'total')
+    )
+    movements = {pk: [] for pk in client_ids}
+    rows = (
+        with_party_amount(applied.filter(register_type__in=RECEIVABLE_REGISTERS)
+                          .order_by('client_id', 'date', 'id'))
+        .values_list('client_id', 'date', 'register_type', 'party_amount')
+    )
+    for client_id, when, register_type, amount in rows.iterator(chunk_size=5000):
+        movements[client_id].append((when, register_type, (amount or ZERO).quantize(CENT)))
+
+    balances = []
+    for pk in client_ids:
+        row = totals.get(pk, {})
+        opening = openings.get(pk) or ZERO
+        debits = sum((abs(a) for _, r, a in movements[pk] if r in INVOICE_REGISTERS), ZERO)
+        credits = sum((abs(a) for _, r, a in movements[pk] if r in SETTLEMENT_REGISTERS), ZERO)
+        open_items, unapplied = settle_receivables(movements[pk], *_opening_items(opening))
+        balances.append(ClientBalance(
+            client_id=pk,
+            transaction_count=row.get('count', 0),
+            total_amount=row.get('total') or ZERO,
+            opening_balance=opening,
+            running_balance=opening + debits - credits,
+            last_transaction_date=row.get('last_date'),
+            last_transaction_id=row.get('last_id') or 0,
+            open_items=_dump_items(open_items),
+            unapplied_credit=unapplied,
+            as_of=as_of,
+            **bucket_open_items(open_items, as_of),
+        ))
+    return balances
+
+
+def _append(balance, as_of):
+    """
+    Fold the client's transactions not yet balance_applied into the row and mark them applied.
+    Returns False, leaving the row alone, when one of them sorts before the last one folded in
+    (by date, then id): FIFO order would change, so the client has to be rebuilt.
+
+    The flag, unlike an id watermark, cannot be overtaken by a row that commits after one with
+    a higher id: whatever this read misses is still unapplied on the next refresh.
+    """
+    rows = list(
+        with_party_amount(TallyTransaction.objects.filter(client_id=balance.client_id, balance_applied=False)
+                          .order_by('date', 'id'))
+        .values_list('id', 'date', 'register_type', 'amount', 'party_amount')
+    )
+    if rows and balance.last_transaction_date and \
+            (rows[0][1], rows[0][0]) < (balance.last_transaction_date, balance.last_transaction_id):
+        return False
+    movements = [(when, r, (pa or ZERO).quantize(CENT))
+                 for _, when, r, _, pa in rows if r in RECEIVABLE_REGISTERS]
+    open_items, unapplied = settle_receivables(movements, _load_items(balance.open_items), balance.unapplied_credit)
+    for _, register_type, amount in movements:
+        balance.running_balance += abs(amount) if register_type in INVOICE_REGISTERS else -abs(amount)
+    if rows:
+        TallyTransaction.objects.filter(pk__in=[pk for pk, *_ in rows]).update(balance_applied=True)
+        balance.transaction_count += len(rows)
+        balance.total_amount += sum((a for _, _, _, a, _ in rows), ZERO)
+        balance.last_transaction_date = rows[-1][1]
+        balance.last_transaction_id = max(balance.last_transaction_id, max(pk for pk, *_ in rows))
+    balance.open_items = _dump_items(open_items)
+    balance.unapplied_credit = unapplied
+    balance.as_of = as_of
+    for field, value in bucket_open_items(open_items, as_of).items():
+        setattr(balance, field, value)
+    return True
+
+
+def refresh_client_balances(client_ids, as_of=None, rebuild=False):
+    """
+    Bring the ClientBalance rows of the given clients up to date and age them as of `as_of`.
+
+    A row whose FIFO state is stored only takes in the transactions not yet balance_applied;
+    clients without one, with back-dated new vouchers, or with rebuild=True (stored vouchers or
+    opening balances changed) are recomputed from their full history.
+    """
+    client_ids = {pk for pk in client_ids if pk is not None}
+    if not client_ids:
+        return 0
+    as_of = as_of or date.today()
+    full = set(client_ids)
+    balances = []
+    # The applied flags and the balance rows they were folded into are saved together
+    with db_transaction.atomic():
+        if not rebuild:
+            for balance in ClientBalance.objects.filter(client_id__in=client_ids, last_transaction_id__isnull=False):
+                if _append(balance, as_of):
+                    balances.append(balance)
+                    full.discard(balance.client_id)
+        if full:
+            balances.extend(_rebuild(full, as_of))
+        update_fields = [f.name for f in ClientBalance._meta.concrete_fields if not f.primary_key]
+        ClientBalance.objects.bulk_create(balances, update_conflicts=True, unique_fields=['client'],
+                                          update_fields=update_fields)
+    logger.info(f"Refreshed balances of {len(balances)} clients as of {as_of} "
+                f"({len(balances) - len(full)} incrementally, {len(full)} rebuilt)")
+    return len(balances)
+
+
+def roll_aging_forward(as_of=None):
+    """
+    Re-bucket the rows aged on an earlier day from their stored open items; no transaction is
+    read. Returns the ids of the clients that need a full refresh instead: those without a row
+    or whose row predates the stored FIFO state.
+    """
+    as_of = as_of or date.today()
+    stale = list(ClientBalance.objects.filter(as_of__lt=as_of, last_transaction_id__isnull=False))
+    for balance in stale:
+        balance.as_of = as_of
+        for field, value in bucket_open_items(_load_items(balance.open_items), as_of).items():
+            setattr(balance, field, value)
+    ClientBalance.objects.bulk_update(stale, [field for field, _ in AGING_BUCKETS] + ['as_of'], batch_size=1000)
+    if stale:
+        logger.info(f"Rolled aging of {len(stale)} client balances forward to {as_of}")
+    return list(
+        Client.objects.filter(models.Q(balance__isnull=True) | models.Q(balance__last_transaction_id__isnull=True))
+        .values_list('id', flat=True)
+    )
+
+
+def client_balances():
+    """
+    Every client's ClientBalance, as maintained by the analytics jobs; a pure read. Each row's
+    aging is as of its `as_of`, which the jobs roll forward daily (see jobs.roll_aging_if_due).
+    """
+    return ClientBalance.objects.select_related('client').order_by('client__name')
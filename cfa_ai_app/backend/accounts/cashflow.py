@@ -0,0 +1,92 @@
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import models
+from django.db import transaction as db_transaction
+from django.db.models.functions import Abs
+
+from .models import DailyCashflow, LedgerEntry, TallyTransaction
+
+logger = logging.getLogger("cfa.transactions")
+
+ZERO = Decimal('0')
+
+# Days rebuilt per round trip by rebuild_daily_cashflow
+REBUILD_CHUNK_DAYS = 90
+
+
+def _rollup(transactions):
+    """Aggregate a TallyTransaction queryset into unsaved DailyCashflow rows keyed by cell."""
+    cells = {}
+    for row in (transactions.order_by().values('client_id', 'date', 'register_type')
+                .annotate(count=models.Count('id'), total=models.Sum('amount'))):
+        key = (row['client_id'], row['date'], row['register_type'])
+        cells[key] = DailyCashflow(client_id=key[0], date=key[1], register_type=key[2],
+                                   transaction_count=row['count'], total_amount=row['total'] or ZERO)
+    # Ledger amounts carry Tally's sign convention, so totals are taken as magnitudes
+    ledger_totals = (
+        LedgerEntry.objects.filter(transaction__in=transactions).order_by()
+        .values('transaction__client_id', 'transaction__date', 'transaction__register_type')
+        .annotate(debit=models.Sum(Abs('amount'), filter=models.Q(is_debit=True)),
+                  credit=models.Sum(Abs('amount'), filter=models.Q(is_credit=True)))
+    )
+    for row in ledger_totals:
+        cell = cells.get((row['transaction__client_id'], row['transaction__date'], row['transaction__register_type']))
+        if cell is not None:
+            cell.debit_total = row['debit'] or ZERO
+            cell.credit_total = row['credit'] or ZERO
+    return cells
+
+
+def refresh_daily_cashflow(cells):
+    """
+    Recompute the DailyCashflow rows of the given (client_id, date) cells, every register at
+    once; cells whose vouchers are all gone lose their rows.
+    """
+    dates_by_client = defaultdict(set)
+    for client_id, day in cells:
+        if client_id is not None:
+            dates_by_client[client_id].add(day)
+    rows = 0
+    with db_transaction.atomic():
+        for client_id, dates in dates_by_client.items():
+            DailyCashflow.objects.filter(client_id=client_id, date__in=dates).delete()
+            rollup = _rollup(TallyTransaction.objects.filter(client_id=client_id, date__in=dates))
+            DailyCashflow.objects.bulk_create(rollup.values(), batch_size=1000)
+            rows += len(rollup)
+    return rows
+
+
+def rebuild_daily_cashflow(client_ids=None, start=None, end=None):
+    """
+    Rebuild the rollup from scratch for the given clients (default: all) and optional date
+    range, REBUILD_CHUNK_DAYS at a time. Returns the number of rows written.
+    """
+    transactions = TallyTransaction.objects.exclude(client=None)
+    if client_ids:
+        transactions = transactions.filter(client_id__in=client_ids)
+    if start:
+        transactions = transactions.filter(date__gte=start)
+    if end:
+        transactions = transactions.filter(date__lte=end)
+    bounds = transactions.aggregate(first=models.Min('date'), last=models.Max('date'))
+    if bounds['first'] is None:
+        return 0
+    start, end = start or bounds['first'], end or bounds['last']
+    stale = DailyCashflow.objects.filter(date__gte=start, date__lte=end)
+    if client_ids:
+        stale = stale.filter(client_id__in=client_ids)
+    rows = 0
+    with db_transaction.atomic():
+        stale.delete()
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + timedelta(days=REBUILD_CHUNK_DAYS - 1), end)
+            rollup = _rollup(transactions.filter(date__gte=chunk_start, date__lte=chunk_end))
+            DailyCashflow.objects.bulk_create(rollup.values(), batch_size=1000)
+            rows += len(rollup)
+            chunk_start = chunk_end + timedelta(days=1)
+    logger.info(f"Rebuilt {rows} daily cashflow rows from {start} to {end}")
+    return rows
@@ -0,0 +1,80 @@
+from collections import deque
+from decimal import Decimal
+
+from django.db import models
+from django.db.models.functions import Abs, Coalesce
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+
+# Registers that raise a party's receivable and those that settle it, for every FIFO consumer:
+# the open-item index, the client balances and the payment scores
+INVOICE_REGISTERS = ('sales',)
+SETTLEMENT_REGISTERS = ('receipt',)
+RECEIVABLE_REGISTERS = INVOICE_REGISTERS + SETTLEMENT_REGISTERS
+
+
+def with_party_amount(transactions):
+    """
+    Annotate party_amount: the magnitude of the voucher's line on the party's own ledger, else
+    of the voucher amount (which is blank, and so summed to ~0, on many Tally vouchers).
+    """
+    return transactions.annotate(party_amount=Coalesce(
+        models.Sum(Abs('ledger_entries__amount'),
+                   filter=models.Q(ledger_entries__ledger_name=models.F('party_name'))),
+        Abs('amount'),
+    ))
+
+
+def movement_amount(txn, ledger_rows):
+    """In-memory twin of with_party_amount for a voucher being ingested."""
+    party_lines = [row['amount'] for row in ledger_rows if row.get('ledger_name') == txn.party_name]
+    amount = sum(abs(Decimal(str(a))) for a in party_lines) if party_lines else abs(Decimal(str(txn.amount)))
+    return amount.quantize(CENT)
+
+
+class OpenAmount:
+    """An open invoice held only in memory: its date and what is left to pay."""
+
+    __slots__ = ('date', 'remaining')
+
+    def __init__(self, date, remaining):
+        self.date = date
+        self.remaining = remaining
+
+
+class FifoQueue:
+    """
+    Open invoices oldest first plus the credit not yet applied to any of them.
+
+    Items are anything with a date and a remaining amount: OpenItem rows for the open-item
+    index, OpenAmount for the client balances. Each call returns the (item, amount) allocations
+    it made, which the payment scores turn into delays.
+    """
+
+    def __init__(self, items=(), unapplied=ZERO):
+        self.items = deque(items)
+        self.unapplied = unapplied
+
+    def invoice(self, item):
+        """Queue a new invoice whose remaining is its full amount. Credit received in advance pays it first."""
+        applied = min(self.unapplied, item.remaining)
+        self.unapplied -= applied
+        item.remaining -= applied
+        if item.remaining > 0:
+            self.items.append(item)
+        return [(item, applied)] if applied > 0 else []
+
+    def settle(self, amount):
+        """Allocate a receipt to the oldest open invoices; what is left over becomes unapplied credit."""
+        allocations = []
+        while amount > 0 and self.items:
+            item = self.items[0]
+            applied = min(item.remaining, amount)
+            item.remaining -= applied
+            amount -= applied
+            allocations.append((item, applied))
+            if item.remaining <= 0:
+                self.items.popleft()
+        self.unapplied += amount
+        return allocations
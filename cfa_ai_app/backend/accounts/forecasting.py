@@ -0,0 +1,175 @@
+import logging
+import time
+import warnings
+from datetime import date, timedelta
+
+from .models import DailyCashflow
+
+# NumPy does the array work; without it forecasting is reported as unavailable
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger("cfa.transactions")
+
+FORECASTING_AVAILABLE = np is not None
+
+# Registers that move money in and out of the bank; sales and purchases are accruals
+INFLOW_REGISTERS = ('receipt',)
+OUTFLOW_REGISTERS = ('payment',)
+
+# Days of history loaded per forecast, and the recent part the weekday baseline is fitted on
+HISTORY_DAYS = 730
+BASELINE_DAYS = 120
+
+DEFAULT_HORIZONS = (30, 60, 90)
+MAX_HORIZON_DAYS = 365
+
+# A day of the month counts as a recurring flow when it had one in at least this many of the
+# last RECURRING_LOOKBACK_MONTHS full months, with amounts varying by at most RECURRING_MAX_CV
+# and at least RECURRING_MIN_RATIO times the typical day's flow (so daily trade is not "monthly")
+RECURRING_LOOKBACK_MONTHS = 6
+RECURRING_MIN_MONTHS = 4
+RECURRING_MAX_CV = 0.25
+RECURRING_MIN_RATIO = 3.0
+
+# Two-sided normal quantile of the confidence band
+BAND_Z = 1.2816  # 80%
+
+
+def load_daily_flows(client_id, as_of, history_days=HISTORY_DAYS):
+    """
+    One query over the DailyCashflow rollup. Returns (start date, inflow array, outflow array)
+    with one element per day from start to as_of inclusive. Receipts count their debit side (money
+    into the bank), payments their credit side (money out of it).
+    """
+    start = as_of - timedelta(days=history_days - 1)
+    rows = DailyCashflow.objects.filter(
+        client_id=client_id, date__gte=start, date__lte=as_of,
+        register_type__in=INFLOW_REGISTERS + OUTFLOW_REGISTERS,
+    ).values_list('date', 'register_type', 'debit_total', 'credit_total')
+    inflow = np.zeros(history_days)
+    outflow = np.zeros(history_days)
+    days, registers, amounts = [], [], []
+    for day, register_type, debit, credit in rows:
+        is_inflow = register_type in INFLOW_REGISTERS
+        days.append((day - start).days)
+        registers.append(is_inflow)
+        amounts.append(float(debit if is_inflow else credit))
+    if days:
+        days = np.asarray(days)
+        is_inflow = np.asarray(registers, dtype=bool)
+        amounts = np.asarray(amounts)
+        np.add.at(inflow, days[is_inflow], amounts[is_inflow])
+        np.add.at(outflow, days[~is_inflow], amounts[~is_inflow])
+    return start, inflow, outflow
+
+
+def _calendar(start, days):
+    """Month index (from start's month) and zero-based day of month of each of `days` days."""
+    dates = np.datetime64(start, 'D') + np.arange(days)
+    months = dates.astype('datetime64[M]')
+    return (months - months[0]).astype(int), (dates - months).astype(int)
+
+
+def detect_recurring(start, series):
+    """
+    Find days of the month with a flow in most recent full months at a steady amount.
+    Returns 31 typical amounts, indexed by zero-based day of month (0 where nothing recurs).
+    """
+    month_idx, dom = _calendar(start, len(series))
+    matrix = np.zeros((month_idx[-1] + 1, 31))
+    np.add.at(matrix, (month_idx, dom), series)
+    # Skip the current, partial month
+    recent = matrix[-RECURRING_LOOKBACK_MONTHS - 1:-1]
+    recurring = np.zeros(31)
+    if len(recent) < RECURRING_MIN_MONTHS:
+        return recurring
+    present = recent > 0
+    counts = present.sum(axis=0)
+    masked = np.where(present, recent, np.nan)
+    with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+        # All-NaN columns (days that never had a flow) are expected
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(masked, axis=0)
+        cv = np.nanstd(masked, axis=0) / np.nanmean(masked, axis=0)
+    flows = series[series > 0]
+    typical = float(np.median(flows)) if len(flows) else 0.0
+    steady = (counts >= RECURRING_MIN_MONTHS) & (cv <= RECURRING_MAX_CV) & (median >= RECURRING_MIN_RATIO * typical)
+    recurring[steady] = median[steady]
+    return recurring
+
+
+def forecast_cashflow(client_id, as_of=None, horizons=DEFAULT_HORIZONS, opening_balance=None):
+    """
+    Project a client's cash position over the given horizons (days).
+
+    Net daily flow = receipts - payments from the DailyCashflow rollup. Steady monthly flows
+    (rent, salaries, EMIs) are detected per day of the month and projected on their days; the
+    rest is projected with a weekday profile fitted on the last BASELINE_DAYS. The band widens
+    with the square root of the horizon from the baseline's residual spread.
+    opening_balance defaults to the net of all loaded history.
+    """
+    if not FORECASTING_AVAILABLE:
+        raise RuntimeError("Cash-flow forecasting needs NumPy installed on the backend")
+    started = time.monotonic()
+    as_of = as_of or date.today()
+    horizon = min(max(horizons), MAX_HORIZON_DAYS)
+    start, inflow, outflow = load_daily_flows(client_id, as_of)
+
+    recurring_in = detect_recurring(start, inflow)
+    recurring_out = detect_recurring(start, outflow)
+    _, dom = _calendar(start, len(inflow))
+    # Take recurring flows out of the history so the baseline does not count them twice
+    residual_in = np.clip(inflow - np.where(recurring_in[dom] > 0, np.minimum(inflow, recurring_in[dom]), 0), 0, None)
+    residual_out = np.clip(outflow - np.where(recurring_out[dom] > 0, np.minimum(outflow, recurring_out[dom]), 0), 0, None)
+
+    recent = slice(-BASELINE_DAYS, None)
+    weekdays = (np.arange(len(inflow)) + start.weekday()) % 7
+    counts = np.bincount(weekdays[recent], minlength=7)
+    base_in = np.bincount(weekdays[recent], weights=residual_in[recent], minlength=7) / np.maximum(counts, 1)
+    base_out = np.bincount(weekdays[recent], weights=residual_out[recent], minlength=7) / np.maximum(counts, 1)
+    fitted_net = base_in[weekdays[recent]] - base_out[weekdays[recent]]
+    sigma = float(np.std((residual_in - residual_out)[recent] - fitted_net))
+
+    future = np.arange(1, horizon + 1)
+    future_dates = [as_of + timedelta(days=int(d)) for d in future]
+    future_weekdays = (as_of.weekday() + future) % 7
+    _, future_dom = _calendar(as_of, horizon + 1)
+    future_dom = future_dom[1:]
+    proj_in = base_in[future_weekdays] + recurring_in[future_dom]
+    proj_out = base_out[future_weekdays] + recurring_out[future_dom]
+    if opening_balance is None:
+        opening_balance = float(inflow.sum() - outflow.sum())
+    position = opening_balance + np.cumsum(proj_in - proj_out)
+    spread = BAND_Z * sigma * np.sqrt(future)
+
+    result = {
+        'as_of': as_of,
+        'opening_balance': round(opening_balance, 2),
+        'horizons': [],
+        'recurring': [
+            {'day_of_month': int(d) + 1, 'direction': direction, 'amount': round(float(amounts[d]), 2)}
+            for direction, amounts in (('inflow', recurring_in), ('outflow', recurring_out))
+            for d in np.flatnonzero(amounts)
+        ],
+        'daily': [
+            {'date': day, 'inflow': round(float(i), 2), 'outflow': round(float(o), 2),
+             'position': round(float(p), 2), 'lower': round(float(p - s), 2), 'upper': round(float(p + s), 2)}
+            for day, i, o, p, s in zip(future_dates, proj_in, proj_out, position, spread)
+        ],
+    }
+    for days in sorted(h for h in horizons if 0 < h <= horizon):
+        end = days - 1
+        result['horizons'].append({
+            'days': days,
+            'date': future_dates[end],
+            'inflow': round(float(proj_in[:days].sum()), 2),
+            'outflow': round(float(proj_out[:days].sum()), 2),
+            'position': round(float(position[end]), 2),
+            'lower': round(float(position[end] - spread[end]), 2),
+            'upper': round(float(position[end] + spread[end]), 2),
+        })
+    logger.info(f"Forecast for client {client_id} over {horizon} days in {time.monotonic() - started:.3f}s")
+    return result
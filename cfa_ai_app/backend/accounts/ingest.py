@@ -0,0 +1,427 @@
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .archive import archive_payloads
+from .fifo import RECEIVABLE_REGISTERS, movement_amount
+from .open_items import update_open_items
+from .jobs import enqueue
+from .models import Client, TallyTransaction, LedgerEntry
+
+logger = logging.getLogger("cfa.transactions")
+
+# Rows per bulk_create batch; override with TALLY_INGEST_BATCH_SIZE in settings
+DEFAULT_INGEST_BATCH_SIZE = 1000
+
+# Fields refreshed when a re-sent voucher is upserted; an edit in Tally may change any of them
+UPSERT_UPDATE_FIELDS = ['voucher_no', 'date', 'party_name', 'register_type', 'narration', 'amount',
+                        'raw_hash', 'guid', 'updated_at']
+
+INGEST_MODES = ('skip', 'upsert')
+
+REGISTER_TYPE_MAP = {
+    'sales': 'sales',
+    'purchase': 'purchase',
+    'payment': 'payment',
+    'receipt': 'receipt',
+    'journal': 'journal',
+    'credit note': 'credit_note',
+    'debit note': 'debit_note',
+}
+
+
+def parse_tally_date(date_str, idx):
+    """Parse YYYYMMDD, DD/MM/YYYY or YYYY-MM-DD; fall back to today like the agent always has."""
+    try:
+        if date_str and len(date_str) == 8 and date_str.isdigit():
+            return datetime.strptime(date_str, '%Y%m%d').date()
+        elif date_str and '/' in date_str:
+            return datetime.strptime(date_str, '%d/%m/%Y').date()
+        elif date_str:
+            return datetime.strptime(date_str, '%Y-%m-%d').date()
+    except Exception as ex:
+        logger.warning(f"Transaction {idx}: Invalid date format {date_str}, using today. Error: {ex}")
+    return datetime.now().date()
+
+
+def parse_amount(amount, ledger_entries, idx):
+    """Use the voucher amount, or the sum of its ledger entries when it is blank."""
+    if amount in [None, '', ' ']:
+        try:
+            return sum(float(le.get('amount', 0.0) or 0.0) for le in ledger_entries)
+        except Exception as ex:
+            logger.error(f'Transaction {idx}: Error summing ledger entry amounts: {ex}')
+            return 0.0
+    try:
+        return float(amount)
+    except Exception as ex:
+        logger.error(f'Transaction {idx}: Invalid amount {amount}, using 0. Error: {ex}')
+        return 0.0
+
+
+def resolve_clients(names):
+    """
+    Map client names to Client rows for a whole payload: one query for the names that
+    already exist and one bulk insert for the rest.
+    Returns (clients_by_name, created_count).
+    """
+    names = {name for name in names if name}
+    clients = {c.name: c for c in Client.objects.filter(name__in=names)}
+    missing = names - clients.keys()
+    if missing:
+        # ignore_conflicts covers a concurrent upload creating the same client first
+        Client.objects.bulk_create([Client(name=name, address='') for name in missing], ignore_conflicts=True)
+        clients.update({c.name: c for c in Client.objects.filter(name__in=missing)})
+    return clients, len(missing)
+
+
+def _ledger_entry_rows(ledger_entries, idx):
+    rows = []
+    for le_idx, le in enumerate(ledger_entries):
+        le_amount = le.get('amount', 0.0)
+        try:
+            le_amount = float(le_amount)
+        except Exception as ex:
+            logger.warning(f'Transaction {idx} LedgerEntry {le_idx}: Invalid amount {le_amount}, using 0. Error: {ex}')
+            le_amount = 0.0
+        rows.append(dict(
+            ledger_name=le.get('ledger_name', f'Unknown_{le_idx+1}'),
+            amount=le_amount,
+            is_debit=le.get('is_debit', False),
+            is_credit=le.get('is_credit', False),
+        ))
+    return rows
+
+
+def _raw_payloads(tx, ledger_entries):
+    """The original Tally voucher and ledger entry dicts the agent sent along, if any."""
+    ledger_raw = [le.get('all_fields') or le.get('raw_data') or {} for le in ledger_entries]
+    return tx.get('voucher_all_fields') or {}, ledger_raw
+
+
+def _archive_raw(rows, raws):
+    """Archive the raw payloads of a batch in one pass and point its rows at them by hash."""
+    payloads = []
+    for voucher_raw, ledger_raw in raws:
+        payloads.append(voucher_raw)
+        payloads.extend(ledger_raw)
+    if not any(payloads):
+        return
+    hashes = iter(archive_payloads(payloads))
+    for (_, _, txn, ledger_rows), _ in zip(rows, raws):
+        txn.raw_hash = next(hashes)
+        for row in ledger_rows:
+            row['raw_hash'] = next(hashes)
+
+
+def _normalize_row(tx, idx, client):
+    """
+    Map one agent payload row to (identity, TallyTransaction, ledger entry field dicts, raw
+    payloads); see _identity.
+    """
+    party_name = tx.get('party_name') or tx.get('client_name') or 'Unknown'
+    numbered = bool(tx.get('voucher_no') or tx.get('voucher_number'))
+    voucher_no = tx.get('voucher_no') or tx.get('voucher_number') or f'V{idx+1}'
+    guid = str(tx.get('guid') or (tx.get('voucher_all_fields') or {}).get('GUID') or '').strip() or None
+    voucher_type = (tx.get('voucher_type') or tx.get('register_type') or 'journal').lower()
+    ledger_entries = tx.get('ledger_entries') or tx.get('entries') or []
+    date_obj = parse_tally_date(tx.get('date', ''), idx)
+    register_type = REGISTER_TYPE_MAP.get(voucher_type, 'journal')
+    amount = parse_amount(tx.get('amount', None), ledger_entries, idx)
+    txn = TallyTransaction(
+        client=client,
+        voucher_no=voucher_no,
+        date=date_obj,
+        party_name=party_name,
+        narration=tx.get('narration', ''),
+        amount=amount,
+        register_type=register_type,
+        guid=guid,
+    )
+    return _identity(txn, numbered), txn, _ledger_entry_rows(ledger_entries, idx), _raw_payloads(tx, ledger_entries)
+
+
+def _natural_key(txn):
+    """What identifies a numbered voucher the agent sent without a Tally GUID."""
+    return (txn.client_id, txn.voucher_no, txn.date, txn.party_name, txn.register_type)
+
+
+def _identity(txn, numbered):
+    """
+    What a re-sent voucher is matched on: its Tally GUID, which survives edits to its number,
+    date or party, else its natural key. None for a voucher with neither a GUID nor a number of
+    its own (its placeholder number is only unique within one payload), which never matches.
+    """
+    if txn.guid:
+        return ('guid', txn.client_id, txn.guid, _natural_key(txn) if numbered else None)
+    if numbered:
+        return ('natural', _natural_key(txn))
+    return None
+
+
+def _stored_rows(identities):
+    """
+    Two set-based lookups for the vouchers of a batch that are already stored: by GUID, then by
+    natural key among rows stored without one (before the agent sent GUIDs), which a GUID row
+    adopts. Returns {identity: (id, party_name, date, register_type, guid)} of the stored rows.
+    """
+    identities = {i for i in identities if i}
+    by_guid = defaultdict(set)
+    for _, client_id, guid, _ in (i for i in identities if i[0] == 'guid'):
+        by_guid[client_id].add(guid)
+    found = {}
+    for client_id, guids in by_guid.items():
+        for pk, guid, *stored in TallyTransaction.objects.filter(client_id=client_id, guid__in=guids).values_list(
+                'id', 'guid', 'party_name', 'date', 'register_type'):
+            found[(client_id, guid)] = (pk, *stored, guid)
+    naturals = {}
+    for identity in identities:
+        if identity[0] == 'natural':
+            naturals[identity] = identity[1]
+        elif identity[3] and (identity[1], identity[2]) not in found:
+            naturals[identity] = identity[3]
+    legacy = {}
+    if naturals:
+        candidates = TallyTransaction.objects.filter(
+            guid__isnull=True,
+            client_id__in={k[0] for k in naturals.values()},
+            voucher_no__in={k[1] for k in naturals.values()},
+            date__in={k[2] for k in naturals.values()},
+        ).order_by('-id').values_list('id', 'client_id', 'voucher_no', 'date', 'party_name', 'register_type')
+        for pk, *key in candidates:
+            # Oldest row first when the baseline stored a key more than once
+            legacy[tuple(key)] = (pk, key[3], key[2], key[4], None)
+    stored = {}
+    for identity in identities:
+        if identity[0] == 'guid' and (identity[1], identity[2]) in found:
+            stored[identity] = found[(identity[1], identity[2])]
+        elif identity in naturals and naturals[identity] in legacy:
+            stored[identity] = legacy[naturals[identity]]
+    return stored
+
+
+def _insert_batch(batch, batch_size):
+    """
+    Insert a batch of (idx, txn, ledger rows) with two bulk_create calls.
+    Returns the list of (idx, error) for rows that could not be saved.
+    """
+    try:
+        with db_transaction.atomic():
+            TallyTransaction.objects.bulk_create([txn for _, txn, _ in batch], batch_size=batch_size)
+            LedgerEntry.objects.bulk_create(
+                [LedgerEntry(transaction=txn, **row) for _, txn, rows in batch for row in rows],
+                batch_size=batch_size
+            )
+        return []
+    except Exception as e:
+        logger.warning(f"Bulk insert of {len(batch)} transactions failed ({e}), retrying row by row")
+    # Fall back to row-by-row inserts so a single bad row is reported instead of failing the batch
+    failed = []
+    for idx, txn, rows in batch:
+        txn.pk = None
+        try:
+            with db_transaction.atomic():
+                txn.save()
+                LedgerEntry.objects.bulk_create([LedgerEntry(transaction=txn, **row) for row in rows])
+        except Exception as e:
+            logger.error(f"Error saving transaction at idx {idx}: {e}")
+            failed.append((idx, str(e)))
+    return failed
+
+
+def _upsert_batch(batch, batch_size):
+    """
+    Write a batch of (idx, txn, ledger rows, stored row or None): bulk_update the vouchers that
+    are stored, bulk_create the rest, then replace the ledger entries of all of them.
+    Returns the list of (idx, error) on failure.
+    """
+    now = timezone.now()
+    updates = []
+    for _, txn, _, stored in batch:
+        if stored:
+            txn.pk = stored[0]
+            txn.updated_at = now
+            updates.append(txn)
+    try:
+        with db_transaction.atomic():
+            TallyTransaction.objects.bulk_update(updates, UPSERT_UPDATE_FIELDS, batch_size=batch_size)
+            TallyTransaction.objects.bulk_create([txn for _, txn, _, stored in batch if not stored],
+                                                 batch_size=batch_size)
+            LedgerEntry.objects.filter(transaction_id__in=[txn.pk for txn in updates]).delete()
+            LedgerEntry.objects.bulk_create(
+                [LedgerEntry(transaction=txn, **row) for _, txn, rows, _ in batch for row in rows],
+                batch_size=batch_size
+            )
+        return []
+    except Exception as e:
+        logger.error(f"Upsert of {len(batch)} transactions failed: {e}")
+        return [(idx, str(e)) for idx, _, _, _ in batch]
+
+
+def enqueue_analytics(client_ids, days=(), parties=None, changed=()):
+    """
+    Queue the recomputations an ingest makes necessary: client balances (rebuilt for clients in
+    `changed`, whose stored vouchers were updated), the DailyCashflow cells of the touched days
+    and the payment scores of parties with new sales or receipts.
+    """
+    dates = defaultdict(set)
+    for client_id, day in days:
+        dates[client_id].add(day.isoformat())
+    for client_id in client_ids:
+        enqueue('client_balance', client_id, {'rebuild': True} if client_id in changed else None)
+        if dates[client_id]:
+            enqueue('daily_cashflow', client_id, {'dates': sorted(dates[client_id])})
+        if parties and parties.get(client_id):
+            enqueue('payment_scores', client_id, {'parties': sorted(parties[client_id])})
+
+
+def ingest_transactions(tx_list, client=None, batch_size=None, mode='skip', client_for_row=None):
+    """
+    Store agent transaction rows in batches.
+
+    Rows belong to `client`, or to whatever client_for_row(tx, idx) returns; a row for which it
+    returns None is reported as an error. A row is identified by its Tally GUID, else by its
+    natural key (client, voucher_no, date, party_name, register_type); see _identity. In 'skip'
+    mode rows already stored, or repeated in the payload, are skipped. In 'upsert' mode they
+    update the stored row in place, number, date and party included, and replace its ledger
+    entries; the last repeat in a payload wins. Rows without a GUID or voucher number cannot be
+    matched: 'skip' mode stores them, 'upsert' mode rejects them. Each batch resolves stored
+    rows with set-based lookups and writes in bulk. Raw Tally dicts sent along (voucher_all_fields,
+    all_fields) go to RawPayloadArchive and rows keep only their raw_hash.
+    The open-item index is updated in the same transaction; balances, the cashflow rollup and
+    payment scores are queued as analytics jobs (see enqueue_analytics).
+    Returns a dict with 'created', 'updated', 'skipped' counts, 'errors' ({'idx', 'reason'})
+    and the touched 'client_ids'.
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingest mode: {mode}")
+    batch_size = batch_size or getattr(settings, 'TALLY_INGEST_BATCH_SIZE', DEFAULT_INGEST_BATCH_SIZE)
+    started = time.monotonic()
+    created = 0
+    updated = 0
+    skipped = 0
+    errors = []
+    seen = set()
+    touched = set()
+    touched_days = set()
+    touched_parties = defaultdict(set)
+    changed_clients = set()
+    # Open-item index input: sales/receipts created by this ingest, and parties whose stored ones changed
+    new_movements = defaultdict(list)
+    dirty_parties = set()
+
+    def track_movement(txn, ledger_rows, is_new):
+        if txn.register_type not in RECEIVABLE_REGISTERS:
+            return
+        party = (txn.client_id, txn.party_name)
+        if is_new:
+            new_movements[party].append((txn.pk, txn.date, txn.register_type, movement_amount(txn, ledger_rows)))
+        else:
+            dirty_parties.add(party)
+
+    with db_transaction.atomic():
+        for start in range(0, len(tx_list), batch_size):
+            rows = []
+            raws = []
+            for idx in range(start, min(start + batch_size, len(tx_list))):
+                tx = tx_list[idx]
+                if not isinstance(tx, dict):
+                    skipped += 1
+                    errors.append({'idx': idx, 'reason': 'transaction is not an object'})
+                    continue
+                row_client = client_for_row(tx, idx) if client_for_row else client
+                if row_client is None:
+                    skipped += 1
+                    errors.append({'idx': idx, 'reason': 'missing party_name'})
+                    continue
+                identity, txn, ledger_rows, raw = _normalize_row(tx, idx, row_client)
+                touched.add(row_client.pk)
+                touched_days.add((row_client.pk, txn.date))
+                if txn.register_type in RECEIVABLE_REGISTERS:
+                    touched_parties[row_client.pk].add(txn.party_name)
+                rows.append((idx, identity, txn, ledger_rows))
+                raws.append(raw)
+            _archive_raw(rows, raws)
+            existing = _stored_rows(identity for _, identity, _, _ in rows)
+            if mode == 'upsert':
+                # One row per voucher so no stored row is written twice in a batch
+                by_key = {}
+                for idx, identity, txn, ledger_rows in rows:
+                    if identity is None:
+                        skipped += 1
+                        errors.append({'idx': idx, 'reason': 'voucher has no GUID or voucher number to upsert by'})
+                        continue
+                    if identity in by_key:
+                        skipped += 1
+                        errors.append({'idx': by_key[identity][0], 'reason': 'superseded by a later row in the payload'})
+                    by_key[identity] = (idx, txn, ledger_rows)
+                batch = []
+                claimed = set()
+                for identity, (idx, txn, ledger_rows) in by_key.items():
+                    stored = existing.get(identity)
+                    if stored and stored[0] in claimed:
+                        stored = None
+                    if stored:
+                        claimed.add(stored[0])
+                    batch.append((idx, txn, ledger_rows, stored))
+                failed = _upsert_batch(batch, batch_size)
+                failed_idx = {idx for idx, _ in failed}
+                for idx, txn, ledger_rows, stored in batch:
+                    if idx in failed_idx:
+                        continue
+                    if stored is None:
+                        created += 1
+                        track_movement(txn, ledger_rows, True)
+                        continue
+                    updated += 1
+                    changed_clients.add(txn.client_id)
+                    track_movement(txn, ledger_rows, False)
+                    # The voucher may have moved to another party, day or register
+                    _, old_party, old_date, old_register, _ = stored
+                    touched_days.add((txn.client_id, old_date))
+                    if old_register in RECEIVABLE_REGISTERS:
+                        dirty_parties.add((txn.client_id, old_party))
+                        touched_parties[txn.client_id].add(old_party)
+            else:
+                batch = []
+                adopted = []
+                claimed = set()
+                for idx, identity, txn, ledger_rows in rows:
+                    stored = existing.get(identity)
+                    if stored and stored[0] in claimed:
+                        # Another voucher of the payload already matched that stored row
+                        stored = None
+                    if identity is not None and (stored or identity in seen):
+                        logger.info(f"Skipping duplicate transaction at idx {idx}: {identity}")
+                        skipped += 1
+                        errors.append({'idx': idx, 'reason': 'duplicate transaction'})
+                        if stored:
+                            claimed.add(stored[0])
+                            if stored[4] is None and txn.guid:
+                                # A row stored before GUIDs were sent takes this one's
+                                adopted.append(TallyTransaction(pk=stored[0], guid=txn.guid))
+                        continue
+                    seen.add(identity)
+                    batch.append((idx, txn, ledger_rows))
+                TallyTransaction.objects.bulk_update(adopted, ['guid'], batch_size=batch_size)
+                failed = _insert_batch(batch, batch_size)
+                created += len(batch) - len(failed)
+                failed_idx = {idx for idx, _ in failed}
+                for idx, txn, ledger_rows in batch:
+                    if idx not in failed_idx:
+                        track_movement(txn, ledger_rows, True)
+            skipped += len(failed)
+            errors.extend({'idx': idx, 'reason': reason} for idx, reason in failed)
+        update_open_items(new_movements, dirty_parties)
+        enqueue_analytics(touched, touched_days, touched_parties, changed_clients)
+    elapsed = time.monotonic() - started
+    rate = len(tx_list) / elapsed if elapsed > 0 else 0
+    logger.info(f"Ingested {len(tx_list)} rows in {mode} mode ({created} created, {updated} updated, "
+                f"{skipped} skipped) in {elapsed:.2f}s, {rate:.0f} rows/s")
+    return {'created': created, 'updated': updated, 'skipped': skipped, 'errors': errors,
+            'client_ids': sorted(touched)}
@@ -0,0 +1,252 @@
+import logging
+import threading
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .balances import refresh_client_balances, roll_aging_forward
+from .cashflow import refresh_daily_cashflow
+from .models import AnalyticsJob
+from .segmentation import refresh_payment_scores
+
+logger = logging.getLogger("cfa.transactions")
+
+# Seconds the worker sleeps when the queue is empty; enqueue() wakes it sooner
+WORKER_POLL_SECONDS = 5
+# A job still 'running' after this long belongs to a dead worker and is picked up again
+JOB_LEASE_SECONDS = 600
+# A live worker renews the lease of its running job this often, so long jobs are never taken over
+LEASE_RENEW_SECONDS = JOB_LEASE_SECONDS / 4
+# Failed jobs are retried with exponential backoff, then left as 'failed' for inspection
+MAX_JOB_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 30
+
+
+def _dates(payload):
+    return {date.fromisoformat(d) for d in payload.get('dates', [])}
+
+
+# kind -> handler(client_id, payload)
+JOB_HANDLERS = {
+    # rebuild=True when stored vouchers or opening balances changed, not just new ones arrived
+    'client_balance': lambda client_id, payload: refresh_client_balances([client_id], rebuild=payload.get('rebuild', False)),
+    'daily_cashflow': lambda client_id, payload: refresh_daily_cashflow({(client_id, d) for d in _dates(payload)}),
+    # parties=None rescores every party of the client
+    'payment_scores': lambda client_id, payload: refresh_payment_scores(client_id, payload.get('parties')),
+}
+
+
+def merge_payloads(old, new):
+    """
+    Union the list fields of two payloads of the same job; None (meaning "all") absorbs any list.
+    Boolean flags are or-ed.
+    """
+    merged = dict(old)
+    for key, value in new.items():
+        current = merged.get(key, [])
+        if isinstance(value, bool):
+            merged[key] = bool(current) or value
+        else:
+            merged[key] = None if current is None or value is None else sorted(set(current) | set(value))
+    return merged
+
+
+def enqueue(kind, client_id, payload=None):
+    """
+    Queue a job, or merge payload into the client's pending job of the same kind. Joins the
+    caller's transaction: the job is only visible, and the worker only woken, once it commits.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown analytics job kind: {kind}")
+    payload = payload or {}
+    for _ in range(3):
+        try:
+            with db_transaction.atomic():
+                job = (AnalyticsJob.objects.select_for_update()
+                       .filter(kind=kind, client_id=client_id, status='pending').first())
+                if job:
+                    job.payload = merge_payloads(job.payload, payload)
+                    job.save(update_fields=['payload', 'updated_at'])
+                else:
+                    AnalyticsJob.objects.create(kind=kind, client_id=client_id, payload=payload,
+                                                run_after=timezone.now())
+            break
+        except IntegrityError:
+            # Another request created the pending job first; merge into it on the next pass
+            continue
+    db_transaction.on_commit(worker.wake)
+
+
+def _reclaim_expired(now):
+    """
+    Put the jobs of dead workers back in the queue one by one. A job whose (kind, client) got a
+    new pending job meanwhile is merged into that one instead, keeping one pending job per key.
+    """
+    stale = now - timedelta(seconds=JOB_LEASE_SECONDS)
+    for job in AnalyticsJob.objects.filter(status='running', updated_at__lt=stale):
+        for _ in range(3):
+            try:
+                with db_transaction.atomic():
+                    AnalyticsJob.objects.filter(pk=job.pk, status='running', updated_at__lt=stale).update(
+                        status='pending', updated_at=now)
+                break
+            except IntegrityError:
+                if _merge_into_pending(job):
+                    break
+
+
+def _claim_next():
+    """Atomically move the oldest due job to 'running'; None when nothing is due."""
+    now = timezone.now()
+    _reclaim_expired(now)
+    for job in AnalyticsJob.objects.filter(status='pending', run_after__lte=now).order_by('run_after', 'id')[:10]:
+        # Conditional update so two workers never run the same job
+        if AnalyticsJob.objects.filter(pk=job.pk, status='pending').update(status='running', updated_at=now):
+            job.status = 'running'
+            return job
+    return None
+
+
+class _LeaseRenewer:
+    """Side thread touching a running job's updated_at until the job finishes."""
+
+    def __init__(self, job):
+        self.job = job
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"analytics-lease-{job.pk}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while not self._stop.wait(LEASE_RENEW_SECONDS):
+                try:
+                    AnalyticsJob.objects.filter(pk=self.job.pk, status='running').update(updated_at=timezone.now())
+                except Exception as e:
+                    logger.warning(f"Could not renew the lease of analytics job {self.job.pk}: {e}")
+        finally:
+            connection.close()
+
+
+def _merge_into_pending(job):
+    """
+    Fold a failed or expired job's payload into the pending job of the same kind and client that
+    a newer trigger queued meanwhile, then drop it. False when no pending job exists (any more).
+    """
+    with db_transaction.atomic():
+        pending = (AnalyticsJob.objects.select_for_update()
+                   .filter(kind=job.kind, client_id=job.client_id, status='pending').exclude(pk=job.pk).first())
+        if pending is None:
+            return False
+        pending.payload = merge_payloads(pending.payload, job.payload)
+        pending.save(update_fields=['payload', 'updated_at'])
+        job.delete()
+    return True
+
+
+def run_job(job):
+    started = time.monotonic()
+    try:
+        with _LeaseRenewer(job), db_transaction.atomic():
+            JOB_HANDLERS[job.kind](job.client_id, job.payload)
+    except Exception as e:
+        job.attempts += 1
+        job.last_error = f"{type(e).__name__}: {e}"
+        if job.attempts >= MAX_JOB_ATTEMPTS:
+            job.status = 'failed'
+        else:
+            job.status = 'pending'
+            job.run_after = timezone.now() + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        for _ in range(3):
+            try:
+                with db_transaction.atomic():
+                    job.save(update_fields=['attempts', 'last_error', 'status', 'run_after', 'updated_at'])
+                break
+            except IntegrityError:
+                # A newer trigger already queued a job for the same client; carry this payload over
+                if _merge_into_pending(job):
+                    break
+        logger.error(f"Analytics job {job} failed (attempt {job.attempts}): {e}")
+        return False
+    job.delete()
+    logger.info(f"Analytics job {job.kind} for client {job.client_id} done in {time.monotonic() - started:.2f}s")
+    return True
+
+
+# Day the aging of client balances was last rolled forward by this process
+_aged_on = None
+
+
+def roll_aging_if_due(as_of=None):
+    """
+    Once a day, re-age every client balance from its stored open items and queue a rebuild for
+    clients without usable FIFO state, so summaries never have to refresh on read.
+    """
+    global _aged_on
+    as_of = as_of or date.today()
+    if _aged_on == as_of:
+        return
+    with db_transaction.atomic():
+        for client_id in roll_aging_forward(as_of):
+            enqueue('client_balance', client_id, {'rebuild': True})
+    _aged_on = as_of
+
+
+def run_pending_jobs(limit=None):
+    """Run due jobs until the queue is empty (or `limit` jobs ran). Returns the number run."""
+    roll_aging_if_due()
+    ran = 0
+    while limit is None or ran < limit:
+        job = _claim_next()
+        if job is None:
+            break
+        run_job(job)
+        ran += 1
+    return ran
+
+
+class JobWorker:
+    """Background thread of the web process draining the analytics queue."""
+
+    def __init__(self, poll_seconds=WORKER_POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def wake(self):
+        if not getattr(settings, 'ANALYTICS_INLINE_WORKER', True):
+            return
+        self._ensure_started()
+        self._event.set()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="analytics-worker", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._event.wait(self.poll_seconds)
+            self._event.clear()
+            try:
+                close_old_connections()
+                run_pending_jobs()
+            except Exception as e:
+                logger.error(f"Analytics worker error: {e}")
+            finally:
+                close_old_connections()
+
+
+worker = JobWorker()
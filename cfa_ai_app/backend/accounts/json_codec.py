@@ -0,0 +1,48 @@
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+# Fastest available JSON library: orjson, then msgspec, then the standard library.
+# Mirrors the sync agent's json_codec so both ends produce and accept the same compact JSON.
+try:
+    import orjson
+    BACKEND = 'orjson'
+except ImportError:
+    orjson = None
+    try:
+        import msgspec
+        BACKEND = 'msgspec'
+    except ImportError:
+        msgspec = None
+        BACKEND = 'json'
+
+# DRF's encoder knows Decimal, dates, UUIDs, lazy translations, querysets, ...
+_drf_default = JSONEncoder().default
+
+# Datetimes go through DRF's encoder too, so responses keep DRF's wire format ("...Z", not
+# "+00:00"). msgspec always encodes datetimes itself, so with it only decoding is sped up.
+if BACKEND == 'orjson':
+    _orjson_options = orjson.OPT_PASSTHROUGH_DATETIME
+if BACKEND == 'msgspec':
+    _decoder = msgspec.json.Decoder()
+
+
+def dumps(obj, sort_keys=False):
+    """Serialize obj to compact UTF-8 JSON bytes, formatting values exactly as DRF's JSONEncoder."""
+    if BACKEND == 'orjson':
+        options = (_orjson_options | orjson.OPT_SORT_KEYS) if sort_keys else _orjson_options
+        return orjson.dumps(obj, default=_drf_default, option=options)
+    return json.dumps(obj, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':'),
+                      sort_keys=sort_keys).encode('utf-8')
+
+
+def loads(data):
+    """Parse JSON from bytes or str. Invalid input raises ValueError whatever the backend."""
+    if BACKEND == 'orjson':
+        return orjson.loads(data)
+    if BACKEND == 'msgspec':
+        try:
+            return _decoder.decode(data.encode('utf-8') if isinstance(data, str) else data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from e
+    return json.loads(data)
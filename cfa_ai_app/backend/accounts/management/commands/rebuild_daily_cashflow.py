@@ -0,0 +1,34 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.cashflow import rebuild_daily_cashflow
+from accounts.models import Client
+
+
+def _date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected YYYY-MM-DD")
+
+
+class Command(BaseCommand):
+    help = "Rebuild the DailyCashflow rollup from stored transactions, e.g. after a backfill."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', action='append', default=[],
+                            help='Client name to rebuild (repeatable); default is every client')
+        parser.add_argument('--start', type=_date, help='First date to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--end', type=_date, help='Last date to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        client_ids = None
+        if options['client']:
+            clients = dict(Client.objects.filter(name__in=options['client']).values_list('name', 'id'))
+            unknown = set(options['client']) - clients.keys()
+            if unknown:
+                raise CommandError(f"Unknown client(s): {', '.join(sorted(unknown))}")
+            client_ids = list(clients.values())
+        rows = rebuild_daily_cashflow(client_ids, start=options['start'], end=options['end'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} daily cashflow rows"))
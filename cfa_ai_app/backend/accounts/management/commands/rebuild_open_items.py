@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import Client
+from accounts.open_items import rebuild_open_items
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the open-item index (OpenItem, PartyOutstanding) from stored transactions, "
+            "e.g. once after upgrading to backfill vouchers ingested before it existed.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--client', action='append', default=[],
+                            help='Client name to rebuild (repeatable); default is every client')
+
+    def handle(self, *args, **options):
+        client_ids = None
+        if options['client']:
+            clients = dict(Client.objects.filter(name__in=options['client']).values_list('name', 'id'))
+            unknown = set(options['client']) - clients.keys()
+            if unknown:
+                raise CommandError(f"Unknown client(s): {', '.join(sorted(unknown))}")
+            client_ids = list(clients.values())
+        parties = rebuild_open_items(client_ids)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt open items of {parties} parties"))
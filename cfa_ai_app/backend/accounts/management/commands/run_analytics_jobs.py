@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.jobs import WORKER_POLL_SECONDS, run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = ("Run queued analytics jobs (client balances, cashflow rollup, payment scores) and roll "
+            "balance aging forward once a day. "
+            "Use with ANALYTICS_INLINE_WORKER = False to run them outside the web process.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+        parser.add_argument('--poll', type=float, default=WORKER_POLL_SECONDS,
+                            help='Seconds between queue checks when idle')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            ran = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f"Ran {ran} analytics jobs"))
+            return
+        self.stdout.write("Waiting for analytics jobs (Ctrl+C to stop)")
+        try:
+            while True:
+                if not run_pending_jobs():
+                    time.sleep(options['poll'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Identify vouchers by their Tally GUID. Rows stored so far have none (null) and are matched,
+    and adopt a GUID, by their natural key, which is only indexed: Tally allows the same number,
+    date and party on distinct vouchers, so existing rows are never merged or removed here.
+    """
+
+    dependencies = [
+        ('accounts', '0005_alter_tallytransaction_narration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tallytransaction',
+            name='guid',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='tallytransaction',
+            index=models.Index(fields=['client', 'voucher_no', 'date', 'party_name', 'register_type'], name='tallytxn_natural_key_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='tallytransaction',
+            constraint=models.UniqueConstraint(fields=('client', 'guid'), name='uniq_tallytransaction_guid'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_tallytransaction_natural_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='tallytransaction',
+            index=models.Index(fields=['date', 'id'], name='tallytxn_date_id_idx'),
+        ),
+    ]
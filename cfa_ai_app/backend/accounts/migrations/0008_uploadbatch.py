@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_tallytransaction_date_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('upload_id', models.CharField(max_length=64)),
+                ('seq', models.PositiveIntegerField()),
+                ('total', models.PositiveIntegerField(blank=True, null=True)),
+                ('response', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='upload_batches', to='accounts.client')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('upload_id', 'seq'), name='uniq_uploadbatch_upload_seq')],
+            },
+        ),
+    ]
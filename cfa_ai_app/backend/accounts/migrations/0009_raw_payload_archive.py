@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:16
+
+import hashlib
+import json
+import zlib
+
+from django.db import migrations, models
+
+# Ledger entries moved to the archive per round trip
+MIGRATION_BATCH_SIZE = 2000
+
+
+def canonical_json(payload):
+    # Frozen copy of accounts.archive.encode_payload's encoding (compact, sorted keys, UTF-8), so
+    # this migration keeps its meaning when the app's codec changes; the stored JSONField values
+    # are plain JSON, which every codec encodes alike
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode('utf-8')
+
+
+def move_raw_data_to_archive(apps, schema_editor):
+    """Archive every non-empty LedgerEntry.raw_data by content hash and point the row at it."""
+    LedgerEntry = apps.get_model('accounts', 'LedgerEntry')
+    RawPayloadArchive = apps.get_model('accounts', 'RawPayloadArchive')
+    entries = LedgerEntry.objects.exclude(raw_data={}).only('id', 'raw_data').order_by('id')
+    batch = []
+
+    def flush():
+        archived = {}
+        for entry in batch:
+            data = canonical_json(entry.raw_data)
+            entry.raw_hash = hashlib.sha256(data).hexdigest()
+            archived.setdefault(entry.raw_hash, data)
+        RawPayloadArchive.objects.bulk_create(
+            [RawPayloadArchive(content_hash=h, data=zlib.compress(data, 6), size=len(data)) for h, data in archived.items()],
+            ignore_conflicts=True,
+        )
+        LedgerEntry.objects.bulk_update(batch, ['raw_hash'])
+        batch.clear()
+
+    for entry in entries.iterator(chunk_size=MIGRATION_BATCH_SIZE):
+        batch.append(entry)
+        if len(batch) >= MIGRATION_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+
+
+def restore_raw_data(apps, schema_editor):
+    LedgerEntry = apps.get_model('accounts', 'LedgerEntry')
+    RawPayloadArchive = apps.get_model('accounts', 'RawPayloadArchive')
+    payloads = {}
+    entries = list(LedgerEntry.objects.exclude(raw_hash='').only('id', 'raw_hash'))
+    for row in RawPayloadArchive.objects.filter(content_hash__in={e.raw_hash for e in entries}):
+        payloads[row.content_hash] = json.loads(zlib.decompress(bytes(row.data)))
+    for entry in entries:
+        entry.raw_data = payloads.get(entry.raw_hash, {})
+    LedgerEntry.objects.bulk_update(entries, ['raw_data'], batch_size=MIGRATION_BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_uploadbatch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RawPayloadArchive',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ledgerentry',
+            name='raw_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='tallytransaction',
+            name='raw_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.RunPython(move_raw_data_to_archive, restore_raw_data),
+        migrations.RemoveField(
+            model_name='ledgerentry',
+            name='raw_data',
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_raw_payload_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClientBalance',
+            fields=[
+                ('client', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='accounts.client')),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('opening_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('running_balance', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('aging_0_30', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('aging_31_60', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('aging_61_90', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('aging_90_plus', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('last_transaction_date', models.DateField(blank=True, null=True)),
+                ('as_of', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_clientbalance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCashflow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('register_type', models.CharField(choices=[('sales', 'Sales'), ('purchase', 'Purchase'), ('payment', 'Payment'), ('receipt', 'Receipt'), ('journal', 'Journal'), ('credit_note', 'Credit Note'), ('debit_note', 'Debit Note')], max_length=20)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('debit_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('credit_total', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_cashflow', to='accounts.client')),
+            ],
+            options={
+                'ordering': ['client', 'date', 'register_type'],
+                'constraints': [models.UniqueConstraint(fields=('client', 'date', 'register_type'), name='uniq_dailycashflow_cell')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_dailycashflow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentBehaviourScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('party_name', models.CharField(max_length=255)),
+                ('segment', models.CharField(choices=[('prompt', 'Prompt'), ('on_time', 'On-Time'), ('late', 'Late'), ('risky', 'Risky'), ('unknown', 'Unknown')], default='unknown', max_length=10)),
+                ('score', models.FloatField(default=0)),
+                ('invoice_count', models.PositiveIntegerField(default=0)),
+                ('receipt_count', models.PositiveIntegerField(default=0)),
+                ('matched_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('outstanding_amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('avg_delay_days', models.FloatField(blank=True, null=True)),
+                ('delay_std_days', models.FloatField(blank=True, null=True)),
+                ('oldest_open_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_scores', to='accounts.client')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('client', 'party_name'), name='uniq_paymentbehaviourscore_party')],
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_paymentbehaviourscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpenItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('party_name', models.CharField(max_length=255)),
+                ('date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('remaining', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='open_items', to='accounts.client')),
+                ('transaction', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='open_item', to='accounts.tallytransaction')),
+            ],
+            options={
+                'ordering': ['client', 'party_name', 'date', 'transaction_id'],
+                'indexes': [models.Index(fields=['client', 'party_name', 'date', 'transaction'], name='openitem_queue_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='PartyOutstanding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('party_name', models.CharField(max_length=255)),
+                ('outstanding', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('unapplied_credit', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('open_item_count', models.PositiveIntegerField(default=0)),
+                ('oldest_due_date', models.DateField(blank=True, null=True)),
+                ('last_movement_date', models.DateField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='party_outstanding', to='accounts.client')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('client', 'party_name'), name='uniq_partyoutstanding_party')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:02
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_keys(apps, schema_editor):
+    Token = apps.get_model('accounts', 'Token')
+    tokens = list(Token.objects.only('id', 'key'))
+    for token in tokens:
+        token.key_hash = hashlib.sha256(token.key.encode('utf-8')).hexdigest()
+    Token.objects.bulk_update(tokens, ['key_hash'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_analyticsjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='token',
+            name='key_hash',
+            field=models.CharField(default='', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.RunPython(hash_existing_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='token',
+            name='key_hash',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+    ]
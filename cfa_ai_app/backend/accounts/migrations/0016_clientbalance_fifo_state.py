@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_token_key_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientbalance',
+            name='last_transaction_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='clientbalance',
+            name='open_items',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='clientbalance',
+            name='unapplied_credit',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+    ]
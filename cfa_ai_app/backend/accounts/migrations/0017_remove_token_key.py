@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:44
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_clientbalance_fifo_state'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='token',
+            name='key',
+        ),
+    ]
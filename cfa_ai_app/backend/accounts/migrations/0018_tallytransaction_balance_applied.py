@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:01
+
+from django.db import migrations, models
+
+
+def drop_fifo_state(apps, schema_editor):
+    # Stored states predate the flag and counted debit and credit notes: rebuild them all
+    ClientBalance = apps.get_model('accounts', 'ClientBalance')
+    ClientBalance.objects.update(last_transaction_id=None, open_items=[], unapplied_credit=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0017_remove_token_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tallytransaction',
+            name='balance_applied',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='tallytransaction',
+            index=models.Index(condition=models.Q(('balance_applied', False)), fields=['client'], name='tallytxn_balance_pending_idx'),
+        ),
+        migrations.RunPython(drop_fifo_state, migrations.RunPython.noop),
+    ]
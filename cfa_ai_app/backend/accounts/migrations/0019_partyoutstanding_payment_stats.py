@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:04
+
+from django.db import migrations, models
+
+
+def reset_open_items(apps, schema_editor):
+    # Queues built before the statistics existed would score as never matched; parties without
+    # a head are rebuilt on their next ingest or scoring, or all at once by rebuild_open_items
+    apps.get_model('accounts', 'OpenItem').objects.all().delete()
+    apps.get_model('accounts', 'PartyOutstanding').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0018_tallytransaction_balance_applied'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='partyoutstanding',
+            name='invoice_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='partyoutstanding',
+            name='matched_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='partyoutstanding',
+            name='matched_delay_days',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='partyoutstanding',
+            name='matched_delay_squares',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='partyoutstanding',
+            name='receipt_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(reset_open_items, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,6 @@
+import hashlib
+import secrets
+
 from django.db import models
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 
@@ -30,6 +33,15 @@ class TallyTransaction(models.Model):
     
     # Grouping fields
     client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='transactions', null=True, blank=True)
+
+    # Tally's GUID of the voucher: its identity across edits; null when the agent sent none
+    guid = models.CharField(max_length=100, null=True, blank=True)
+
+    # Content hash of the original Tally voucher in RawPayloadArchive, if the agent sent it
+    raw_hash = models.CharField(max_length=64, blank=True, default='')
+
+    # Folded into the client's ClientBalance FIFO state; rows still False are the next refresh's
+    balance_applied = models.BooleanField(default=False)
     
     # Metadata
     created_at = models.DateTimeField(auto_now_add=True)
@@ -42,6 +54,18 @@ class TallyTransaction(models.Model):
             models.Index(fields=['register_type']),
             models.Index(fields=['date']),
             models.Index(fields=['client']),
+            # Keyset pagination order for transaction listings
+            models.Index(fields=['date', 'id'], name='tallytxn_date_id_idx'),
+            # Matches vouchers sent without a GUID; not unique, Tally allows repeated numbers
+            models.Index(fields=['client', 'voucher_no', 'date', 'party_name', 'register_type'],
+                         name='tallytxn_natural_key_idx'),
+            # Rows a balance refresh has yet to fold in
+            models.Index(fields=['client'], condition=models.Q(balance_applied=False),
+                         name='tallytxn_balance_pending_idx'),
+        ]
+        constraints = [
+            # One row per Tally voucher of a client; rows without a GUID (null) are exempt
+            models.UniqueConstraint(fields=['client', 'guid'], name='uniq_tallytransaction_guid'),
         ]
     
     def __str__(self):
@@ -53,11 +77,204 @@ class LedgerEntry(models.Model):
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     is_debit = models.BooleanField()
     is_credit = models.BooleanField()
-    raw_data = models.JSONField(default=dict)  # Store all original ledger entry fields
+    # Content hash of the original ledger entry fields in RawPayloadArchive, if the agent sent them
+    raw_hash = models.CharField(max_length=64, blank=True, default='')
 
     def __str__(self):
         return f"{self.ledger_name}: {self.amount} ({'Dr' if self.is_debit else 'Cr'})"
 
+class ClientBalance(models.Model):
+    """
+    Per-client totals and receivable aging, refreshed by analytics jobs for the clients an ingest
+    touched so summaries read one row instead of aggregating every transaction. Aging is as of
+    `as_of` and rolled forward daily from the stored open items.
+    """
+    client = models.OneToOneField(Client, on_delete=models.CASCADE, related_name='balance', primary_key=True)
+    transaction_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    opening_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    running_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    aging_0_30 = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    aging_31_60 = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    aging_61_90 = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    aging_90_plus = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    last_transaction_date = models.DateField(null=True, blank=True)
+    # FIFO state the next refresh continues from: open debits as [date, remaining], the credit
+    # not yet applied and the newest transaction folded in (null: rebuild from history). Which
+    # transactions are folded in is TallyTransaction.balance_applied, not this id
+    open_items = models.JSONField(default=list)
+    unapplied_credit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    last_transaction_id = models.BigIntegerField(null=True, blank=True)
+    as_of = models.DateField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.client_id}: {self.running_balance} as of {self.as_of}"
+
+class DailyCashflow(models.Model):
+    """
+    Day-level rollup of a client's vouchers per register: debit and credit totals of their ledger
+    entries. Maintained by ingest for the (client, date) cells it touches; see rebuild_daily_cashflow.
+    """
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='daily_cashflow')
+    date = models.DateField()
+    register_type = models.CharField(max_length=20, choices=TallyTransaction.REGISTER_CHOICES)
+    transaction_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    debit_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    credit_total = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['client', 'date', 'register_type']
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'date', 'register_type'], name='uniq_dailycashflow_cell'),
+        ]
+
+    def __str__(self):
+        return f"{self.client_id} {self.date} {self.register_type}: Dr {self.debit_total} Cr {self.credit_total}"
+
+class PaymentBehaviourScore(models.Model):
+    """How promptly one party (party_name) of a client pays its sales invoices; see accounts.segmentation."""
+    SEGMENT_CHOICES = [
+        ('prompt', 'Prompt'),
+        ('on_time', 'On-Time'),
+        ('late', 'Late'),
+        ('risky', 'Risky'),
+        ('unknown', 'Unknown'),
+    ]
+
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='payment_scores')
+    party_name = models.CharField(max_length=255)
+    segment = models.CharField(max_length=10, choices=SEGMENT_CHOICES, default='unknown')
+    score = models.FloatField(default=0)
+    invoice_count = models.PositiveIntegerField(default=0)
+    receipt_count = models.PositiveIntegerField(default=0)
+    matched_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    outstanding_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    avg_delay_days = models.FloatField(null=True, blank=True)
+    delay_std_days = models.FloatField(null=True, blank=True)
+    oldest_open_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'party_name'], name='uniq_paymentbehaviourscore_party'),
+        ]
+
+    def __str__(self):
+        return f"{self.party_name}: {self.segment} ({self.score:.0f})"
+
+class OpenItem(models.Model):
+    """
+    An unpaid (or part-paid) sales invoice of a party, in the per-party FIFO queue receipts are
+    allocated against. Settled invoices leave the queue; see accounts.open_items.
+    """
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='open_items')
+    party_name = models.CharField(max_length=255)
+    transaction = models.OneToOneField(TallyTransaction, on_delete=models.CASCADE, related_name='open_item')
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    remaining = models.DecimalField(max_digits=15, decimal_places=2)
+
+    class Meta:
+        ordering = ['client', 'party_name', 'date', 'transaction_id']
+        indexes = [
+            # FIFO order within a party's queue
+            models.Index(fields=['client', 'party_name', 'date', 'transaction'], name='openitem_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.party_name} {self.date}: {self.remaining} of {self.amount}"
+
+class PartyOutstanding(models.Model):
+    """Head of a party's open-item queue: what it owes, since when, and any unapplied advance."""
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='party_outstanding')
+    party_name = models.CharField(max_length=255)
+    outstanding = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    unapplied_credit = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    open_item_count = models.PositiveIntegerField(default=0)
+    oldest_due_date = models.DateField(null=True, blank=True)
+    last_movement_date = models.DateField(null=True, blank=True)
+    # Every allocation of a receipt to an invoice so far: the amounts matched and their delay in
+    # days, weighted by amount, summed and squared-summed (see accounts.segmentation)
+    invoice_count = models.PositiveIntegerField(default=0)
+    receipt_count = models.PositiveIntegerField(default=0)
+    matched_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    matched_delay_days = models.FloatField(default=0)
+    matched_delay_squares = models.FloatField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['client', 'party_name'], name='uniq_partyoutstanding_party'),
+        ]
+
+    def __str__(self):
+        return f"{self.party_name}: {self.outstanding} outstanding since {self.oldest_due_date}"
+
+class AnalyticsJob(models.Model):
+    """
+    Queued analytics recomputation for one client, run off the request path by accounts.jobs.
+    At most one pending job exists per (kind, client): later triggers merge into its payload.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=40)
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='analytics_jobs')
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    run_after = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='analyticsjob_due_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'client'], condition=models.Q(status='pending'),
+                                    name='uniq_analyticsjob_pending'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for client {self.client_id} ({self.status})"
+
+class RawPayloadArchive(models.Model):
+    """
+    Original Tally voucher and ledger entry dicts, zlib-compressed and stored once per distinct
+    content. Rows reference them by content_hash so the tables reports scan stay narrow.
+    """
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()
+    size = models.PositiveIntegerField()  # uncompressed JSON bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.size} bytes)"
+
+class UploadBatch(models.Model):
+    """One acknowledged batch of a chunked agent upload, kept so re-sent batches are not applied twice."""
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='upload_batches', null=True, blank=True)
+    upload_id = models.CharField(max_length=64)
+    seq = models.PositiveIntegerField()
+    total = models.PositiveIntegerField(null=True, blank=True)
+    response = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['upload_id', 'seq'], name='uniq_uploadbatch_upload_seq'),
+        ]
+
+    def __str__(self):
+        return f"{self.upload_id} #{self.seq}"
+
 class UserManager(BaseUserManager):
     def create_user(self, email, username, password=None, **extra_fields):
         if not email:
@@ -105,13 +322,39 @@ class LedgerOpeningBalance(models.Model):
     def __str__(self):
         return f"{self.client.name} - {self.ledger_name}: {self.opening_balance}"
 
+def hash_token_key(key):
+    """sha256 hex digest of a token key; tokens are looked up by this, not by the key itself."""
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
 class Token(models.Model):
-    key = models.CharField(max_length=40, unique=True)
+    """
+    An API token. Only the sha256 of its key is stored: the plaintext key exists on the instance
+    that generated it (Token(user=...).save(), or Token(user=..., key=...)) and nowhere else.
+    """
+    key_hash = models.CharField(max_length=64, unique=True)
     user = models.ForeignKey(User, related_name='auth_tokens', on_delete=models.CASCADE)
     created = models.DateTimeField(auto_now_add=True)
 
+    @property
+    def key(self):
+        return getattr(self, '_key', None)
+
+    @key.setter
+    def key(self, value):
+        self._key = value
+        self.key_hash = hash_token_key(value)
+
+    @staticmethod
+    def generate_key():
+        return secrets.token_hex(20)
+
+    def save(self, *args, **kwargs):
+        if not self.key_hash:
+            self.key = self.generate_key()
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"Token for {self.user.email}: {self.key}"
+        return f"Token for {self.user.email}"
 
     class Meta:
         verbose_name = "Token"
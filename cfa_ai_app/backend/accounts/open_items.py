@@ -0,0 +1,182 @@
+import logging
+from collections import defaultdict
+
+from django.db import transaction as db_transaction
+
+from .fifo import CENT, INVOICE_REGISTERS, RECEIVABLE_REGISTERS, ZERO, FifoQueue, with_party_amount
+from .models import OpenItem, PartyOutstanding, TallyTransaction
+
+logger = logging.getLogger("cfa.transactions")
+
+
+class _PartyQueue(FifoQueue):
+    """
+    A party's open items and unapplied credit replayed in memory, plus the counts and
+    amount-weighted delays of every allocation, which the payment scores are read from.
+    """
+
+    def __init__(self, client_id, party_name, items=(), head=None):
+        head = head or PartyOutstanding(client_id=client_id, party_name=party_name)
+        super().__init__(items, head.unapplied_credit)
+        self.client_id = client_id
+        self.party_name = party_name
+        self.last_date = head.last_movement_date
+        self.invoice_count = head.invoice_count
+        self.receipt_count = head.receipt_count
+        self.matched_amount = head.matched_amount
+        self.delay_sum = head.matched_delay_days
+        self.delay_squares = head.matched_delay_squares
+        self.settled = []  # saved items that left the queue
+
+    def apply(self, transaction_id, day, register_type, amount):
+        self.last_date = max(self.last_date, day) if self.last_date else day
+        if register_type in INVOICE_REGISTERS:
+            self.invoice_count += 1
+            item = OpenItem(client_id=self.client_id, party_name=self.party_name, transaction_id=transaction_id,
+                            date=day, amount=amount, remaining=amount)
+            allocations = self.invoice(item)
+        else:
+            self.receipt_count += 1
+            allocations = self.settle(amount)
+        for item, applied in allocations:
+            # Paid in advance counts as no delay
+            delay = max((day - item.date).days, 0)
+            self.matched_amount += applied
+            self.delay_sum += float(applied) * delay
+            self.delay_squares += float(applied) * delay * delay
+            if item.remaining <= 0 and item.pk:
+                self.settled.append(item.pk)
+
+    def save(self):
+        OpenItem.objects.filter(pk__in=self.settled).delete()
+        existing = [item for item in self.items if item.pk]
+        OpenItem.objects.bulk_update(existing, ['remaining'], batch_size=1000)
+        OpenItem.objects.bulk_create([item for item in self.items if not item.pk], batch_size=1000)
+        PartyOutstanding.objects.update_or_create(
+            client_id=self.client_id, party_name=self.party_name,
+            defaults=dict(
+                outstanding=sum((item.remaining for item in self.items), ZERO),
+                unapplied_credit=self.unapplied,
+                open_item_count=len(self.items),
+                oldest_due_date=self.items[0].date if self.items else None,
+                last_movement_date=self.last_date,
+                invoice_count=self.invoice_count,
+                receipt_count=self.receipt_count,
+                matched_amount=self.matched_amount,
+                matched_delay_days=self.delay_sum,
+                matched_delay_squares=self.delay_squares,
+            ),
+        )
+
+
+def rebuild_parties(client_id, party_names):
+    """Rebuild the open-item queues of some parties of a client from their full history."""
+    party_names = set(party_names)
+    OpenItem.objects.filter(client_id=client_id, party_name__in=party_names).delete()
+    queues = {name: _PartyQueue(client_id, name) for name in party_names}
+    rows = (
+        with_party_amount(TallyTransaction.objects.filter(
+            client_id=client_id, party_name__in=party_names,
+            register_type__in=RECEIVABLE_REGISTERS,
+        ).order_by('party_name', 'date', 'id'))
+        .values_list('id', 'party_name', 'date', 'register_type', 'party_amount')
+    )
+    for transaction_id, party_name, day, register_type, amount in rows.iterator(chunk_size=5000):
+        queues[party_name].apply(transaction_id, day, register_type, (amount or ZERO).quantize(CENT))
+    for queue in queues.values():
+        queue.save()
+    return len(queues)
+
+
+def index_missing_parties(client_id, party_names=None):
+    """
+    Build the queues of a client's parties (default: all) that have sales or receipts but no
+    PartyOutstanding row yet, e.g. after the index was reset. Returns the number built.
+    """
+    transactions = TallyTransaction.objects.filter(client_id=client_id, register_type__in=RECEIVABLE_REGISTERS)
+    if party_names is not None:
+        transactions = transactions.filter(party_name__in=party_names)
+    indexed = PartyOutstanding.objects.filter(client_id=client_id).values('party_name')
+    missing = set(transactions.exclude(party_name__in=indexed).order_by().values_list('party_name', flat=True).distinct())
+    if not missing:
+        return 0
+    with db_transaction.atomic():
+        return rebuild_parties(client_id, missing)
+
+
+def rebuild_open_items(client_ids=None):
+    """
+    Rebuild the whole open-item index of some clients (default: every client) from their stored
+    sales and receipts, e.g. to backfill data ingested before the index existed. Returns the
+    number of parties rebuilt.
+    """
+    transactions = TallyTransaction.objects.filter(register_type__in=RECEIVABLE_REGISTERS)
+    heads = PartyOutstanding.objects.all()
+    if client_ids is not None:
+        transactions = transactions.filter(client_id__in=client_ids)
+        heads = heads.filter(client_id__in=client_ids)
+    parties = defaultdict(set)
+    for client_id, party_name in transactions.order_by().values_list('client_id', 'party_name').distinct():
+        parties[client_id].add(party_name)
+    rebuilt = 0
+    with db_transaction.atomic():
+        # Parties whose last sale or receipt is gone keep no queue
+        for client_id, party_name in heads.values_list('client_id', 'party_name'):
+            if party_name not in parties[client_id]:
+                OpenItem.objects.filter(client_id=client_id, party_name=party_name).delete()
+                PartyOutstanding.objects.filter(client_id=client_id, party_name=party_name).delete()
+        for client_id, party_names in parties.items():
+            if party_names:
+                rebuilt += rebuild_parties(client_id, party_names)
+    logger.info(f"Open items: rebuilt {rebuilt} parties of {len(parties)} clients")
+    return rebuilt
+
+
+def update_open_items(new_movements, dirty_parties):
+    """
+    Bring the open-item index up to date after an ingest.
+
+    new_movements maps (client_id, party_name) to newly created vouchers as (transaction id,
+    date, register type, amount); they are replayed onto the party's stored queue. A party in
+    dirty_parties (an existing voucher changed) or with a voucher dated before its last indexed
+    movement is rebuilt from its history instead, so the queue always reflects date order. So is
+    a party without a PartyOutstanding row yet, whose vouchers may predate the index.
+    """
+    rebuild = defaultdict(set)
+    for client_id, party_name in dirty_parties:
+        rebuild[client_id].add(party_name)
+    with db_transaction.atomic():
+        heads = {}
+        for client_id in {c for c, _ in new_movements}:
+            names = {p for c, p in new_movements if c == client_id}
+            heads.update(((client_id, h.party_name), h) for h in
+                         PartyOutstanding.objects.filter(client_id=client_id, party_name__in=names))
+        for (client_id, party_name), movements in new_movements.items():
+            if party_name in rebuild[client_id]:
+                continue
+            head = heads.get((client_id, party_name))
+            movements = sorted(movements, key=lambda m: (m[1], m[0]))
+            if head is None or head.last_movement_date and movements[0][1] < head.last_movement_date:
+                rebuild[client_id].add(party_name)
+                continue
+            items = OpenItem.objects.filter(client_id=client_id, party_name=party_name).order_by('date', 'transaction_id')
+            queue = _PartyQueue(client_id, party_name, items, head)
+            for movement in movements:
+                queue.apply(*movement)
+            queue.save()
+        for client_id, party_names in rebuild.items():
+            if party_names:
+                rebuild_parties(client_id, party_names)
+    appended = sum(1 for key in new_movements if key[1] not in rebuild[key[0]])
+    logger.info(f"Open items: {appended} parties updated in place, "
+                f"{sum(len(p) for p in rebuild.values())} rebuilt")
+
+
+def party_outstanding(client_id, party_name):
+    """A party's PartyOutstanding row (outstanding, oldest_due_date, ...), or None: one indexed read."""
+    return PartyOutstanding.objects.filter(client_id=client_id, party_name=party_name).first()
+
+
+def oldest_open_item(client_id, party_name):
+    """The party's oldest open invoice, or None."""
+    return OpenItem.objects.filter(client_id=client_id, party_name=party_name).order_by('date', 'transaction_id').first()
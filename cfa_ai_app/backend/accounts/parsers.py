@@ -0,0 +1,44 @@
+import gzip
+import io
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from . import json_codec
+
+# Refuse bodies that inflate beyond this many bytes (guards against gzip bombs)
+DEFAULT_MAX_DECOMPRESSED_UPLOAD_BYTES = 256 * 1024 * 1024
+
+
+class FastJSONParser(BaseParser):
+    """JSON request bodies parsed through json_codec (orjson/msgspec when installed)."""
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return json_codec.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class GzipJSONParser(FastJSONParser):
+    """
+    JSON parser that also accepts request bodies sent with Content-Encoding: gzip,
+    as the sync agent does for its batched uploads.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get('request')
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '') if request is not None else ''
+        if encoding.strip().lower() == 'gzip':
+            limit = getattr(settings, 'MAX_DECOMPRESSED_UPLOAD_BYTES', DEFAULT_MAX_DECOMPRESSED_UPLOAD_BYTES)
+            try:
+                with gzip.GzipFile(fileobj=stream) as gz:
+                    body = gz.read(limit + 1)
+            except (OSError, EOFError) as exc:
+                raise ParseError(f'Invalid gzip body - {exc}')
+            if len(body) > limit:
+                raise ParseError('Decompressed upload is too large')
+            stream = io.BytesIO(body)
+        return super().parse(stream, media_type, parser_context)
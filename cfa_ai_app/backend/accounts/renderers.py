@@ -0,0 +1,15 @@
+from rest_framework.renderers import BaseRenderer
+
+from . import json_codec
+
+
+class FastJSONRenderer(BaseRenderer):
+    """Compact JSON responses through json_codec (orjson/msgspec when installed)."""
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return json_codec.dumps(data)
@@ -0,0 +1,80 @@
+import logging
+import math
+import time
+from datetime import date
+
+from .models import PartyOutstanding, PaymentBehaviourScore
+from .open_items import index_missing_parties
+
+logger = logging.getLogger("cfa.transactions")
+
+# Upper bound of the amount-weighted average delay (days from invoice to receipt) per segment
+PROMPT_MAX_DELAY = 7
+ON_TIME_MAX_DELAY = 30
+LATE_MAX_DELAY = 60
+# Risky regardless of the average: erratic payers, or an invoice open longer than this
+RISKY_DELAY_STD = 45
+RISKY_OPEN_DAYS = 90
+
+
+def segment_for(avg_delay, delay_std, open_days):
+    """Segment from the weighted average delay, its spread and the age of the oldest open invoice."""
+    if avg_delay is None:
+        return 'risky' if open_days is not None and open_days > RISKY_OPEN_DAYS else 'unknown'
+    if avg_delay > LATE_MAX_DELAY or delay_std > RISKY_DELAY_STD or (open_days or 0) > RISKY_OPEN_DAYS:
+        return 'risky'
+    if avg_delay > ON_TIME_MAX_DELAY:
+        return 'late'
+    if avg_delay > PROMPT_MAX_DELAY:
+        return 'on_time'
+    return 'prompt'
+
+
+def party_features(client_id, party_names=None, as_of=None):
+    """
+    Payment features of every party of a client (or just party_names), read from the open-item
+    index (accounts.open_items), which does the FIFO invoice-to-receipt matching as vouchers are
+    ingested: amount-weighted average delay and its standard deviation, outstanding amount and
+    oldest open invoice. Parties not indexed yet are indexed first. Returns {party_name: feature dict}.
+    """
+    as_of = as_of or date.today()
+    index_missing_parties(client_id, party_names)
+    heads = PartyOutstanding.objects.filter(client_id=client_id)
+    if party_names is not None:
+        heads = heads.filter(party_name__in=party_names)
+    features = {}
+    for head in heads:
+        matched = float(head.matched_amount)
+        has_delay = matched > 0
+        avg_delay = head.matched_delay_days / matched if has_delay else None
+        # Weighted variance from the running sums; rounding can take it a hair below zero
+        delay_std = math.sqrt(max(head.matched_delay_squares / matched - avg_delay ** 2, 0)) if has_delay else None
+        oldest = head.oldest_due_date
+        open_days = (as_of - oldest).days if oldest else None
+        features[head.party_name] = {
+            'invoice_count': head.invoice_count,
+            'receipt_count': head.receipt_count,
+            'matched_amount': head.matched_amount,
+            'outstanding_amount': head.outstanding,
+            'avg_delay_days': avg_delay,
+            'delay_std_days': delay_std,
+            'oldest_open_date': oldest,
+            'segment': segment_for(avg_delay, delay_std, open_days),
+            # 100 for same-day payers, minus a day per day of delay and half a point per day of spread
+            'score': min(max(100 - avg_delay - 0.5 * delay_std, 0.0), 100.0) if has_delay else 0.0,
+        }
+    return features
+
+
+def refresh_payment_scores(client_id, party_names=None):
+    """Recompute and store the PaymentBehaviourScore rows of a client's parties (default: all)."""
+    started = time.monotonic()
+    features = party_features(client_id, party_names)
+    scores = [PaymentBehaviourScore(client_id=client_id, party_name=party_name, **f)
+              for party_name, f in features.items()]
+    update_fields = [f.name for f in PaymentBehaviourScore._meta.concrete_fields
+                     if f.name not in ('id', 'client', 'party_name')]
+    PaymentBehaviourScore.objects.bulk_create(scores, batch_size=1000, update_conflicts=True,
+                                              unique_fields=['client', 'party_name'], update_fields=update_fields)
+    logger.info(f"Scored {len(scores)} parties of client {client_id} in {time.monotonic() - started:.3f}s")
+    return len(scores)
@@ -0,0 +1,17 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Token, User
+from .token_cache import token_cache
+
+
+@receiver([post_save, post_delete], sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    token_cache.invalidate_token(instance.key_hash)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user_tokens(sender, instance, **kwargs):
+    # Covers deactivation, role/client changes and deletion through save()/delete(); a bulk
+    # User.objects.filter(...).update(is_active=False) bypasses this, see TokenCache
+    token_cache.invalidate_user(instance.pk)
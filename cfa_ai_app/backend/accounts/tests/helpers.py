@@ -0,0 +1,12 @@
+from accounts.models import OpenItem
+
+
+def voucher(no, day, register, amount, party='Party A', **extra):
+    """An agent transaction row as ingest_transactions receives it."""
+    return dict(voucher_no=no, date=day, party_name=party, voucher_type=register, amount=amount, **extra)
+
+
+def open_items_of(client):
+    return list(OpenItem.objects.filter(client=client)
+                .order_by('party_name', 'date', 'transaction_id')
+                .values_list('party_name', 'date', 'remaining'))
@@ -0,0 +1,103 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from accounts import jobs
+from accounts.balances import _rebuild, client_balances, refresh_client_balances
+from accounts.ingest import ingest_transactions
+from accounts.models import AnalyticsJob, Client, ClientBalance, PartyOutstanding, TallyTransaction
+
+from .helpers import voucher
+
+
+@override_settings(ANALYTICS_INLINE_WORKER=False)
+class ClientBalanceTests(TestCase):
+    def setUp(self):
+        self.client_row = Client.objects.create(name='Acme')
+        jobs._aged_on = date.today()
+
+    def ingest(self, *vouchers, **kwargs):
+        ingest_transactions(list(vouchers), client=self.client_row, **kwargs)
+        jobs.run_pending_jobs()
+
+    def assert_matches_rebuild(self):
+        stored = ClientBalance.objects.get(client=self.client_row)
+        full = _rebuild({self.client_row.pk}, stored.as_of)[0]
+        for field in ('transaction_count', 'total_amount', 'running_balance', 'open_items', 'unapplied_credit',
+                      'aging_0_30', 'aging_90_plus', 'last_transaction_date'):
+            self.assertEqual(getattr(stored, field), getattr(full, field), field)
+
+    def test_new_vouchers_are_folded_in_incrementally(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100), voucher('2', '2024-02-10', 'Receipt', 60))
+        with mock.patch('accounts.balances._rebuild', wraps=_rebuild) as rebuild:
+            self.ingest(voucher('3', '2024-03-01', 'Sales', 25))
+        rebuild.assert_not_called()
+        balance = ClientBalance.objects.get()
+        self.assertEqual((balance.transaction_count, balance.running_balance), (3, Decimal('65')))
+        self.assert_matches_rebuild()
+
+    def test_backdated_and_upserted_vouchers_fall_back_to_a_rebuild(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100), voucher('2', '2024-03-01', 'Sales', 50))
+        self.ingest(voucher('3', '2024-02-01', 'Receipt', 120))
+        self.assertEqual(ClientBalance.objects.get().open_items, [['2024-03-01', '30.00']])
+        self.assert_matches_rebuild()
+        self.ingest(voucher('2', '2024-03-01', 'Sales', 80), mode='upsert')
+        self.assertEqual(ClientBalance.objects.get().open_items, [['2024-03-01', '60.00']])
+        self.assert_matches_rebuild()
+
+    def test_summary_get_only_reads(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100))
+        ClientBalance.objects.update(as_of=date.today() - timedelta(days=1))
+        Client.objects.create(name='Never refreshed')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/clients/summary/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([c['name'] for c in response.json()['clients']], ['Acme'])
+        self.assertTrue(all(q['sql'].startswith('SELECT') for q in queries.captured_queries))
+
+    def test_daily_roll_forward_reages_without_reading_transactions(self):
+        today = date.today()
+        self.ingest(voucher('1', (today - timedelta(days=40)).isoformat(), 'Sales', 100))
+        refresh_client_balances([self.client_row.pk], as_of=today - timedelta(days=20))
+        self.assertEqual(ClientBalance.objects.get().aging_0_30, Decimal('100'))
+        newcomer = Client.objects.create(name='Newcomer')
+        jobs._aged_on = None
+        with CaptureQueriesContext(connection) as queries:
+            jobs.roll_aging_if_due()
+        self.assertFalse(any('accounts_tallytransaction' in q['sql'] for q in queries.captured_queries))
+        balance = ClientBalance.objects.get()
+        self.assertEqual((balance.as_of, balance.aging_0_30, balance.aging_31_60), (today, 0, Decimal('100')))
+        # Clients without FIFO state get a rebuild queued instead
+        job = AnalyticsJob.objects.get(kind='client_balance', client=newcomer)
+        self.assertEqual(job.payload, {'rebuild': True})
+        jobs.run_pending_jobs()
+        self.assertEqual(len(client_balances()), 2)
+
+    def test_a_row_committed_after_a_higher_id_is_still_folded_in(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100))
+        fields = dict(client=self.client_row, party_name='Party A', date=date(2024, 2, 1), register_type='sales')
+        TallyTransaction.objects.create(id=1000, voucher_no='3', amount=40, **fields)
+        refresh_client_balances([self.client_row.pk])
+        # A concurrent ingest commits its lower id only after the refresh above
+        TallyTransaction.objects.create(id=500, voucher_no='2', amount=25, **dict(fields, date=date(2024, 2, 5)))
+        with mock.patch('accounts.balances._rebuild', wraps=_rebuild) as rebuild:
+            refresh_client_balances([self.client_row.pk])
+        rebuild.assert_not_called()
+        balance = ClientBalance.objects.get()
+        self.assertEqual((balance.transaction_count, balance.running_balance), (3, Decimal('165')))
+        self.assert_matches_rebuild()
+
+    def test_outstanding_matches_the_open_item_index(self):
+        entries = [dict(ledger_name='Party A', amount=118), dict(ledger_name='Sales', amount=-100),
+                   dict(ledger_name='GST', amount=-18)]
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100, ledger_entries=entries),
+                    voucher('2', '2024-01-05', 'Debit Note', 30), voucher('3', '2024-01-09', 'Credit Note', 50),
+                    voucher('4', '2024-01-10', 'Receipt', 18))
+        balance = ClientBalance.objects.get()
+        outstanding = sum((Decimal(remaining) for _, remaining in balance.open_items), Decimal('0'))
+        self.assertEqual(outstanding, PartyOutstanding.objects.get().outstanding)
+        self.assertEqual(balance.running_balance, Decimal('100'))
@@ -0,0 +1,30 @@
+from django.test import TestCase, override_settings
+
+from accounts.ingest import ingest_transactions
+from accounts.models import Client, LedgerEntry, TallyTransaction
+
+from .helpers import voucher
+
+
+@override_settings(ANALYTICS_INLINE_WORKER=False)
+class IngestTests(TestCase):
+    def setUp(self):
+        self.client_row = Client.objects.create(name='Acme')
+
+    def test_bulk_insert_skips_duplicates_and_bad_rows(self):
+        entries = [dict(ledger_name='Party A', amount=100, is_debit=True),
+                   dict(ledger_name='Sales', amount=-100, is_credit=True)]
+        result = ingest_transactions([
+            voucher('1', '20240101', 'Sales', 100, ledger_entries=entries),
+            voucher('2', '2024-01-02', 'Receipt', 40),
+            voucher('1', '20240101', 'Sales', 100),
+            'not a voucher',
+        ], client=self.client_row, batch_size=2)
+        self.assertEqual((result['created'], result['skipped']), (2, 2))
+        self.assertEqual({e['reason'] for e in result['errors']},
+                         {'duplicate transaction', 'transaction is not an object'})
+        self.assertEqual(TallyTransaction.objects.count(), 2)
+        self.assertEqual(LedgerEntry.objects.count(), 2)
+
+        again = ingest_transactions([voucher('2', '2024-01-02', 'Receipt', 40)], client=self.client_row)
+        self.assertEqual((again['created'], again['skipped']), (0, 1))
@@ -0,0 +1,103 @@
+import time
+from datetime import date, timedelta
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from accounts import jobs
+from accounts.models import AnalyticsJob, Client
+
+
+@override_settings(ANALYTICS_INLINE_WORKER=False)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.client_row = Client.objects.create(name='Acme')
+        jobs._aged_on = date.today()
+
+    def test_enqueue_merges_into_the_pending_job(self):
+        jobs.enqueue('daily_cashflow', self.client_row.pk, {'dates': ['2024-01-02']})
+        jobs.enqueue('daily_cashflow', self.client_row.pk, {'dates': ['2024-01-01', '2024-01-02']})
+        jobs.enqueue('payment_scores', self.client_row.pk, {'parties': ['A']})
+        jobs.enqueue('payment_scores', self.client_row.pk, {'parties': None})
+        self.assertEqual(AnalyticsJob.objects.get(kind='daily_cashflow').payload,
+                         {'dates': ['2024-01-01', '2024-01-02']})
+        self.assertEqual(AnalyticsJob.objects.get(kind='payment_scores').payload, {'parties': None})
+
+    def test_merge_payloads_ors_flags(self):
+        self.assertEqual(jobs.merge_payloads({}, {'rebuild': True}), {'rebuild': True})
+        self.assertEqual(jobs.merge_payloads({'rebuild': True}, {'rebuild': False}), {'rebuild': True})
+
+    def test_unknown_kind_is_rejected(self):
+        with self.assertRaises(ValueError):
+            jobs.enqueue('nope', self.client_row.pk)
+
+    def test_failed_job_is_retried_with_backoff_then_marked_failed(self):
+        jobs.enqueue('daily_cashflow', self.client_row.pk, {'dates': ['2024-01-01']})
+        with mock.patch.dict(jobs.JOB_HANDLERS, daily_cashflow=mock.Mock(side_effect=RuntimeError('boom'))):
+            self.assertFalse(jobs.run_job(jobs._claim_next()))
+            job = AnalyticsJob.objects.get()
+            self.assertEqual((job.status, job.attempts, job.last_error), ('pending', 1, 'RuntimeError: boom'))
+            self.assertGreater(job.run_after, timezone.now())
+            self.assertIsNone(jobs._claim_next())
+            for _ in range(jobs.MAX_JOB_ATTEMPTS - 1):
+                AnalyticsJob.objects.update(run_after=timezone.now())
+                jobs.run_job(jobs._claim_next())
+        self.assertEqual(AnalyticsJob.objects.get().status, 'failed')
+
+    def test_failed_retry_merges_into_a_newer_pending_job(self):
+        jobs.enqueue('daily_cashflow', self.client_row.pk, {'dates': ['2024-01-01']})
+        running = jobs._claim_next()
+        # A newer trigger arrives while the job runs
+        jobs.enqueue('daily_cashflow', self.client_row.pk, {'dates': ['2024-03-03']})
+        with mock.patch.dict(jobs.JOB_HANDLERS, daily_cashflow=mock.Mock(side_effect=RuntimeError('boom'))):
+            self.assertFalse(jobs.run_job(running))
+        job = AnalyticsJob.objects.get()
+        self.assertNotEqual(job.pk, running.pk)
+        self.assertEqual((job.status, job.payload), ('pending', {'dates': ['2024-01-01', '2024-03-03']}))
+
+    def test_expired_lease_is_claimed_again(self):
+        jobs.enqueue('daily_cashflow', self.client_row.pk, {'dates': []})
+        job = jobs._claim_next()
+        self.assertIsNone(jobs._claim_next())
+        expired = timezone.now() - timedelta(seconds=jobs.JOB_LEASE_SECONDS + 1)
+        AnalyticsJob.objects.filter(pk=job.pk).update(updated_at=expired)
+        self.assertEqual(jobs._claim_next().pk, job.pk)
+
+    def test_expired_lease_merges_into_a_newer_pending_job(self):
+        jobs.enqueue('daily_cashflow', self.client_row.pk, {'dates': ['2024-01-01']})
+        dead = jobs._claim_next()
+        jobs.enqueue('daily_cashflow', self.client_row.pk, {'dates': ['2024-02-02']})
+        # The pending twin is not due yet, so the next claim takes the other client's job
+        AnalyticsJob.objects.filter(status='pending').update(run_after=timezone.now() + timedelta(hours=1))
+        other = Client.objects.create(name='Other')
+        jobs.enqueue('daily_cashflow', other.pk, {'dates': []})
+        lone = jobs._claim_next()
+        expired = timezone.now() - timedelta(seconds=jobs.JOB_LEASE_SECONDS + 1)
+        AnalyticsJob.objects.filter(pk__in=[dead.pk, lone.pk]).update(updated_at=expired)
+
+        self.assertEqual(jobs._claim_next().pk, lone.pk)
+        self.assertFalse(AnalyticsJob.objects.filter(pk=dead.pk).exists())
+        merged = AnalyticsJob.objects.get(client=self.client_row)
+        self.assertEqual((merged.status, merged.payload), ('pending', {'dates': ['2024-01-01', '2024-02-02']}))
+
+
+@override_settings(ANALYTICS_INLINE_WORKER=False)
+class JobLeaseRenewalTests(TransactionTestCase):
+    def test_running_job_keeps_its_lease(self):
+        client = Client.objects.create(name='Acme')
+        jobs._aged_on = date.today()
+        jobs.enqueue('daily_cashflow', client.pk, {'dates': []})
+        job = jobs._claim_next()
+        claimed_at = AnalyticsJob.objects.get().updated_at
+        renewed = []
+
+        def slow_handler(client_id, payload):
+            time.sleep(0.5)
+            renewed.append(AnalyticsJob.objects.get(pk=job.pk).updated_at)
+
+        with mock.patch.object(jobs, 'LEASE_RENEW_SECONDS', 0.1), \
+                mock.patch.dict(jobs.JOB_HANDLERS, daily_cashflow=slow_handler):
+            self.assertTrue(jobs.run_job(job))
+        self.assertGreater(renewed[0], claimed_at)
+        self.assertFalse(AnalyticsJob.objects.exists())
@@ -0,0 +1,16 @@
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.test import TestCase
+from rest_framework.utils.encoders import JSONEncoder
+
+from accounts import json_codec
+
+
+class JsonCodecTests(TestCase):
+    def test_output_matches_drf_encoder(self):
+        data = {'when': datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc),
+                'day': date(2024, 1, 2), 'amount': Decimal('1.50'), 'name': 'Café'}
+        expected = JSONEncoder(ensure_ascii=False, separators=(',', ':'), sort_keys=True).encode(data)
+        self.assertEqual(json_codec.dumps(data, sort_keys=True), expected.encode('utf-8'))
+        self.assertEqual(json_codec.loads(json_codec.dumps({'a': [1, 2]})), {'a': [1, 2]})
@@ -0,0 +1,58 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from accounts.ingest import ingest_transactions
+from accounts.models import Client, OpenItem, PartyOutstanding
+from accounts.open_items import rebuild_open_items
+
+from .helpers import open_items_of, voucher
+
+
+@override_settings(ANALYTICS_INLINE_WORKER=False)
+class OpenItemTests(TestCase):
+    def setUp(self):
+        self.client_row = Client.objects.create(name='Acme')
+
+    def ingest(self, *vouchers):
+        ingest_transactions(list(vouchers), client=self.client_row)
+
+    def assert_matches_rebuild(self):
+        incremental = open_items_of(self.client_row)
+        heads = list(PartyOutstanding.objects.order_by('party_name')
+                     .values_list('party_name', 'outstanding', 'unapplied_credit'))
+        rebuild_open_items([self.client_row.pk])
+        self.assertEqual(open_items_of(self.client_row), incremental)
+        self.assertEqual(list(PartyOutstanding.objects.order_by('party_name')
+                              .values_list('party_name', 'outstanding', 'unapplied_credit')), heads)
+
+    def test_receipts_settle_oldest_invoices_first(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100), voucher('2', '2024-02-01', 'Sales', 50),
+                    voucher('3', '2024-02-10', 'Receipt', 120))
+        self.assertEqual(open_items_of(self.client_row), [('Party A', date(2024, 2, 1), Decimal('30.00'))])
+        head = PartyOutstanding.objects.get()
+        self.assertEqual((head.outstanding, head.oldest_due_date), (Decimal('30.00'), date(2024, 2, 1)))
+
+    def test_appended_movements_match_a_rebuild(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100), voucher('2', '2024-01-05', 'Receipt', 130))
+        self.ingest(voucher('3', '2024-02-01', 'Sales', 50), voucher('4', '2024-02-02', 'Sales', 20, party='B'))
+        self.assertEqual(PartyOutstanding.objects.get(party_name='Party A').outstanding, Decimal('20.00'))
+        self.assert_matches_rebuild()
+
+    def test_backdated_voucher_rebuilds_the_party(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100), voucher('2', '2024-03-01', 'Sales', 100))
+        self.ingest(voucher('3', '2024-02-01', 'Receipt', 150))
+        self.assertEqual(open_items_of(self.client_row), [('Party A', date(2024, 3, 1), Decimal('50.00'))])
+        self.assert_matches_rebuild()
+
+    def test_party_without_index_head_is_rebuilt_from_history(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100), voucher('2', '2024-01-02', 'Sales', 5, party='B'))
+        # Data ingested before the index existed
+        OpenItem.objects.all().delete()
+        PartyOutstanding.objects.all().delete()
+        self.ingest(voucher('3', '2024-02-01', 'Sales', 10))
+        self.assertEqual(open_items_of(self.client_row), [('Party A', date(2024, 1, 1), Decimal('100.00')),
+                                                          ('Party A', date(2024, 2, 1), Decimal('10.00'))])
+        rebuild_open_items()
+        self.assertEqual(PartyOutstanding.objects.get(party_name='B').outstanding, Decimal('5.00'))
@@ -0,0 +1,60 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from accounts import jobs
+from accounts.ingest import ingest_transactions
+from accounts.models import Client, ClientBalance, OpenItem, PartyOutstanding, PaymentBehaviourScore
+from accounts.open_items import rebuild_open_items
+from accounts.segmentation import party_features
+
+from .helpers import voucher
+
+
+@override_settings(ANALYTICS_INLINE_WORKER=False)
+class PaymentScoreTests(TestCase):
+    def setUp(self):
+        self.client_row = Client.objects.create(name='Acme')
+        jobs._aged_on = date.today()
+
+    def ingest(self, *vouchers):
+        ingest_transactions(list(vouchers), client=self.client_row)
+        jobs.run_pending_jobs()
+
+    def features(self):
+        return party_features(self.client_row.pk, as_of=date(2024, 3, 1))['Party A']
+
+    def test_delays_come_from_the_open_item_matching(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100), voucher('2', '2024-01-10', 'Sales', 50))
+        self.ingest(voucher('3', '2024-01-21', 'Receipt', 120))
+        self.ingest(voucher('4', '2024-02-09', 'Receipt', 30), voucher('5', '2024-02-20', 'Sales', 40))
+        features = self.features()
+        # 100 paid after 20 days, 20 after 11 and 30 after 30
+        self.assertEqual((features['invoice_count'], features['receipt_count']), (3, 2))
+        self.assertEqual(features['matched_amount'], Decimal('150'))
+        self.assertAlmostEqual(features['avg_delay_days'], 3120 / 150)
+        self.assertEqual((features['outstanding_amount'], features['oldest_open_date']),
+                         (Decimal('40'), date(2024, 2, 20)))
+        self.assertEqual(features['segment'], 'on_time')
+        score = PaymentBehaviourScore.objects.get()
+        self.assertEqual((score.matched_amount, score.outstanding_amount), (Decimal('150'), Decimal('40')))
+        # Incremental updates leave the same statistics as a replay of the full history
+        rebuild_open_items()
+        self.assertEqual(self.features(), features)
+
+    def test_an_advance_counts_as_paid_without_delay(self):
+        self.ingest(voucher('1', '2024-01-01', 'Receipt', 60), voucher('2', '2024-01-15', 'Sales', 100))
+        features = self.features()
+        self.assertEqual((features['matched_amount'], features['avg_delay_days'], features['delay_std_days']),
+                         (Decimal('60'), 0.0, 0.0))
+        self.assertEqual(features['outstanding_amount'], Decimal('40'))
+        self.assertEqual(ClientBalance.objects.get().open_items, [['2024-01-15', '40.00']])
+
+    def test_parties_missing_from_the_index_are_indexed_before_scoring(self):
+        self.ingest(voucher('1', '2024-01-01', 'Sales', 100), voucher('2', '2024-01-31', 'Receipt', 100))
+        expected = self.features()
+        OpenItem.objects.all().delete()
+        PartyOutstanding.objects.all().delete()
+        self.assertEqual(self.features(), expected)
+        self.assertEqual(expected['avg_delay_days'], 30.0)
@@ -0,0 +1,57 @@
+import time
+from unittest import mock
+
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Client, Token, User, hash_token_key
+from accounts.token_cache import token_cache
+
+
+class TokenAuthTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.client_row = Client.objects.create(name='Acme')
+        self.user = User.objects.create_user('owner@example.com', 'owner', 'pw', client=self.client_row)
+        self.token = Token(user=self.user)
+        self.token.save()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {self.token.key}'}
+
+    def status(self):
+        return self.client.get('/api/transactions/uploads/u1/', **self.auth).status_code
+
+    def test_only_the_key_hash_is_stored(self):
+        self.assertNotIn('key', {f.name for f in Token._meta.concrete_fields})
+        stored = Token.objects.get()
+        self.assertEqual(stored.key_hash, hash_token_key(self.token.key))
+        self.assertIsNone(stored.key)
+        self.assertNotIn(self.token.key, str(self.token))
+
+    def test_valid_token_is_served_from_the_cache(self):
+        self.assertEqual(self.status(), 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.status(), 200)
+        self.assertFalse(any('accounts_token' in q['sql'] for q in queries.captured_queries))
+
+    def test_unknown_key_is_rejected(self):
+        self.auth = {'HTTP_AUTHORIZATION': 'Bearer not-a-token'}
+        self.assertEqual(self.status(), 401)
+
+    def test_deleted_token_is_invalidated(self):
+        self.assertEqual(self.status(), 200)
+        self.token.delete()
+        self.assertEqual(self.status(), 401)
+
+    def test_deactivated_user_is_invalidated(self):
+        self.assertEqual(self.status(), 200)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.status(), 401)
+
+    def test_cache_entries_expire(self):
+        self.assertEqual(self.status(), 200)
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.status(), 200)  # bulk update sends no signal: cached until the TTL
+        with mock.patch('accounts.token_cache.time.monotonic', return_value=time.monotonic() + token_cache.ttl + 1):
+            self.assertEqual(self.status(), 401)
@@ -0,0 +1,31 @@
+from django.test import TestCase
+
+from accounts.models import Client, TallyTransaction
+
+
+class TransactionCursorTests(TestCase):
+    def setUp(self):
+        client = Client.objects.create(name='Acme')
+        days = ['2024-01-03', '2024-01-01', '2024-01-02', '2024-01-02', '2024-01-01']
+        for no, day in enumerate(days):
+            TallyTransaction.objects.create(client=client, voucher_no=str(no), date=day, party_name='Party A',
+                                            amount=1, register_type='sales')
+
+    def test_pages_follow_date_and_id_without_gaps_or_repeats(self):
+        seen = []
+        url = '/api/transactions/Party A/?page_size=2'
+        cursor = None
+        for _ in range(5):
+            response = self.client.get(url + (f'&cursor={cursor}' if cursor else ''))
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            seen.extend((t['date'], t['id']) for c in body['clients'] for t in c['transactions'])
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        expected = sorted(TallyTransaction.objects.values_list('date', 'id'))
+        self.assertEqual(seen, [(d.isoformat(), pk) for d, pk in expected])
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/transactions/Party A/?cursor=garbage')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,97 @@
+from datetime import date
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+
+from accounts.ingest import ingest_transactions
+from accounts.models import AnalyticsJob, Client, OpenItem, TallyTransaction
+
+from .helpers import voucher
+
+
+@override_settings(ANALYTICS_INLINE_WORKER=False)
+class UpsertTests(TestCase):
+    def setUp(self):
+        self.client_row = Client.objects.create(name='Acme')
+
+    def test_upsert_updates_in_place_and_replaces_ledger_entries(self):
+        ingest_transactions([voucher('1', '20240101', 'Sales', 100,
+                                     ledger_entries=[dict(ledger_name='Party A', amount=100)])],
+                            client=self.client_row)
+        original = TallyTransaction.objects.get()
+        result = ingest_transactions([
+            voucher('1', '20240101', 'Sales', 250, ledger_entries=[dict(ledger_name='Party A', amount=250),
+                                                                   dict(ledger_name='Sales', amount=-250)]),
+            voucher('2', '20240105', 'Sales', 10),
+        ], client=self.client_row, mode='upsert')
+        self.assertEqual((result['created'], result['updated']), (1, 1))
+        updated = TallyTransaction.objects.get(voucher_no='1')
+        self.assertEqual(updated.pk, original.pk)
+        self.assertEqual(updated.amount, Decimal('250'))
+        self.assertEqual(sorted(updated.ledger_entries.values_list('amount', flat=True)),
+                         [Decimal('-250'), Decimal('250')])
+        # A changed stored voucher forces a full balance rebuild
+        job = AnalyticsJob.objects.get(kind='client_balance', client=self.client_row)
+        self.assertEqual(job.payload, {'rebuild': True})
+
+    def test_upsert_last_repeat_in_payload_wins(self):
+        result = ingest_transactions([voucher('1', '20240101', 'Sales', 1), voucher('1', '20240101', 'Sales', 2)],
+                                     client=self.client_row, mode='upsert')
+        self.assertEqual((result['created'], result['skipped']), (1, 1))
+        self.assertEqual(TallyTransaction.objects.get().amount, Decimal('2'))
+
+    def test_guid_upsert_follows_edits_to_date_and_party(self):
+        ingest_transactions([voucher('7', '2024-01-01', 'Sales', 100, guid='g-1'),
+                             voucher('8', '2024-01-02', 'Sales', 40, party='B', guid='g-2')],
+                            client=self.client_row, mode='upsert')
+        original = TallyTransaction.objects.get(guid='g-1')
+        result = ingest_transactions([voucher('7', '2024-01-05', 'Sales', 100, party='B', guid='g-1')],
+                                     client=self.client_row, mode='upsert')
+        self.assertEqual((result['created'], result['updated']), (0, 1))
+        moved = TallyTransaction.objects.get(guid='g-1')
+        self.assertEqual((moved.pk, moved.party_name, moved.date), (original.pk, 'B', date(2024, 1, 5)))
+        # Both the old and the new party's open items follow the move
+        self.assertEqual(sorted(OpenItem.objects.values_list('party_name', 'remaining')),
+                         [('B', Decimal('40.00')), ('B', Decimal('100.00'))])
+        self.assertEqual(AnalyticsJob.objects.get(kind='daily_cashflow').payload['dates'],
+                         ['2024-01-01', '2024-01-02', '2024-01-05'])
+
+    def test_unnumbered_vouchers_never_collide_across_payloads(self):
+        for guid in ('g-1', 'g-2'):
+            ingest_transactions([voucher('', '2024-01-01', 'Receipt', 10, guid=guid)],
+                                client=self.client_row, mode='upsert')
+        self.assertEqual(TallyTransaction.objects.count(), 2)
+        rejected = ingest_transactions([voucher('', '2024-01-01', 'Receipt', 10)],
+                                       client=self.client_row, mode='upsert')
+        self.assertEqual((rejected['created'], rejected['skipped']), (0, 1))
+        self.assertEqual(rejected['errors'][0]['reason'], 'voucher has no GUID or voucher number to upsert by')
+        self.assertEqual(TallyTransaction.objects.count(), 2)
+
+    def test_guid_is_read_from_the_raw_voucher(self):
+        ingest_transactions([voucher('', '2024-01-01', 'Sales', 10, voucher_all_fields={'GUID': 'raw-1'})],
+                            client=self.client_row, mode='upsert')
+        self.assertEqual(TallyTransaction.objects.get().guid, 'raw-1')
+
+    def test_rows_stored_without_guid_adopt_one(self):
+        legacy = TallyTransaction.objects.create(client=self.client_row, voucher_no='1', date='2024-01-01',
+                                                 party_name='Party A', amount=5, register_type='sales')
+        twin = TallyTransaction.objects.create(client=self.client_row, voucher_no='1', date='2024-01-01',
+                                               party_name='Party A', amount=6, register_type='sales')
+        skipped = ingest_transactions([voucher('1', '2024-01-01', 'Sales', 5, guid='g-1')], client=self.client_row)
+        self.assertEqual(skipped['skipped'], 1)
+        self.assertEqual(TallyTransaction.objects.get(pk=legacy.pk).guid, 'g-1')
+        # The repeated baseline row is a distinct voucher: it is matched next, never merged away
+        result = ingest_transactions([voucher('1', '2024-01-01', 'Sales', 7, guid='g-2')],
+                                     client=self.client_row, mode='upsert')
+        self.assertEqual((result['created'], result['updated']), (0, 1))
+        self.assertEqual(TallyTransaction.objects.get(pk=twin.pk).amount, Decimal('7'))
+        self.assertEqual(TallyTransaction.objects.count(), 2)
+
+
+@override_settings(ANALYTICS_INLINE_WORKER=False)
+class SkipModeIdentityTests(TestCase):
+    def test_unnumbered_vouchers_without_guid_are_all_stored(self):
+        client = Client.objects.create(name='Acme')
+        result = ingest_transactions([voucher('', '2024-01-01', 'Receipt', 10),
+                                      voucher('', '2024-01-01', 'Receipt', 10)], client=client)
+        self.assertEqual(result['created'], 2)
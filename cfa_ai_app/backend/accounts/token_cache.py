@@ -0,0 +1,70 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Seconds an authenticated token stays cached; bounds how long another process can keep
+# accepting a token revoked elsewhere (invalidation below is process-local)
+DEFAULT_TOKEN_CACHE_TTL = 60
+DEFAULT_TOKEN_CACHE_SIZE = 10000
+
+
+class TokenCache:
+    """
+    Process-local TTL + LRU cache of authenticated (user, token) pairs, keyed by token key hash.
+
+    Entries are dropped when they expire, when the cache is full (least recently used first),
+    or explicitly through invalidate_token()/invalidate_user(), which the Token and User
+    signal handlers call on save and delete. QuerySet.update() sends no signals: code that
+    deactivates users or changes tokens in bulk must call invalidate_user()/invalidate_token()
+    itself, or the old state keeps authenticating for up to the TTL.
+    """
+
+    def __init__(self, ttl=None, max_size=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'TOKEN_CACHE_TTL', DEFAULT_TOKEN_CACHE_TTL)
+        self.max_size = max_size or getattr(settings, 'TOKEN_CACHE_SIZE', DEFAULT_TOKEN_CACHE_SIZE)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key_hash):
+        """The cached (user, token) for key_hash, or None. Callers get copies they may modify."""
+        with self._lock:
+            entry = self._entries.get(key_hash)
+            if entry is None:
+                return None
+            user, token, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key_hash]
+                return None
+            self._entries.move_to_end(key_hash)
+        user = copy.copy(user)
+        token = copy.copy(token)
+        token.user = user
+        return user, token
+
+    def set(self, key_hash, user, token):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key_hash] = (user, token, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key_hash)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate_token(self, key_hash):
+        with self._lock:
+            self._entries.pop(key_hash, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key_hash in [h for h, (user, _, _) in self._entries.items() if user.pk == user_id]:
+                del self._entries[key_hash]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = TokenCache()
@@ -1,11 +1,13 @@
 from django.urls import path
-from .views import TransactionUploadView
+from .views import TransactionUploadView, UploadStatusView, CashflowForecastView
 from . import views
 
 urlpatterns = [
     path('api/transactions/', TransactionUploadView.as_view(), name='receive_transactions'),
+    path('api/transactions/uploads/<str:upload_id>/', UploadStatusView.as_view(), name='upload_status'),
     path('api/transactions/<str:client_name>/', views.get_client_transactions, name='client_transactions'),
     path('api/transactions/', views.get_client_transactions, name='all_transactions'),
     path('api/clients/summary/', views.get_clients_summary, name='clients_summary'),
     path('api/opening-balances/', views.receive_opening_balances, name='receive_opening_balances'),
+    path('api/forecast/cashflow/', CashflowForecastView.as_view(), name='cashflow_forecast'),
 ]
\ No newline at end of file
@@ -1,12 +1,20 @@
 from django.shortcuts import render
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from django.db import transaction
-from .models import Client, TallyTransaction, LedgerEntry, LedgerOpeningBalance
+from .models import TallyTransaction, LedgerOpeningBalance, UploadBatch
+from .parsers import GzipJSONParser
+from .ingest import ingest_transactions, resolve_clients, INGEST_MODES
+from .balances import client_balances, AGING_BUCKETS
+from .jobs import enqueue
+from .token_cache import token_cache
+from .forecasting import forecast_cashflow, FORECASTING_AVAILABLE, DEFAULT_HORIZONS, MAX_HORIZON_DAYS
 import json
+import base64
 from datetime import datetime
+from django.conf import settings
 from django.db import models  # type: ignore
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -20,6 +28,7 @@ import logging
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@parser_classes([GzipJSONParser])
 def receive_tally_transactions(request):
     """
     Receive Tally transactions from the sync agent and store them grouped by client, including all ledger entries.
@@ -31,98 +40,19 @@ def receive_tally_transactions(request):
         if not isinstance(data, list):
             logger.error('Payload is not a list')
             return Response({'error': 'Data must be a list of transactions'}, status=status.HTTP_400_BAD_REQUEST)
-        transactions_created = 0
-        clients_created = 0
-        errors = []
-        with transaction.atomic():
-            for idx, transaction_data in enumerate(data):
-                party_name = transaction_data.get('party_name', '').strip()
-                if not party_name:
-                    errors.append(f'Transaction {idx}: Missing party_name')
-                    continue
-                client, created = Client.objects.get_or_create(name=party_name, defaults={'address': ''})
-                if created:
-                    clients_created += 1
-                # Parse date from YYYYMMDD
-                date_str = transaction_data.get('date', '')
-                date_obj = None
-                if date_str:
-                    try:
-                        if len(date_str) == 8 and date_str.isdigit():
-                            date_obj = datetime.strptime(date_str, '%Y%m%d').date()
-                        elif '/' in date_str:
-                            date_obj = datetime.strptime(date_str, '%d/%m/%Y').date()
-                        else:
-                            date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    except Exception as ex:
-                        logger.warning(f'Transaction {idx}: Invalid date format {date_str}, using today. Error: {ex}')
-                        date_obj = datetime.now().date()
-                else:
-                    date_obj = datetime.now().date()
-                # Map voucher_type to register_type
-                voucher_type = transaction_data.get('voucher_type', '').lower()
-                register_type_map = {
-                    'sales': 'sales',
-                    'purchase': 'purchase',
-                    'payment': 'payment',
-                    'receipt': 'receipt',
-                    'journal': 'journal',
-                    'credit note': 'credit_note',
-                    'debit note': 'debit_note',
-                }
-                register_type = register_type_map.get(voucher_type, 'journal')
-                # Handle amount: if blank, sum ledger entries
-                amount = transaction_data.get('amount', None)
-                if amount in [None, '', ' ']:
-                    try:
-                        amount = sum(float(le.get('amount', 0.0) or 0.0) for le in transaction_data.get('ledger_entries', []))
-                    except Exception as ex:
-                        logger.error(f'Transaction {idx}: Error summing ledger entry amounts: {ex}')
-                        amount = 0.0
-                else:
-                    try:
-                        amount = float(amount)
-                    except Exception as ex:
-                        logger.error(f'Transaction {idx}: Invalid amount {amount}, using 0. Error: {ex}')
-                        amount = 0.0
-                try:
-                    txn = TallyTransaction.objects.create(
-                        voucher_no=transaction_data.get('voucher_no', ''),
-                        date=date_obj,
-                        party_name=party_name,
-                        narration=transaction_data.get('narration', ''),
-                        amount=amount,
-                        register_type=register_type,
-                        client=client
-                    )
-                except Exception as ex:
-                    logger.error(f'Transaction {idx}: Error creating TallyTransaction: {ex}')
-                    errors.append(f'Transaction {idx}: Error creating TallyTransaction: {ex}')
-                    continue
-                # Save all ledger entries for this transaction
-                for le_idx, le in enumerate(transaction_data.get('ledger_entries', [])):
-                    le_amount = le.get('amount', 0.0)
-                    try:
-                        le_amount = float(le_amount)
-                    except Exception as ex:
-                        logger.warning(f'Transaction {idx} LedgerEntry {le_idx}: Invalid amount {le_amount}, using 0. Error: {ex}')
-                        le_amount = 0.0
-                    try:
-                        LedgerEntry.objects.create(
-                            transaction=txn,
-                            ledger_name=le.get('ledger_name', ''),
-                            amount=le_amount,
-                            is_debit=le.get('is_debit', False),
-                            is_credit=le.get('is_credit', False),
-                            raw_data=le.get('all_fields', le.get('raw_data', {}))
-                        )
-                    except Exception as ex:
-                        logger.error(f'Transaction {idx} LedgerEntry {le_idx}: Error creating LedgerEntry: {ex}')
-                        errors.append(f'Transaction {idx} LedgerEntry {le_idx}: Error creating LedgerEntry: {ex}')
-                transactions_created += 1
+        def party_of(transaction_data):
+            return (transaction_data.get('party_name') or '').strip() if isinstance(transaction_data, dict) else ''
+
+        clients, clients_created = resolve_clients(party_of(t) for t in data)
+        # Upsert so a re-sent sync updates vouchers in place instead of duplicating them
+        result = ingest_transactions(
+            data, mode='upsert', client_for_row=lambda transaction_data, idx: clients.get(party_of(transaction_data))
+        )
+        errors = [f"Transaction {e['idx']}: {e['reason']}" for e in result['errors']]
         response_data = {
             'message': 'Transactions processed successfully',
-            'transactions_created': transactions_created,
+            'transactions_created': result['created'],
+            'transactions_updated': result['updated'],
             'clients_created': clients_created,
             'errors': errors
         }
@@ -132,36 +62,85 @@ def receive_tally_transactions(request):
         logger.critical(f'Critical error processing transactions: {e}')
         return Response({'error': f'Error processing transactions: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+# Keyset pagination for transaction listings, ordered by (date, id)
+DEFAULT_TRANSACTIONS_PAGE_SIZE = 200
+MAX_TRANSACTIONS_PAGE_SIZE = 1000
+
+
+def encode_transaction_cursor(trans):
+    return base64.urlsafe_b64encode(f"{trans.date.isoformat()}|{trans.id}".encode()).decode()
+
+
+def decode_transaction_cursor(cursor):
+    """Return (date, id) from an opaque cursor; raises ValueError if it is malformed."""
+    try:
+        date_str, id_str = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.strptime(date_str, '%Y-%m-%d').date(), int(id_str)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_client_transactions(request, client_name=None):
     """
-    Get all transactions for a specific client
+    Get transactions for a specific client (or all clients), one page at a time.
+
+    Query params: page_size (default 200, max 1000) and cursor (the next_cursor of the
+    previous page). Per-client totals cover all of the client's matching transactions.
     """
     try:
+        default_size = getattr(settings, 'TRANSACTIONS_PAGE_SIZE', DEFAULT_TRANSACTIONS_PAGE_SIZE)
+        try:
+            page_size = int(request.query_params.get('page_size', default_size))
+        except (TypeError, ValueError):
+            return Response({'error': 'page_size must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+        page_size = max(1, min(page_size, MAX_TRANSACTIONS_PAGE_SIZE))
+
         if client_name:
             # Get transactions for specific client
             transactions = TallyTransaction.objects.filter(  # type: ignore
                 party_name__icontains=client_name
-            ).select_related('client')
+            )
         else:
             # Get all transactions grouped by client
-            transactions = TallyTransaction.objects.all().select_related('client')  # type: ignore
-        
+            transactions = TallyTransaction.objects.all()  # type: ignore
+
+        page_qs = transactions.order_by('date', 'id')
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                after_date, after_id = decode_transaction_cursor(cursor)
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            page_qs = page_qs.filter(
+                models.Q(date__gt=after_date) | models.Q(date=after_date, id__gt=after_id)
+            )
+        page = list(page_qs[:page_size + 1])
+        next_cursor = encode_transaction_cursor(page[page_size - 1]) if len(page) > page_size else None
+        page = page[:page_size]
+
+        # Totals for the clients on this page, aggregated in the database
+        totals = {
+            row['party_name']: row
+            for row in transactions.filter(party_name__in={t.party_name for t in page})
+            .order_by()
+            .values('party_name')
+            .annotate(total_transactions=models.Count('id'), total_amount=models.Sum('amount'))
+        }
+
         # Group by client
         client_data = {}
-        for trans in transactions:
+        for trans in page:
             client_name = trans.party_name
             if client_name not in client_data:
+                client_totals = totals.get(client_name, {})
                 client_data[client_name] = {
                     'client_name': client_name,
-                    'total_transactions': 0,
-                    'total_amount': 0.0,
+                    'total_transactions': client_totals.get('total_transactions', 0),
+                    'total_amount': float(client_totals.get('total_amount') or 0.0),
                     'transactions': []
                 }
-            
-            client_data[client_name]['total_transactions'] += 1
-            client_data[client_name]['total_amount'] += float(trans.amount)
             client_data[client_name]['transactions'].append({
                 'id': trans.id,
                 'voucher_no': trans.voucher_no,
@@ -173,7 +152,9 @@ def get_client_transactions(request, client_name=None):
             })
         
         return Response({
-            'clients': list(client_data.values())
+            'clients': list(client_data.values()),
+            'page_size': page_size,
+            'next_cursor': next_cursor
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -186,16 +167,27 @@ def get_client_transactions(request, client_name=None):
 @permission_classes([AllowAny])
 def get_clients_summary(request):
     """
-    Get summary of all clients with their transaction counts and amounts
+    Get summary of all clients with their transaction counts, amounts, balances and
+    receivable aging, read from the ClientBalance rows the analytics jobs maintain; nothing is
+    recomputed here. aging_as_of is the day the aging buckets were computed for.
     """
     try:
-        clients = Client.objects.annotate(  # type: ignore
-            transaction_count=models.Count('transactions'),
-            total_amount=models.Sum('transactions__amount')
-        ).values('name', 'transaction_count', 'total_amount')
+        clients = [
+            dict(
+                name=balance.client.name,
+                transaction_count=balance.transaction_count,
+                total_amount=balance.total_amount,
+                opening_balance=balance.opening_balance,
+                running_balance=balance.running_balance,
+                last_transaction_date=balance.last_transaction_date,
+                aging_as_of=balance.as_of,
+                **{field: getattr(balance, field) for field, _ in AGING_BUCKETS}
+            )
+            for balance in client_balances()
+        ]
         
         return Response({
-            'clients': list(clients)
+            'clients': clients
         }, status=status.HTTP_200_OK)
         
     except Exception as e:
@@ -214,24 +206,25 @@ def receive_opening_balances(request):
         data = request.data
         if not isinstance(data, list):
             return Response({'error': 'Data must be a list of opening balances'}, status=status.HTTP_400_BAD_REQUEST)
-        balances_created = 0
-        clients_created = 0
+        def client_name_of(bal):
+            return bal.get('client_name', '').strip() or bal.get('company_name', '').strip()
+
         with transaction.atomic():
-            for bal in data:
-                client_name = bal.get('client_name', '').strip() or bal.get('company_name', '').strip()
-                if not client_name:
-                    continue
-                client, created = Client.objects.get_or_create(name=client_name, defaults={'address': ''})
-                if created:
-                    clients_created += 1
-                LedgerOpeningBalance.objects.create(
-                    client=client,
+            clients, clients_created = resolve_clients(client_name_of(bal) for bal in data)
+            balances = [
+                LedgerOpeningBalance(
+                    client=clients[client_name_of(bal)],
                     ledger_name=bal.get('ledger_name', ''),
                     opening_balance=bal.get('opening_balance', 0.0),
                     group=bal.get('group', ''),
                     raw_balance=bal.get('raw_balance', '')
                 )
-                balances_created += 1
+                for bal in data if client_name_of(bal)
+            ]
+            LedgerOpeningBalance.objects.bulk_create(balances, batch_size=1000)
+            balances_created = len(balances)
+            for client_id in {bal.client_id for bal in balances}:
+                enqueue('client_balance', client_id, {'rebuild': True})
         return Response({
             'message': 'Opening balances processed successfully',
             'balances_created': balances_created,
@@ -244,7 +237,7 @@ class TokenHeaderAuthentication(authentication.TokenAuthentication):
     keyword = 'Bearer'
 
     def authenticate(self, request):
-        from .models import Token, User
+        from .models import Token, User, hash_token_key
         auth = authentication.get_authorization_header(request).split()
         if not auth or auth[0].lower() != b'bearer':
             return None
@@ -256,124 +249,114 @@ class TokenHeaderAuthentication(authentication.TokenAuthentication):
             token_key = auth[1].decode()
         except UnicodeError:
             return None
+        key_hash = hash_token_key(token_key)
+        cached = token_cache.get(key_hash)
+        if cached:
+            return cached
         try:
-            token_obj = Token.objects.select_related('user').get(key=token_key)
+            token_obj = Token.objects.select_related('user').get(key_hash=key_hash)
         except Token.DoesNotExist:
             return None
         if not token_obj.user.is_active:
             return None
+        token_cache.set(key_hash, token_obj.user, token_obj)
         return (token_obj.user, token_obj)
 
 logger = logging.getLogger("cfa.transactions")
 
 class TransactionUploadView(APIView):
+    """
+    Upload transactions for the authenticated user's client.
+
+    Large syncs arrive as numbered batches: the agent sends X-Upload-Id, X-Batch-Seq and
+    X-Batch-Total headers (optionally gzip-compressed). Each batch is applied in its own
+    transaction and acknowledged once; re-sending an acknowledged batch replays the stored
+    response instead of ingesting it again.
+    """
     authentication_classes = [TokenHeaderAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [GzipJSONParser]
 
     def post(self, request):
         user = request.user
         client = getattr(user, 'client', None)
         if not client:
             return Response({'error': 'User is not associated with a client.'}, status=400)
+        upload_id = request.headers.get('X-Upload-Id', '').strip()
+        seq = None
+        total = None
+        if upload_id:
+            try:
+                seq = int(request.headers.get('X-Batch-Seq', ''))
+                total = int(request.headers['X-Batch-Total']) if request.headers.get('X-Batch-Total') else None
+            except ValueError:
+                return Response({'error': 'X-Batch-Seq and X-Batch-Total must be integers.'}, status=400)
+            acked = UploadBatch.objects.filter(client=client, upload_id=upload_id, seq=seq).first()
+            if acked:
+                return Response(dict(acked.response, replayed=True), status=200)
         data = request.data
         tx_list = data if isinstance(data, list) else data.get('data', [])
         if not isinstance(tx_list, list):
             return Response({'error': 'Invalid data format.'}, status=400)
-        created = 0
-        skipped = 0
-        errors = []
+        # 'skip' keeps the first stored copy of a voucher, 'upsert' updates it in place
+        mode = request.query_params.get('mode') or (data.get('mode') if isinstance(data, dict) else None) or 'skip'
+        if mode not in INGEST_MODES:
+            return Response({'error': f'Invalid mode. Use one of: {", ".join(INGEST_MODES)}.'}, status=400)
         with db_transaction.atomic():
-            for idx, tx in enumerate(tx_list):
-                party_name = tx.get('party_name') or tx.get('client_name') or 'Unknown'
-                voucher_no = tx.get('voucher_no') or tx.get('voucher_number') or f'V{idx+1}'
-                voucher_type = (tx.get('voucher_type') or tx.get('register_type') or 'journal').lower()
-                date_str = tx.get('date', '')
-                narration = tx.get('narration', '')
-                amount = tx.get('amount', None)
-                ledger_entries = tx.get('ledger_entries') or tx.get('entries') or []
-                # Parse date
-                date_obj = None
-                try:
-                    if date_str and len(date_str) == 8 and date_str.isdigit():
-                        date_obj = datetime.strptime(date_str, '%Y%m%d').date()
-                    elif date_str and '/' in date_str:
-                        date_obj = datetime.strptime(date_str, '%d/%m/%Y').date()
-                    elif date_str:
-                        date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    else:
-                        date_obj = datetime.now().date()
-                except Exception as ex:
-                    logger.warning(f"Transaction {idx}: Invalid date format {date_str}, using today. Error: {ex}")
-                    date_obj = datetime.now().date()
-                # Map voucher_type to register_type
-                register_type_map = {
-                    'sales': 'sales',
-                    'purchase': 'purchase',
-                    'payment': 'payment',
-                    'receipt': 'receipt',
-                    'journal': 'journal',
-                    'credit note': 'credit_note',
-                    'debit note': 'debit_note',
-                }
-                register_type = register_type_map.get(voucher_type, 'journal')
-                # Handle amount: if blank, sum ledger entries
-                if amount in [None, '', ' ']:
-                    try:
-                        amount = sum(float(le.get('amount', 0.0) or 0.0) for le in ledger_entries)
-                    except Exception as ex:
-                        logger.error(f'Transaction {idx}: Error summing ledger entry amounts: {ex}')
-                        amount = 0.0
-                else:
-                    try:
-                        amount = float(amount)
-                    except Exception as ex:
-                        logger.error(f'Transaction {idx}: Invalid amount {amount}, using 0. Error: {ex}')
-                        amount = 0.0
-                # Check for duplicate transaction
-                duplicate = TallyTransaction.objects.filter(
-                    voucher_no=voucher_no,
-                    date=date_obj,
-                    party_name=party_name,
-                    register_type=register_type
-                ).first()
-                if duplicate:
-                    logger.info(f"Skipping duplicate transaction at idx {idx}: {voucher_no}, {date_obj}, {party_name}, {register_type}")
-                    skipped += 1
-                    errors.append({'idx': idx, 'reason': 'duplicate transaction'})
-                    continue
-                try:
-                    t = TallyTransaction.objects.create(
-                        client=client,
-                        voucher_no=voucher_no,
-                        date=date_obj,
-                        party_name=party_name,
-                        narration=narration,
-                        amount=amount,
-                        register_type=register_type,
-                    )
-                    for le_idx, le in enumerate(ledger_entries):
-                        le_amount = le.get('amount', 0.0)
-                        try:
-                            le_amount = float(le_amount)
-                        except Exception as ex:
-                            logger.warning(f'Transaction {idx} LedgerEntry {le_idx}: Invalid amount {le_amount}, using 0. Error: {ex}')
-                            le_amount = 0.0
-                        LedgerEntry.objects.create(
-                            transaction=t,
-                            ledger_name=le.get('ledger_name', f'Unknown_{le_idx+1}'),
-                            amount=le_amount,
-                            is_debit=le.get('is_debit', False),
-                            is_credit=le.get('is_credit', False),
-                            raw_data=le.get('all_fields', le.get('raw_data', {}))
-                        )
-                    created += 1
-                except Exception as e:
-                    logger.error(f"Error saving transaction at idx {idx}: {e}")
-                    skipped += 1
-                    errors.append({'idx': idx, 'reason': str(e)})
-        return Response({
-            'message': 'Transactions processed successfully',
-            'transactions_created': created,
-            'transactions_skipped': skipped,
-            'errors': errors[:10]  # Only show first 10 errors for brevity
-        }, status=201)
+            result = ingest_transactions(tx_list, client, mode=mode)
+            response_data = {
+                'message': 'Transactions processed successfully',
+                'transactions_created': result['created'],
+                'transactions_updated': result['updated'],
+                'transactions_skipped': result['skipped'],
+                'errors': result['errors'][:10]  # Only show first 10 errors for brevity
+            }
+            if upload_id:
+                response_data.update({'upload_id': upload_id, 'seq': seq, 'total': total})
+                UploadBatch.objects.create(
+                    client=client, upload_id=upload_id, seq=seq, total=total, response=response_data
+                )
+        return Response(response_data, status=201)
+
+
+class UploadStatusView(APIView):
+    """Report which batches of a chunked upload have been acknowledged, so the agent can resume."""
+    authentication_classes = [TokenHeaderAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, upload_id):
+        client = getattr(request.user, 'client', None)
+        if not client:
+            return Response({'error': 'User is not associated with a client.'}, status=400)
+        batches = UploadBatch.objects.filter(client=client, upload_id=upload_id).order_by('seq')
+        acked = list(batches.values_list('seq', flat=True))
+        total = batches.exclude(total=None).values_list('total', flat=True).first()
+        return Response({'upload_id': upload_id, 'acked': acked, 'total': total}, status=200)
+
+
+class CashflowForecastView(APIView):
+    """
+    Projected cash position of the authenticated user's client.
+
+    Query params: horizons (comma-separated days, default 30,60,90) and balance (today's
+    cash position; defaults to the net of the recorded receipts and payments).
+    """
+    authentication_classes = [TokenHeaderAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        client = getattr(request.user, 'client', None)
+        if not client:
+            return Response({'error': 'User is not associated with a client.'}, status=400)
+        if not FORECASTING_AVAILABLE:
+            return Response({'error': 'Forecasting is not available on this server.'}, status=501)
+        try:
+            horizons = [int(h) for h in request.query_params.get('horizons', '').split(',') if h.strip()]
+            balance = request.query_params.get('balance')
+            balance = float(balance) if balance not in (None, '') else None
+        except ValueError:
+            return Response({'error': 'horizons must be integers and balance a number.'}, status=400)
+        horizons = horizons or list(DEFAULT_HORIZONS)
+        if any(h <= 0 or h > MAX_HORIZON_DAYS for h in horizons):
+            return Response({'error': f'horizons must be between 1 and {MAX_HORIZON_DAYS} days.'}, status=400)
+        return Response(forecast_cashflow(client.pk, horizons=horizons, opening_balance=balance), status=200)
@@ -123,3 +123,33 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Custom user model
 AUTH_USER_MODEL = 'accounts.User'
+
+# Rows per bulk_create batch when ingesting Tally transactions
+TALLY_INGEST_BATCH_SIZE = 1000
+
+# Default page size for the transaction listing endpoint (max 1000)
+TRANSACTIONS_PAGE_SIZE = 200
+
+# Largest request body accepted after gzip decompression
+MAX_DECOMPRESSED_UPLOAD_BYTES = 256 * 1024 * 1024
+
+# Run queued analytics jobs (balances, cashflow rollup, payment scores) on a background thread
+# of the web process. Set to False when a separate `manage.py run_analytics_jobs` worker runs.
+ANALYTICS_INLINE_WORKER = True
+
+# API token authentication cache (accounts.token_cache): seconds an entry lives, and max entries
+TOKEN_CACHE_TTL = 60
+TOKEN_CACHE_SIZE = 10000
+
+# JSON in and out through accounts.json_codec (orjson/msgspec when installed, stdlib otherwise)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'accounts.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'accounts.parsers.GzipJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+}